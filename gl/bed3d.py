@@ -5,45 +5,39 @@ import numpy as np
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
+from OpenGL.arrays import vbo
+
+from gl.mesh3d import get_mesh
+from gl.profiler import count_draw
 
 
 class _Axes():
 
     origin = (0.0, 0.0, 0.0)
+    slices = 32
 
     def __init__(self, build_dimensions):
-        self._build_dimensions = build_dimensions
-        dist = 0.5 * (build_dimensions[1] + max(build_dimensions[0], build_dimensions[2]))
-        self._arrow_base_radius = dist / 75.0
-        self._arrow_length = 2.5 * self._arrow_base_radius
-        self._quadric = gluNewQuadric()
-        gluQuadricDrawStyle(self._quadric, GLU_FILL)
+        self._lines = None
+        self.build_dimensions = build_dimensions
 
     def render(self):
         """Render colored axes and arrows."""
-        if self._quadric is None:
-            return
-
         x = self._build_dimensions[0] - self._build_dimensions[3], self._build_dimensions[3]
         y = self._build_dimensions[1] - self._build_dimensions[4], self._build_dimensions[4]
         z = self._build_dimensions[2] - self._build_dimensions[5], self._build_dimensions[5]
 
-        verts = np.array([
-            x[0], 0, 0, -x[1], 0, 0,
-            0, y[0], 0, 0, -y[1], 0,
-            0, 0, z[0], 0, 0, -z[1]])
-        colors = np.array([
-            1.0, 0.0, 0.0, 1.0, 0.0, 0.0,
-            0.0, 1.0, 0.0, 0.0, 1.0, 0.0,
-            0.0, 0.0, 1.0, 0.0, 0.0, 1.0])
+        if self._lines is None:
+            verts = np.array([
+                x[0], 0, 0, -x[1], 0, 0,
+                0, y[0], 0, 0, -y[1], 0,
+                0, 0, z[0], 0, 0, -z[1]], dtype=np.float32)
+            colors = np.array([
+                1.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                0.0, 1.0, 0.0, 0.0, 1.0, 0.0,
+                0.0, 0.0, 1.0, 0.0, 0.0, 1.0], dtype=np.float32)
+            self._lines = (vbo.VBO(verts), vbo.VBO(colors))
 
-        glEnableClientState(GL_VERTEX_ARRAY)
-        glEnableClientState(GL_COLOR_ARRAY)
-        glVertexPointer(3, GL_FLOAT, 0, verts)
-        glColorPointer(3, GL_FLOAT, 0, colors)
-        glDrawArrays(GL_LINES, 0, 6)
-        glDisableClientState(GL_VERTEX_ARRAY)
-        glDisableClientState(GL_COLOR_ARRAY)
+        _render_lines(*self._lines, 6)
 
         # x axis
         glColor3f(1.0, 0.0, 0.0)
@@ -70,18 +64,51 @@ class _Axes():
 
         # origin sphere
         glColor3f(0.0, 0.0, 0.0)
-        gluSphere(self._quadric, self._arrow_base_radius, 32, 32)
+        get_mesh('Sphere', [self._arrow_base_radius], self.slices).render()
 
     def _render_arrow(self, length):
         glTranslated(0.0, 0.0, length)
-        gluQuadricOrientation(self._quadric, GLU_OUTSIDE)
-        gluCylinder(self._quadric, self._arrow_base_radius, 0.0, self._arrow_length, 32, 1)
-        gluQuadricOrientation(self._quadric, GLU_INSIDE)
-        gluDisk(self._quadric, 0.0, self._arrow_base_radius, 32, 1)
+        get_mesh('Arrow', [self._arrow_base_radius, self._arrow_length], self.slices).render()
+
+    @property
+    def build_dimensions(self):
+        return self._build_dimensions
+
+    @build_dimensions.setter
+    def build_dimensions(self, value):
+        self._build_dimensions = value
+        dist = 0.5 * (value[1] + max(value[0], value[2]))
+        self._arrow_base_radius = dist / 75.0
+        self._arrow_length = 2.5 * self._arrow_base_radius
+        _delete_buffers(self._lines)
+        self._lines = None
 
-    def __delete__(self, _):
-        if not self._quadric:
-            gluDeleteQuadric(self._quadric)
+    def delete(self):
+        _delete_buffers(self._lines)
+        self._lines = None
+
+
+def _render_lines(vertices, colors, count):
+    """Draw count vertices as GL_LINES from vertex and color VBOs."""
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_COLOR_ARRAY)
+    vertices.bind()
+    glVertexPointer(3, GL_FLOAT, 0, vertices)
+    colors.bind()
+    glColorPointer(3, GL_FLOAT, 0, colors)
+    glDrawArrays(GL_LINES, 0, count)
+    count_draw(count)
+    colors.unbind()
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glDisableClientState(GL_COLOR_ARRAY)
+
+
+def _delete_buffers(buffers):
+    if buffers is None:
+        return
+    for buffer in buffers:
+        if isinstance(buffer, vbo.VBO):
+            buffer.delete()
 
 
 class Bed3D():
@@ -106,16 +133,40 @@ class Bed3D():
         self._bounding_box = None
 
     def init(self):
-        """Initialize vertices."""
+        """Initialize vertices and upload them into static VBOs."""
         if self._initialized:
             return True
 
+        _delete_buffers(self._gridlines)
+        _delete_buffers(self._bounding_box)
+
         self.create_bounding_box()
         self.create_gridlines()
 
+        vertices, colors = self._gridlines
+        self._gridlines = (
+            vbo.VBO(vertices.astype(np.float32)),
+            vbo.VBO(colors.astype(np.float32)),
+            vertices.size // 3)
+
+        vertices, indices = self._bounding_box
+        self._bounding_box = (
+            vbo.VBO(vertices.astype(np.float32)),
+            vbo.VBO(indices.astype(np.uint32), target=GL_ELEMENT_ARRAY_BUFFER),
+            indices.size)
+
         self._initialized = True
         return True
 
+    def delete(self):
+        """Free GPU buffers. Call with the context current."""
+        _delete_buffers(self._gridlines)
+        _delete_buffers(self._bounding_box)
+        self._gridlines = None
+        self._bounding_box = None
+        self._axes.delete()
+        self._initialized = False
+
     def render(self):
         """Render bed."""
         if not self.init():
@@ -209,24 +260,22 @@ class Bed3D():
         if self._gridlines is None:
             return
 
-        vertices, colors = self._gridlines
-        glEnableClientState(GL_VERTEX_ARRAY)
-        glEnableClientState(GL_COLOR_ARRAY)
-        glVertexPointer(3, GL_FLOAT, 0, vertices)
-        glColorPointer(3, GL_FLOAT, 0, colors)
-        glDrawArrays(GL_LINES, 0, vertices.size // 3)
-        glDisableClientState(GL_VERTEX_ARRAY)
-        glDisableClientState(GL_COLOR_ARRAY)
+        _render_lines(*self._gridlines)
 
     def _render_bounding_box(self):
         if self._bounding_box is None:
             return
 
-        vertices, indices = self._bounding_box
+        vertices, indices, count = self._bounding_box
         glColor3f(self.color_dark, self.color_dark, self.color_dark)
         glEnableClientState(GL_VERTEX_ARRAY)
+        vertices.bind()
         glVertexPointer(3, GL_FLOAT, 0, vertices)
-        glDrawElements(GL_LINES, indices.size, GL_UNSIGNED_INT, indices)
+        indices.bind()
+        glDrawElements(GL_LINES, count, GL_UNSIGNED_INT, indices)
+        count_draw(count)
+        indices.unbind()
+        vertices.unbind()
         glDisableClientState(GL_VERTEX_ARRAY)
 
     def _render_axes(self):
@@ -241,6 +290,9 @@ class Bed3D():
 
     @show_axes.setter
     def show_axes(self, value):
+        # gridlines include the x and z axes lines when the axes are hidden
+        if value != self._show_axes:
+            self._initialized = False
         self._show_axes = value
 
     @property
@@ -258,4 +310,5 @@ class Bed3D():
     @build_dimensions.setter
     def build_dimensions(self, value):
         self._build_dimensions = value
+        self._axes.build_dimensions = value
         self._initialized = False
@@ -5,29 +5,200 @@ import math
 import numpy as np
 from enums import CamAxis, CamMode
 
-import wx
 from OpenGL.GL import *
 from OpenGL.GLU import *
+from OpenGL.arrays import vbo
+
+from gl.glhelper import compile_program, has_instancing
+from gl.picking import encode_ids
+from gl.profiler import count_draw
+
+# per camera pose record, laid out to be read directly as instance attributes
+CAMERA3D_DTYPE = np.dtype([
+    ('x', np.float32), ('y', np.float32), ('z', np.float32),
+    ('b', np.float32), ('c', np.float32), ('scale', np.float32),
+    ('color', np.uint8, 4)])
+
+_VERTEX_SHADER = """
+#version 120
+attribute vec4 vertex;          // xyz, shade
+attribute vec3 position;        // per instance x, y, z
+attribute vec3 rotation_scale;  // per instance b, c, scale
+attribute vec4 color;           // per instance rgba, or encoded id
+uniform bool pick;              // draw ids without shading
+varying vec4 frag_color;
+
+void main() {
+    float b = radians(rotation_scale.x);
+    float c = radians(rotation_scale.y);
+    vec3 v = vertex.xyz * rotation_scale.z;
+    v = vec3(v.x * cos(c) + v.z * sin(c), v.y, v.z * cos(c) - v.x * sin(c));
+    v = vec3(v.x * cos(b) - v.y * sin(b), v.x * sin(b) + v.y * cos(b), v.z);
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(v + position, 1.0);
+    if (pick) {
+        frag_color = color;
+    } else {
+        frag_color = vec4(clamp(color.rgb + vertex.w / 255.0, 0.0, 1.0), 1.0);
+    }
+}
+"""
+
+_FRAGMENT_SHADER = """
+#version 120
+varying vec4 frag_color;
+
+void main() {
+    gl_FragColor = frag_color;
+}
+"""
+
+
+def _compute_camera_mesh(slices=16):
+    """Compute triangle vertices and color shades of a unit scale camera.
+    The body is a box, the lens a cylinder along -x capped with a disk.
+    """
+    # box faces as quads, same winding as the former immediate mode calls
+    x0, x1, y0, y1, z0, z1 = -0.025, 0.025, -0.05, 0.05, -0.05, 0.05
+    quads = np.array([
+        [[x0, y0, z0], [x1, y0, z0], [x1, y0, z1], [x0, y0, z1]], # bottom
+        [[x0, y1, z0], [x1, y1, z0], [x1, y0, z0], [x0, y0, z0]], # right
+        [[x0, y1, z1], [x1, y1, z1], [x1, y1, z0], [x0, y1, z0]], # top
+        [[x0, y0, z1], [x1, y0, z1], [x1, y1, z1], [x0, y1, z1]], # left
+        [[x1, y1, z0], [x1, y1, z1], [x1, y0, z1], [x1, y0, z0]], # back
+        [[x0, y0, z0], [x0, y0, z1], [x0, y1, z1], [x0, y1, z0]]]) # front
+    box = quads[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+
+    # lens and cap in lens space, where the lens extends along +z
+    radius, length = 0.025, 0.03
+    theta = np.linspace(0.0, 2.0 * np.pi, slices + 1)
+    ring = np.stack([radius * np.cos(theta), radius * np.sin(theta), np.zeros(slices + 1)], axis=1)
+    bottom, top = ring, ring + [0.0, 0.0, length]
+    lens = np.stack([bottom[:-1], bottom[1:], top[1:], bottom[:-1], top[1:], top[:-1]], axis=1).reshape(-1, 3)
+    cap = np.stack([np.zeros((slices, 3)), ring[1:], ring[:-1]], axis=1).reshape(-1, 3)
+
+    # rotate 90 degrees about y and move to the front of the box
+    def to_camera_space(v):
+        return np.stack([v[:, 2] - 0.05, v[:, 1], -v[:, 0]], axis=1)
+
+    vertices = np.concatenate([box, to_camera_space(lens), to_camera_space(cap)])
+    shades = np.concatenate([
+        np.zeros(len(box)),
+        np.full(len(lens), -15.0),
+        np.full(len(cap), -25.0)])
+    return vertices.astype(np.float32), shades.astype(np.float32)
+
+
+def _pose_matrices(poses):
+    """Return (n, 3, 3) scaled rotation matrices for an array of pose records.
+    Equivalent to glRotatef(b, 0, 0, 1), glRotatef(c, 0, 1, 0), glScalef(scale).
+    """
+    b = np.deg2rad(poses['b'])
+    c = np.deg2rad(poses['c'])
+    cb, sb, cc, sc = np.cos(b), np.sin(b), np.cos(c), np.sin(c)
+    mats = np.empty((len(poses), 3, 3), dtype=np.float32)
+    mats[:, 0, 0], mats[:, 0, 1], mats[:, 0, 2] = cb * cc, -sb, cb * sc
+    mats[:, 1, 0], mats[:, 1, 1], mats[:, 1, 2] = sb * cc, cb, sb * sc
+    mats[:, 2, 0], mats[:, 2, 1], mats[:, 2, 2] = -sc, 0.0, cc
+    return mats * poses['scale'][:, None, None]
+
+
+class Camera3DArray():
+    """Contiguous pose storage for a fleet of Camera3D.
+
+    Each Camera3D reads and writes its pose through a row of this array, so the
+    whole fleet can be uploaded or updated with vectorized slices.
+    """
+
+    def __init__(self, capacity=64):
+        self._data = np.zeros(max(1, capacity), dtype=CAMERA3D_DTYPE)
+        self._cameras = []
+        self._dirty = True
+        # called whenever a pose changes, e.g. to schedule a redraw
+        self.on_dirty = None
+        # called with the rows whose x, y or z changed, e.g. to update a spatial index
+        self.on_move = None
+
+    def __len__(self):
+        return len(self._cameras)
+
+    def add(self, camera, pose=None):
+        """Move camera pose into the array and bind the camera to it."""
+        n = len(self._cameras)
+        if n == len(self._data):
+            data = np.zeros(2 * n, dtype=CAMERA3D_DTYPE)
+            data[:n] = self._data
+            self._data = data
+        self._data[n] = camera.pose if pose is None else pose
+        self._cameras.append(camera)
+        camera.bind(self, n)
+        self.dirty = True
+
+    def remove(self, camera):
+        """Remove camera, moving the last pose into its slot."""
+        index = camera.index
+        last = self._cameras.pop()
+        camera.detach()
+        if last is not camera:
+            self._data[index] = self._data[len(self._cameras)]
+            self._cameras[index] = last
+            last.bind(self, index)
+        self.dirty = True
+
+    def clear(self):
+        for camera in self._cameras:
+            camera.detach()
+        self._cameras = []
+        self.dirty = True
+
+    def set_poses(self, poses, indices=slice(None)):
+        """Write (n, 5) x, y, z, b, c poses into the given rows."""
+        poses = np.asarray(poses, dtype=np.float32)
+        data = self.data
+        for i, field in enumerate(('x', 'y', 'z', 'b', 'c')):
+            data[field][indices] = poses[:, i]
+        self.dirty = True
+        if self.on_move is not None:
+            self.on_move(indices)
+
+    def record(self, index):
+        """Return writable view of a single pose record."""
+        return self._data[index]
+
+    @property
+    def data(self):
+        return self._data[:len(self._cameras)]
+
+    @property
+    def cameras(self):
+        return self._cameras
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    @dirty.setter
+    def dirty(self, value):
+        self._dirty = value
+        if value and self.on_dirty is not None:
+            self.on_dirty()
 
 
 class Camera3D():
-    def __init__(self, camid, x, y, z, b, c):
-        self._dirty = False  # dirty flag to track when we need to re-render the camera
-        self.is_selected = False
+    color = (125, 125, 125)
+    selected_color = (75, 230, 150)
 
+    def __init__(self, camid, x, y, z, b, c, scale=1):
+        self._is_selected = False
         self._camid = camid
-        self._x = float(x)
-        self._y = float(y)
-        self._z = float(z)
-        self._b = float(b)
-        self._c = float(c)
-        self._scale = 1
-
-        self.start = (self._x, self._y, self._z, self._b, self._c)
-        self.mode = CamMode.NORMAL
 
-        self._angle = 0
-        self._rotation_vector = []
+        # pose lives in a Camera3DArray, a private one until added to a canvas
+        self._array = None
+        self._index = 0
+        Camera3DArray(1).add(self, np.array(
+            (x, y, z, b, c, scale, (*self._base_color(), 255)), dtype=CAMERA3D_DTYPE))
+
+        self.start = (self.x, self.y, self.z, self.b, self.c)
+        self.mode = CamMode.NORMAL
 
         self.trans = False
         self.n_increment = 0
@@ -35,98 +206,92 @@ class Camera3D():
         self.increment_y = 0
         self.increment_z = 0
 
-    def render(self):
-        """Render camera."""
-        # Set color based on selection
-        if self.is_selected:
-            color = (75, 230, 150)
-        else:
-            hue = 125 - self._camid
-            color = [hue, hue, hue]
+    def bind(self, array, index):
+        """Bind camera to a row of a Camera3DArray."""
+        self._array = array
+        self._index = index
 
-        scale = self._scale
+    def detach(self):
+        """Move pose into a private array."""
+        Camera3DArray(1).add(self)
 
-        glPushMatrix()
-        glTranslatef(self._x, self._y, self._z)
-        if self.mode == CamMode.NORMAL:
-            if self._b != 0.0:
-                glRotatef(self._b, 0, 0, 1)
-            if self._c != 0.0:
-                glRotatef(self._c, 0, 1, 0)
-        elif self.mode == CamMode.ROTATE:
-            glRotatef(self._angle, *self._rotation_vector)
+    def _base_color(self):
+        return self.selected_color if self._is_selected else self.color
 
-        if self.trans:
-            self.translate()
-            self._dirty = True
-
-        glBegin(GL_QUADS)
-
-        # bottom
-        glColor3ub(*color)
-        glVertex3f(-0.025 * scale, -0.05 * scale, -0.05 * scale)
-        glVertex3f( 0.025 * scale, -0.05 * scale, -0.05 * scale)
-        glVertex3f( 0.025 * scale, -0.05 * scale,  0.05 * scale)
-        glVertex3f(-0.025 * scale, -0.05 * scale,  0.05 * scale)
-
-        # right
-        glVertex3f(-0.025 * scale,  0.05 * scale, -0.05 * scale)
-        glVertex3f( 0.025 * scale,  0.05 * scale, -0.05 * scale)
-        glVertex3f( 0.025 * scale, -0.05 * scale, -0.05 * scale)
-        glVertex3f(-0.025 * scale, -0.05 * scale, -0.05 * scale)
-
-        # top
-        glVertex3f(-0.025 * scale,  0.05 * scale,  0.05 * scale)
-        glVertex3f( 0.025 * scale,  0.05 * scale,  0.05 * scale)
-        glVertex3f( 0.025 * scale,  0.05 * scale, -0.05 * scale)
-        glVertex3f(-0.025 * scale,  0.05 * scale, -0.05 * scale)
-
-        # left
-        glVertex3f(-0.025 * scale, -0.05 * scale,  0.05 * scale)
-        glVertex3f( 0.025 * scale, -0.05 * scale,  0.05 * scale)
-        glVertex3f( 0.025 * scale,  0.05 * scale,  0.05 * scale)
-        glVertex3f(-0.025 * scale,  0.05 * scale,  0.05 * scale)
-
-        # back
-        glVertex3f( 0.025 * scale,  0.05 * scale, -0.05 * scale)
-        glVertex3f( 0.025 * scale,  0.05 * scale,  0.05 * scale)
-        glVertex3f( 0.025 * scale, -0.05 * scale,  0.05 * scale)
-        glVertex3f( 0.025 * scale, -0.05 * scale, -0.05 * scale)
-
-        # front
-        glVertex3f(-0.025 * scale, -0.05 * scale, -0.05 * scale)
-        glVertex3f(-0.025 * scale, -0.05 * scale,  0.05 * scale)
-        glVertex3f(-0.025 * scale,  0.05 * scale,  0.05 * scale)
-        glVertex3f(-0.025 * scale,  0.05 * scale, -0.05 * scale)
-        glEnd()
-
-        glPushMatrix()
-
-        # lens
-        glColor3ub(*[x - 15 for x in color])
-        glTranslated(-0.05 * scale, 0.0, 0.0)
-        quadric = gluNewQuadric()
-        glRotatef(90.0, 0.0, 1.0, 0.0)
-        gluCylinder(quadric, 0.025 * scale, 0.025 * scale, 0.03 * scale, 16, 16)
-        gluDeleteQuadric(quadric)
-
-        # cap
-        glColor3ub(*[x - 25 for x in color])
-        circleQuad = gluNewQuadric()
-        gluQuadricOrientation(circleQuad, GLU_INSIDE)
-        gluDisk(circleQuad, 0.0, 0.025 * scale, 16, 1)
-        gluDeleteQuadric(circleQuad)
-
-        glPopMatrix()
-        glPopMatrix()
+    def _set(self, field, value):
+        self._array.record(self._index)[field] = value
+        self._array.dirty = True
+        if field in ('x', 'y', 'z') and self._array.on_move is not None:
+            self._array.on_move([self._index])
+
+    @property
+    def pose(self):
+        return self._array.record(self._index)
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def x(self):
+        return float(self.pose['x'])
+
+    @x.setter
+    def x(self, value):
+        self._set('x', value)
+
+    @property
+    def y(self):
+        return float(self.pose['y'])
+
+    @y.setter
+    def y(self, value):
+        self._set('y', value)
+
+    @property
+    def z(self):
+        return float(self.pose['z'])
+
+    @z.setter
+    def z(self, value):
+        self._set('z', value)
+
+    @property
+    def b(self):
+        return float(self.pose['b'])
+
+    @b.setter
+    def b(self, value):
+        self._set('b', value)
+
+    @property
+    def c(self):
+        return float(self.pose['c'])
+
+    @c.setter
+    def c(self, value):
+        self._set('c', value)
+
+    @property
+    def position(self):
+        return (self.x, self.y, self.z)
+
+    @property
+    def is_selected(self):
+        return self._is_selected
+
+    @is_selected.setter
+    def is_selected(self, value):
+        self._is_selected = value
+        self._set('color', (*self._base_color(), 255))
 
     @property
     def scale(self):
-        return self._scale
+        return float(self.pose['scale'])
 
     @scale.setter
     def scale(self, value):
-        self._scale = value
+        self._set('scale', value)
 
     @property
     def camid(self):
@@ -138,11 +303,11 @@ class Camera3D():
 
     @property
     def dirty(self):
-        return self._dirty
+        return self._array.dirty
 
     @dirty.setter
     def dirty(self, value):
-        self._dirty = value
+        self._array.dirty = value
 
     def get_rotation_angle(self, v1, v2):
         v1_u = self.get_unit_vector(v1)
@@ -153,17 +318,14 @@ class Camera3D():
         return vector / np.linalg.norm(vector)
 
     def on_focus_center(self):
-        self.mode = CamMode.ROTATE
-        camera_center = (self._x, self._y, self._z)
-        current_facing = (self._x - 0.5, self._y, self._z)
-        target_facing = (0.0, 0.0, 0.0)
-
-        v1 = np.subtract(current_facing, camera_center)
-        v2 = np.subtract(target_facing, camera_center)
+        """Pan and tilt the camera, which faces -x at rest, toward the origin."""
+        target_facing = np.subtract((0.0, 0.0, 0.0), self.position)
+        if not target_facing.any():
+            return
 
-        self._angle = self.get_rotation_angle(v1, v2)
-        self._rotation_vector = np.cross(self.get_unit_vector(v1), self.get_unit_vector(v2))
-        self.render()
+        dx, dy, dz = self.get_unit_vector(target_facing)
+        self.b = math.degrees(math.atan2(-dy, -dx))
+        self.c = math.degrees(math.asin(dz))
 
     def get_z_by_angle(self, angle):
         return np.sqrt(np.square(0.5 / angle) - 0.25)
@@ -171,24 +333,24 @@ class Camera3D():
     def on_move(self, axis, amount):
         if axis in CamAxis and amount != 0:
             if axis == CamAxis.X:
-                self._x += amount
+                self.x += amount
             elif axis == CamAxis.Y:
-                self._y += amount
+                self.y += amount
             elif axis == CamAxis.Z:
-                self._z += amount
+                self.z += amount
             elif axis == CamAxis.B:
-                self._b += amount
+                self.b += amount
             elif axis == CamAxis.C:
-                self._c += amount
+                self.c += amount
 
     def translate(self, newx=0, newy=0, newz=0):
         # initialize nIncre and increxyz, skip if already initialized
         if self.trans:
             return
 
-        dx = round(newx - self._x, 2)
-        dy = round(newy - self._y, 2)
-        dz = round(newz - self._z, 2)
+        dx = round(newx - self.x, 2)
+        dy = round(newy - self.y, 2)
+        dz = round(newz - self.z, 2)
 
         maxd = max(dx, dy, dz)
         scale = maxd / 0.01
@@ -198,19 +360,162 @@ class Camera3D():
         self.increy = dy / scale
         self.increz = dz / scale
 
-        # setting trans to true allows this function to be called on cam.render
+        # setting trans to true marks the camera as translating
         self.trans = True
 
         if self.n_increment > 0:
-            self._x += self.increment_x
-            self._y += self.increment_y
-            self._z += self.increment_z
+            self.x += self.increment_x
+            self.y += self.increment_y
+            self.z += self.increment_z
 
             self.n_increment -= 1
         else:
-            self._x = round(self._x, 2)
-            self._y = round(self._y, 2)
-            self._z = round(self._z, 2)
+            self.x = round(self.x, 2)
+            self.y = round(self.y, 2)
+            self.z = round(self.z, 2)
             self.trans = False
 
-        self._dirty = True
+        self.dirty = True
+
+
+class Camera3DBatch():
+    """Retained camera mesh, transformed per camera and drawn in one call.
+
+    The unit camera mesh is built once. If the context supports instancing,
+    the Camera3DArray is uploaded as per-instance attributes and the whole fleet
+    is drawn with one glDrawArraysInstanced. Otherwise, the mesh is transformed
+    by every pose in a single vectorized pass and drawn with one glDrawArrays.
+    render_ids draws the same geometry with each camera's index encoded as its
+    color, for use with a PickingBuffer.
+    """
+
+    def __init__(self, slices=16):
+        self._mesh, self._shades = _compute_camera_mesh(slices)
+        self._program = None
+        self._attribs = None
+        self._pick_uniform = None
+        self._mesh_vbo = None
+        self._vertices = None
+        self._colors = None
+        self._id_colors = None
+        self._instances = 0
+        self._count = 0
+
+    def init(self):
+        """Compile instancing shader and upload mesh, if supported."""
+        if self._program is not None or not has_instancing():
+            return
+
+        self._program = compile_program(_VERTEX_SHADER, _FRAGMENT_SHADER)
+        if self._program is None:
+            return
+
+        self._attribs = {name: glGetAttribLocation(self._program, name)
+                         for name in ('vertex', 'position', 'rotation_scale', 'color')}
+        self._pick_uniform = glGetUniformLocation(self._program, 'pick')
+        self._mesh_vbo = vbo.VBO(np.ascontiguousarray(
+            np.column_stack([self._mesh, self._shades]), dtype=np.float32))
+
+    def update(self, poses):
+        """Rebuild buffers from an array of pose records."""
+        self._instances = len(poses)
+        if self._instances == 0:
+            return
+
+        if self._program is not None:
+            self._set_buffer('_vertices', np.ascontiguousarray(poses))
+            self._set_buffer('_id_colors', encode_ids(self._instances))
+            return
+
+        vertices = np.einsum('nij,mj->nmi', _pose_matrices(poses), self._mesh)
+        vertices += np.column_stack([poses['x'], poses['y'], poses['z']])[:, None, :]
+        colors = poses['color'][:, None, :3] + self._shades[None, :, None]
+
+        self._set_buffer('_vertices', np.ascontiguousarray(vertices.reshape(-1, 3), dtype=np.float32))
+        self._set_buffer('_colors', np.ascontiguousarray(np.clip(colors, 0, 255).reshape(-1, 3), dtype=np.uint8))
+        self._set_buffer('_id_colors', np.repeat(encode_ids(self._instances), len(self._mesh), axis=0))
+        self._count = len(vertices) * len(self._mesh)
+
+    def _set_buffer(self, name, data):
+        buffer = getattr(self, name)
+        if buffer is None:
+            setattr(self, name, vbo.VBO(data))
+        else:
+            buffer.set_array(data)
+
+    def render(self):
+        """Render all cameras."""
+        self._render(False)
+
+    def render_ids(self):
+        """Render all cameras with their index encoded as color."""
+        self._render(True)
+
+    def _render(self, ids):
+        if self._instances == 0:
+            return
+
+        if self._program is not None:
+            self._render_instanced(ids)
+            return
+
+        colors = self._id_colors if ids else self._colors
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        self._vertices.bind()
+        glVertexPointer(3, GL_FLOAT, 0, self._vertices)
+        colors.bind()
+        glColorPointer(4 if ids else 3, GL_UNSIGNED_BYTE, 0, colors)
+        glDrawArrays(GL_TRIANGLES, 0, self._count)
+        count_draw(self._count)
+        colors.unbind()
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+
+    def _render_instanced(self, ids):
+        stride = CAMERA3D_DTYPE.itemsize
+        fields = CAMERA3D_DTYPE.fields
+        vertex, position, rotation_scale, color = (
+            self._attribs[name] for name in ('vertex', 'position', 'rotation_scale', 'color'))
+
+        glUseProgram(self._program)
+        glUniform1i(self._pick_uniform, int(ids))
+
+        self._mesh_vbo.bind()
+        glEnableVertexAttribArray(vertex)
+        glVertexAttribPointer(vertex, 4, GL_FLOAT, GL_FALSE, 0, self._mesh_vbo)
+
+        self._vertices.bind()
+        for loc, size, dtype, normalized, field in (
+                (position, 3, GL_FLOAT, GL_FALSE, 'x'),
+                (rotation_scale, 3, GL_FLOAT, GL_FALSE, 'b'),
+                (color, 4, GL_UNSIGNED_BYTE, GL_TRUE, 'color')):
+            glEnableVertexAttribArray(loc)
+            if ids and field == 'color':
+                self._id_colors.bind()
+                glVertexAttribPointer(loc, size, dtype, normalized, 0, self._id_colors)
+            else:
+                glVertexAttribPointer(loc, size, dtype, normalized, stride, self._vertices + fields[field][1])
+            glVertexAttribDivisor(loc, 1)
+
+        glDrawArraysInstanced(GL_TRIANGLES, 0, len(self._mesh), self._instances)
+        count_draw(len(self._mesh), self._instances)
+
+        for loc in (position, rotation_scale, color):
+            glVertexAttribDivisor(loc, 0)
+            glDisableVertexAttribArray(loc)
+        glDisableVertexAttribArray(vertex)
+        self._vertices.unbind()
+        glUseProgram(0)
+
+    def delete(self):
+        """Free GPU buffers and the shader program. Call with the context current."""
+        for buffer in (self._mesh_vbo, self._vertices, self._colors, self._id_colors):
+            if buffer is not None:
+                buffer.delete()
+        if self._program is not None:
+            glDeleteProgram(self._program)
+        self._mesh_vbo = self._vertices = self._colors = self._id_colors = None
+        self._program = None
+        self._instances = 0
+        self._count = 0
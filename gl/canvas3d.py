@@ -3,6 +3,7 @@
 
 import math
 import random
+import time
 import numpy as np
 import platform as pf
 
@@ -13,11 +14,10 @@ from wx import glcanvas
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
-from gl.glhelper import arcball, axis_to_quat, quat_to_matrix4, mul_quat, draw_circle, draw_helix
+from gl.glhelper import arcball, axis_to_quat, mul_quat, draw_circle, draw_helix
 from gl.path3d import Path3D
 from gl.camera3d import Camera3D
-from gl.bed3d import Bed3D
-from gl.proxy3d import Proxy3D
+from gl.scene3d import Scene3D
 
 
 class _Size():
@@ -51,53 +51,72 @@ class _Size():
         self.__scale_factor = scale_factor
 
 
-class Canvas3D(glcanvas.GLCanvas):
+class _RedrawScheduler():
+    """Coalesce redraw requests into at most one render per frame interval.
+
+    Invalidations arm a one-shot timer instead of rendering on every idle event,
+    so the canvas sleeps entirely while nothing changes.
+    """
+
+    def __init__(self, canvas, max_fps):
+        self._canvas = canvas
+        self._interval = 1.0 / max_fps
+        self._last_render = 0.0
+        self._pending = False
+        self._timer = wx.Timer(canvas)
+        canvas.Bind(wx.EVT_TIMER, self._on_timer, self._timer)
+
+    def invalidate(self):
+        """Request a redraw, merged with any redraw already pending."""
+        if self._pending:
+            return
+        self._pending = True
+        delay = self._last_render + self._interval - time.perf_counter()
+        self._timer.StartOnce(max(1, int(delay * 1000)))
+
+    def stop(self):
+        self._timer.Stop()
+        self._pending = False
+
+    def _on_timer(self, event):
+        self._pending = False
+        self._last_render = time.perf_counter()
+        self._canvas.on_redraw()
+
+    @property
+    def max_fps(self):
+        return 1.0 / self._interval
+
+    @max_fps.setter
+    def max_fps(self, value):
+        self._interval = 1.0 / max(1, value)
+
+
+class Canvas3D(Scene3D, glcanvas.GLCanvas):
     """Canvas3D class."""
     # True: use arcball controls, False: use orbit controls
     orbit_controls = True
-    color_background = (0.941, 0.941, 0.941, 1)
-    zoom_min = 0.1
-    zoom_max = 7.0
+    # upper bound on redraws per second
+    max_fps_default = 60
 
-    def __init__(self, parent, build_dimensions=None, axes=True, bounding_box=True, every=100, subdivisions=10):
+    def __init__(self, parent, build_dimensions=None, axes=True, bounding_box=True, every=100, subdivisions=10, max_fps=None):
         # TODO: add more init attributes such as pos and size
         display_attrs = glcanvas.GLAttributes()
         display_attrs.MinRGBA(8, 8, 8, 8).DoubleBuffer().Depth(24).EndList()
-        super().__init__(parent, display_attrs, -1)
+        glcanvas.GLCanvas.__init__(self, parent, display_attrs, -1)
+        Scene3D.__init__(self, build_dimensions, axes, bounding_box, every, subdivisions)
         self.parent = parent
 
-        self._gl_initialized = False
-        self._dirty = False # dirty flag to track when we need to re-render the canvas
         self._scale_factor = None
         self._mouse_pos = None
-        self._width = None
-        self._height = None
-        if build_dimensions:
-            self._build_dimensions = build_dimensions
-        else:
-            self._build_dimensions = [400, 400, 400, 200, 200, 200]
-        self._dist = 0.5 * (self._build_dimensions[1] + max(self._build_dimensions[0], self._build_dimensions[2]))
-
-        self._bed3d = Bed3D(self._build_dimensions, axes, bounding_box, every, subdivisions)
-        self._proxy3d = Proxy3D('Sphere', [50], (0, 53, 107))
         self._path3d = Path3D()
-        self._camera3d_list = []
-        self._path3d_list = []
-        self._camera3d_scale = 100
-
-        self._quadric = None
-        self._zoom = 1
-        self._rot_quat = [0.0, 0.0, 0.0, 1.0]
-        self._rot_lock = Lock()
-        self._angle_z = 0
-        self._angle_x = 0
 
         # initialize opengl context
         self._context = glcanvas.GLContext(self)
+        self._scheduler = _RedrawScheduler(self, max_fps or self.max_fps_default)
 
         # bind events
         self.Bind(wx.EVT_SIZE, self.on_size)
-        self.Bind(wx.EVT_IDLE, self.on_idle)
         self.Bind(wx.EVT_KEY_DOWN, self.on_key)
         self.Bind(wx.EVT_KEY_UP, self.on_key)
         self.Bind(wx.EVT_MOUSEWHEEL, self.on_mouse_wheel)
@@ -106,39 +125,7 @@ class Canvas3D(glcanvas.GLCanvas):
         self.Bind(wx.EVT_ERASE_BACKGROUND, self.on_erase_background)
         self.Bind(wx.EVT_PAINT, self.on_paint)
         self.Bind(wx.EVT_SET_FOCUS, self.on_set_focus)
-
-    def init_opengl(self):
-        """Initialize OpenGL."""
-        if self._gl_initialized:
-            return True
-
-        if self._context is None:
-            return False
-
-        self._quadric = gluNewQuadric()
-
-        glClearColor(*self.color_background)
-        glClearDepth(1.0)
-
-        glDepthFunc(GL_LESS)
-
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_CULL_FACE)
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-
-        # set antialiasing
-        glEnable(GL_LINE_SMOOTH)
-
-        glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
-        glEnable(GL_COLOR_MATERIAL)
-        glEnable(GL_MULTISAMPLE)
-
-        if not self._bed3d.init():
-            return
-
-        self._gl_initialized = True
-        return True
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
 
     def render(self):
         """Render frame."""
@@ -151,20 +138,10 @@ class Canvas3D(glcanvas.GLCanvas):
             return
 
         canvas_size = self.get_canvas_size()
-        glViewport(0, 0, canvas_size.width, canvas_size.height)
-        self._width = max(10, canvas_size.width)
-        self._height = max(10, canvas_size.height)
-
-        self.apply_view_matrix()
-        self.apply_projection()
-
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        self._render_background()
-        self._render_objects()
-        self._render_cameras()
-        self._render_paths()
+        self.render_frame(canvas_size.width, canvas_size.height)
 
         self.SwapBuffers()
+        self._picking.dirty = True
 
     # ---------------------
     # Canvas event handlers
@@ -172,24 +149,27 @@ class Canvas3D(glcanvas.GLCanvas):
 
     def on_size(self, event):
         """Handle EVT_SIZE."""
-        self._dirty = True
+        self._invalidate()
+        event.Skip()
 
-    def on_idle(self, event):
-        """Handle EVT_IDLE."""
+    def on_redraw(self):
+        """Render a scheduled redraw."""
         if not self._gl_initialized or self.IsFrozen():
             return
 
-        self._dirty = self._dirty or any((i.dirty for i in self._camera3d_list))
-
         self._refresh_if_shown_on_screen()
-
-        for camera in self._camera3d_list:
-            camera.dirty = False
         self._dirty = False
 
     def on_key(self, event):
-        """Handle EVT_KEY_DOWN and EVT_KEY_UP."""
-        pass
+        """Handle EVT_KEY_DOWN and EVT_KEY_UP.
+            F3:     toggle frame profiler overlay
+        """
+        if event.GetEventType() == wx.wxEVT_KEY_DOWN and event.GetKeyCode() == wx.WXK_F3:
+            self._profiler.overlay = not self._profiler.overlay
+            self._profiler.enabled = self._profiler.overlay
+            self._invalidate()
+        else:
+            event.Skip()
 
     def on_mouse_wheel(self, event):
         """Handle mouse wheel event and adjust zoom."""
@@ -204,9 +184,10 @@ class Canvas3D(glcanvas.GLCanvas):
 
     def on_mouse(self, event):
         """Handle mouse events.
-            LMB drag:   move viewport
-            RMB drag:   unused
-            LMB/RMB up: reset position
+            LMB drag:           move viewport
+            Shift + LMB drag:   marquee select cameras
+            RMB drag:           unused
+            LMB/RMB up:         reset position
         """
         if not self._gl_initialized or not self._set_current():
             return
@@ -215,19 +196,31 @@ class Canvas3D(glcanvas.GLCanvas):
         event.SetX(int(event.GetX() * scale))
         event.SetY(int(event.GetY() * scale))
 
-        if event.Dragging():
+        if event.LeftDown() and event.ShiftDown():
+            self._marquee = [event.GetX(), event.GetY(), event.GetX(), event.GetY()]
+        elif event.Dragging() and self._marquee is not None:
+            self._marquee[2:] = [event.GetX(), event.GetY()]
+            self._invalidate()
+        elif event.LeftUp() and self._marquee is not None:
+            self._select_marquee()
+        elif event.Dragging():
+            self._proxy3d.interactive = True
             if event.LeftIsDown():
                 self.rotate_camera(event, orbit=self.orbit_controls)
+                self._invalidate()
             elif event.RightIsDown() or event.MiddleIsDown():
                 self.translate_camera(event)
         elif event.LeftUp() or event.MiddleUp() or event.RightUp() or event.Leaving():
             if self._mouse_pos is not None:
                 self._mouse_pos = None
+            # redraw the proxy at full detail once dragging stops
+            if self._proxy3d.interactive:
+                self._proxy3d.interactive = False
+                self._invalidate()
         elif event.Moving():
             pass
         else:
             event.Skip()
-        self._dirty = True
 
     def on_left_dclick(self, event):
         """Handle EVT_LEFT_DCLICK."""
@@ -235,17 +228,16 @@ class Canvas3D(glcanvas.GLCanvas):
         scale = self.get_scale_factor()
         event.SetX(int(event.GetX() * scale))
         event.SetY(int(event.GetY() * scale))
-        glFlush()
 
-        # Read pixel color
-        pixel = glReadPixels(event.GetX(), self._height - event.GetY(), 1, 1, GL_RGB, GL_UNSIGNED_BYTE)
-        camid = 125 - pixel[0]
+        if not self._update_picking():
+            return 0
+        index = self._picking.pick(event.GetX(), event.GetY())
 
         # If user double clicks something other than camera
-        if camid > len(self._camera3d_list) or camid < 0:
+        if index < 0 or index >= len(self._camera3d_list):
             return 0
 
-        wx.GetApp().mainframe.set_selected_camera(camid)
+        wx.GetApp().mainframe.set_selected_camera(self._camera3d_list[index].camid)
 
     def on_erase_background(self, event):
         """Handle the erase background event."""
@@ -253,14 +245,16 @@ class Canvas3D(glcanvas.GLCanvas):
 
     def on_paint(self, event):
         """Handle EVT_PAINT."""
+        # validate the damaged region, or MSW keeps sending paint events
+        wx.PaintDC(self)
         if self._gl_initialized:
-            self._dirty = True
+            self._invalidate()
         else:
             self.render()
 
     def on_set_focus(self, event):
         """Handle EVT_SET_FOCUS."""
-        self._refresh_if_shown_on_screen()
+        self._invalidate()
 
     def get_canvas_size(self):
         """Get canvas size based on scaling factor."""
@@ -275,17 +269,30 @@ class Canvas3D(glcanvas.GLCanvas):
     # ---------------------
 
     def destroy(self):
-        """Clean up the OpenGL context."""
-        self._context.destroy()
-        glcanvas.GLCanvas.Destroy()
+        """Free OpenGL objects and destroy the canvas."""
+        self.Destroy()
+
+    def on_destroy(self, event):
+        event.Skip()
+        if event.GetEventObject() is not self:
+            return
+        self._scheduler.stop()
+        # the context is still alive here
+        if self._set_current():
+            self.delete_gl_objects()
 
     @property
-    def dirty(self):
-        return self._dirty
+    def max_fps(self):
+        return self._scheduler.max_fps
+
+    @max_fps.setter
+    def max_fps(self, value):
+        self._scheduler.max_fps = value
 
-    @dirty.setter
-    def dirty(self, value):
-        self._dirty = value
+    def _invalidate(self):
+        """Mark the canvas dirty and schedule a redraw."""
+        Scene3D._invalidate(self)
+        self._scheduler.invalidate()
 
     def _is_shown_on_screen(self):
         return self.IsShownOnScreen()
@@ -296,7 +303,7 @@ class Canvas3D(glcanvas.GLCanvas):
     def _update_camera_zoom(self, delta_zoom):
         zoom = self._zoom / (1.0 - max(min(delta_zoom, 4.0), -4.0) * 0.1)
         self._zoom = max(min(zoom, self.zoom_max), self.zoom_min)
-        self._dirty = True
+        self._invalidate()
         self._update_parent_zoom_slider()
 
     def _refresh_if_shown_on_screen(self):
@@ -304,26 +311,40 @@ class Canvas3D(glcanvas.GLCanvas):
             self._set_current()
             self.render()
 
-    def _render_background(self):
-        glClearColor(*self.color_background)
+    def _update_picking(self):
+        """Render the camera id pass if the scene changed since the last pick."""
+        if not self._gl_initialized or not self._set_current():
+            return False
 
-    def _render_objects(self):
-        if self._bed3d is not None:
-            self._bed3d.render()
+        def render_ids():
+            self.apply_view_matrix()
+            self.apply_projection()
 
-        if self._proxy3d is not None:
-            self._proxy3d.render()
+            # objects only occlude, they do not have ids
+            glColorMask(GL_FALSE, GL_FALSE, GL_FALSE, GL_FALSE)
+            self._render_objects()
+            glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
 
-    def _render_cameras(self):
-        if not self._camera3d_list:
-            return
-        for cam in self._camera3d_list:
-            cam.render()
+            self._update_cameras()
+            self._camera3d_batch.render_ids()
+
+        canvas_size = self.get_canvas_size()
+        glViewport(0, 0, canvas_size.width, canvas_size.height)
+        if self._picking.update(canvas_size.width, canvas_size.height, render_ids):
+            self._invalidate()
+        return True
 
-    def _render_paths(self):
-        if not self._path3d_list:
+    def _select_marquee(self):
+        x0, y0, x1, y1 = self._marquee
+        self._marquee = None
+        self._invalidate()
+        if not self._update_picking():
             return
 
+        indices = self._picking.pick_rect(x0, y0, x1, y1)
+        camids = [self._camera3d_list[i].camid for i in indices if i < len(self._camera3d_list)]
+        wx.GetApp().mainframe.set_selected_cameras(camids)
+
     # ------------------
     # Accessor functions
     # ------------------
@@ -331,96 +352,11 @@ class Canvas3D(glcanvas.GLCanvas):
     def _update_parent_zoom_slider(self):
         self.parent.set_zoom_slider(self._zoom)
 
-    @property
-    def bed3d(self):
-        return self._bed3d
-
-    @property
-    def proxy3d(self):
-        return self._proxy3d
-
-    @property
-    def zoom(self):
-        return self._zoom
-
-    @zoom.setter
-    def zoom(self, value):
-        self._zoom = value
-        self._dirty = True
-
-    @property
-    def build_dimensions(self):
-        return self._build_dimensions
-
-    @build_dimensions.setter
-    def build_dimensions(self, value):
-        self._build_dimensions = value
-        self._bed3d.build_dimensions = value
-        self._dirty = True
-
-    @property
-    def camera3d_scale(self):
-        return self._camera3d_scale
-
-    @camera3d_scale.setter
-    def camera3d_scale(self, value):
-        for camera in self._camera3d_list:
-            camera.scale = value
-            camera.dirty = True
-
-    @property
-    def camera3d_list(self):
-        return self._camera3d_list
-
-    @camera3d_list.setter
-    def camera3d_list(self, value):
-        self._camera3d_list = value
-        self._dirty = True
 
     # -----------------------
     # Canvas camera functions
     # -----------------------
 
-    def apply_view_matrix(self):
-        """Apply modelview matrix according to rotation quat."""
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        gluLookAt(
-            0.0, 0.0, self._dist * 1.5, # eyeX, eyeY, eyeZ
-            0.0, 0.0, 0.0,              # centerX, centerY, centerZ
-            0.0, 1.0, 0.0)              # upX, upY, upZ
-        glMultMatrixd(quat_to_matrix4(self._rot_quat))
-
-    def apply_projection(self):
-        """Set camera projection. Also updates zoom."""
-        # TODO: add toggle between perspective and orthographic view modes
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluPerspective(
-            np.arctan(np.tan(np.deg2rad(45.0)) / self._zoom) * 180 / math.pi,
-            float(self._width) / self._height,
-            0.1,
-            2000.0)
-        glMatrixMode(GL_MODELVIEW)
-
-    def get_modelview_matrix(self):
-        """Return GL_MODELVIEW_MATRIX."""
-        mat = (GLdouble * 16)()
-        glGetDoublev(GL_MODELVIEW_MATRIX, mat)
-        return mat
-
-    def get_projection_matrix(self):
-        """Return GL_PROJECTION_MATRIX."""
-        mat = (GLdouble * 16)()
-        glGetDoublev(GL_PROJECTION_MATRIX, mat)
-        return mat
-
-    def get_viewport(self):
-        """Return GL_VIEWPORT."""
-        vec = (GLint * 4)()
-        glGetIntegerv(GL_VIEWPORT, vec)
-        return vec
-
     def rotate_camera(self, event, orbit=True):
         """Update _rot_quat based on mouse position.
             orbit = True:   Use orbit method to rotate.
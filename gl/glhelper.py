@@ -4,12 +4,24 @@ TODO: Give attribution to Printrun
 """
 
 import math
-import functools
+import collections
 import numpy as np
 
 from OpenGL.GL import (GL_VERTEX_ARRAY, GL_FLOAT, GL_LINE_STRIP,
+                       GL_VERTEX_SHADER, GL_FRAGMENT_SHADER,
                        glEnableClientState, glVertexPointer,
-                       glDrawArrays, glDisableClientState)
+                       glDrawArrays, glDisableClientState,
+                       glDrawArraysInstanced, glVertexAttribDivisor)
+from OpenGL.GL import shaders
+from OpenGL.error import GLError
+from OpenGL.arrays import vbo
+
+from gl.profiler import count_draw
+
+# circle and helix parameters are rounded to this step before caching
+CACHE_QUANTUM = 1e-4
+# number of circle and helix vertex buffers kept on the GPU
+CACHE_SIZE = 256
 
 
 def arcball(p1x, p1y, p2x, p2y, r):
@@ -118,6 +130,23 @@ def rotate_basis(v0, v1, v2):
     return x, v, z
 
 
+def compile_program(vertex_source, fragment_source):
+    """Compile and link a shader program.
+    Returns None if shaders are unsupported or fail to compile.
+    """
+    try:
+        return shaders.compileProgram(
+            shaders.compileShader(vertex_source, GL_VERTEX_SHADER),
+            shaders.compileShader(fragment_source, GL_FRAGMENT_SHADER))
+    except (RuntimeError, GLError):
+        return None
+
+
+def has_instancing():
+    """Return whether instanced draw calls are available in the current context."""
+    return bool(glDrawArraysInstanced) and bool(glVertexAttribDivisor)
+
+
 def draw_circle(*args):
     """Wrapper function to draw circle."""
     draw_circle_memoized(*args)
@@ -128,81 +157,102 @@ def draw_helix(*args):
     draw_helix_memoized(*args)
 
 
-def draw_circle_memoized(p, n, r, sides=64):
-    """Draw circle given point, normal vector, radius, and # sides.
-    Uses the function compute_circle to generate points.
-    """
-    vertices, count = compute_circle(*p, *n, r, sides)
+class _VertexBufferCache():
+    """Bounded LRU cache of line strip VBOs, deleting buffers on eviction."""
 
-    # draw vertices
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._buffers = collections.OrderedDict()
+
+    def get(self, key, compute):
+        """Return (vbo, count) for key, calling compute() on a miss."""
+        if key in self._buffers:
+            self._buffers.move_to_end(key)
+            return self._buffers[key]
+
+        vertices, count = compute()
+        self._buffers[key] = (vbo.VBO(vertices), count)
+        if len(self._buffers) > self._maxsize:
+            _, (evicted, _) = self._buffers.popitem(last=False)
+            evicted.delete()
+        return self._buffers[key]
+
+    def clear(self):
+        for buffer, _ in self._buffers.values():
+            buffer.delete()
+        self._buffers.clear()
+
+
+_line_strip_cache = _VertexBufferCache(CACHE_SIZE)
+
+
+def clear_line_strip_cache():
+    """Free all cached circle and helix VBOs. Call with the context current."""
+    _line_strip_cache.clear()
+
+
+def _quantize(*values):
+    """Return hashable key of values rounded to CACHE_QUANTUM."""
+    return tuple(int(round(v / CACHE_QUANTUM)) for v in values)
+
+
+def _dequantize(key):
+    """Return values of a key made by _quantize."""
+    return [v * CACHE_QUANTUM for v in key]
+
+
+def _draw_line_strip(buffer, count):
+    buffer.bind()
     glEnableClientState(GL_VERTEX_ARRAY)
-    glVertexPointer(3, GL_FLOAT, 0, vertices)
+    glVertexPointer(3, GL_FLOAT, 0, buffer)
     glDrawArrays(GL_LINE_STRIP, 0, count)
+    count_draw(count)
     glDisableClientState(GL_VERTEX_ARRAY)
+    buffer.unbind()
+
+
+def draw_circle_memoized(p, n, r, sides=64):
+    """Draw circle given point, normal vector, radius, and # sides.
+    Vertices are computed once per quantized set of parameters and kept in a VBO.
+    """
+    key = ('circle', *_quantize(*p, *n, r), sides)
+    # computed from the quantized values, so every hit draws the same vertices
+    buffer, count = _line_strip_cache.get(key, lambda: compute_circle(*_dequantize(key[1:-1]), sides))
+    _draw_line_strip(buffer, count)
 
 
 def draw_helix_memoized(p, n, r, pitch=1, turns=1.0, sides=64):
     """Draw helix given point, normal vector, radius, pitch, # turns, and # sides.
-    Uses the function compute_helix to generate points.
+    Vertices are computed once per quantized set of parameters and kept in a VBO.
     """
-    vertices, count = compute_helix(*p, *n, r, pitch, turns, sides)
-
-    # draw vertices
-    glEnableClientState(GL_VERTEX_ARRAY)
-    glVertexPointer(3, GL_FLOAT, 0, vertices)
-    glDrawArrays(GL_LINE_STRIP, 0, count)
-    glDisableClientState(GL_VERTEX_ARRAY)
+    key = ('helix', *_quantize(*p, *n, r, pitch, turns), sides)
+    buffer, count = _line_strip_cache.get(key, lambda: compute_helix(*_dequantize(key[1:-1]), sides))
+    _draw_line_strip(buffer, count)
 
 
 def compute_circle(p0, p1, p2, n0, n1, n2, r, sides):
     """Compute vertices of circle given point, normal vector, radius, and # sides.
-    Uses an approximation method to compute vertices versus many trig calls.
+    Returns a flat float32 array of sides + 1 vertices and the vertex count.
     """
-    a, _, n = rotate_basis(n0, n1, n2)
-    theta = 6.28318530717958647692 / sides
-    tangential_factor = math.tan(theta)
-    radial_factor = math.cos(theta)
-
-    x, y, z = r * a[0], r * a[1], r * a[2]
-    count = sides + 1
-    vertices = np.empty(count * 3)
-    for i in range(count):
-        vertices[i*3] = x + p0
-        vertices[i*3 + 1] = y + p1
-        vertices[i*3 + 2] = z + p2
-        tx = (y*n[2] - z*n[1]) * tangential_factor
-        ty = (z*n[0] - x*n[2]) * tangential_factor
-        tz = (x*n[1] - y*n[0]) * tangential_factor
-        x = (x + tx) * radial_factor
-        y = (y + ty) * radial_factor
-        z = (z + tz) * radial_factor
-    return vertices, count
+    return compute_helix(p0, p1, p2, n0, n1, n2, r, 0.0, 1.0, sides)
 
 
 def compute_helix(p0, p1, p2, n0, n1, n2, r, pitch, turns, sides):
     """Compute vertices of helix given point, normal vector, radius, pitch, # turns, and # sides.
-    Uses an approximation method to compute vertices versus many trig calls.
+    Returns a flat float32 array of int(sides * turns) + 1 vertices and the vertex count.
     """
     a, _, n = rotate_basis(n0, n1, n2)
-    theta = 6.28318530717958647692 / sides
-    tangential_factor = math.tan(theta)
-    radial_factor = math.cos(theta)
-
-    x, y, z = r * a[0], r * a[1], r * a[2]
-    d0, d1, d2 = n[0]*pitch / sides, n[1]*pitch / sides, n[2]*pitch / sides
+    b = np.cross(n, a)
     count = int(sides * turns) + 1
-    vertices = np.empty(count * 3)
-    for i in range(count):
-        vertices[i*3] = x + p0 + d0*i
-        vertices[i*3 + 1] = y + p1 + d1*i
-        vertices[i*3 + 2] = z + p2 + d2*i
-        tx = (y*n[2] - z*n[1]) * tangential_factor
-        ty = (z*n[0] - x*n[2]) * tangential_factor
-        tz = (x*n[1] - y*n[0]) * tangential_factor
-        x = (x + tx) * radial_factor
-        y = (y + ty) * radial_factor
-        z = (z + tz) * radial_factor
-    return vertices, count
+    i = np.arange(count)
+    theta = i * (6.28318530717958647692 / sides)
+
+    # rotate from a toward -b about n, rising along n by pitch per turn
+    vertices = (np.outer(r * np.cos(theta), a)
+                - np.outer(r * np.sin(theta), b)
+                + np.outer(i * (pitch / sides), n)
+                + (p0, p1, p2))
+    return vertices.astype(np.float32).ravel(), count
 
 
 def draw_circle_trig(p, n, r, sides=36):
@@ -221,6 +271,7 @@ def draw_circle_trig(p, n, r, sides=36):
     glEnableClientState(GL_VERTEX_ARRAY)
     glVertexPointer(3, GL_FLOAT, 0, vertices)
     glDrawArrays(GL_LINE_STRIP, 0, count)
+    count_draw(count)
     glDisableClientState(GL_VERTEX_ARRAY)
 
 
@@ -240,4 +291,5 @@ def draw_helix_trig(p, n, r, pitch=1, turns=1.0, sides=36):
     glEnableClientState(GL_VERTEX_ARRAY)
     glVertexPointer(3, GL_FLOAT, 0, vertices)
     glDrawArrays(GL_LINE_STRIP, 0, count)
+    count_draw(count)
     glDisableClientState(GL_VERTEX_ARRAY)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Mesh3D class and cached tessellation of primitives."""
+
+import collections
+import numpy as np
+
+from OpenGL.GL import *
+from OpenGL.arrays import vbo
+
+from gl.profiler import count_draw
+
+# number of tessellated meshes kept on the GPU
+CACHE_SIZE = 32
+
+
+class Mesh3D():
+    """Indexed triangle mesh kept in vertex and index VBOs."""
+
+    def __init__(self, vertices, indices):
+        self._vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self._indices = np.ascontiguousarray(indices, dtype=np.uint32).ravel()
+        self._vertex_vbo = None
+        self._index_vbo = None
+
+    def render(self):
+        """Render mesh with the current color."""
+        if self._indices.size == 0:
+            return
+
+        if self._vertex_vbo is None:
+            self._vertex_vbo = vbo.VBO(self._vertices)
+            self._index_vbo = vbo.VBO(self._indices, target=GL_ELEMENT_ARRAY_BUFFER)
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        self._vertex_vbo.bind()
+        glVertexPointer(3, GL_FLOAT, 0, self._vertex_vbo)
+        self._index_vbo.bind()
+        glDrawElements(GL_TRIANGLES, self._indices.size, GL_UNSIGNED_INT, self._index_vbo)
+        count_draw(self._indices.size)
+        self._index_vbo.unbind()
+        self._vertex_vbo.unbind()
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def delete(self):
+        """Free GPU buffers. The mesh is uploaded again on next render."""
+        if self._vertex_vbo is not None:
+            self._vertex_vbo.delete()
+            self._index_vbo.delete()
+        self._vertex_vbo = None
+        self._index_vbo = None
+
+    @property
+    def vertices(self):
+        return self._vertices
+
+    @property
+    def indices(self):
+        return self._indices
+
+    @property
+    def bounds(self):
+        """Return (min, max) corners of the axis aligned bounding box."""
+        if self._vertices.size == 0:
+            return np.zeros(3), np.zeros(3)
+        return self._vertices.min(axis=0), self._vertices.max(axis=0)
+
+
+def _merge(*parts):
+    """Concatenate (vertices, indices) parts into one."""
+    vertices, indices, offset = [], [], 0
+    for v, i in parts:
+        vertices.append(v)
+        indices.append(i + offset)
+        offset += len(v)
+    return np.concatenate(vertices), np.concatenate(indices)
+
+
+def tessellate_sphere(radius, slices=32, stacks=32):
+    """Return vertices and indices of a sphere centered at the origin, like gluSphere."""
+    phi = np.linspace(0.0, np.pi, stacks + 1)[:, None]
+    theta = np.linspace(0.0, 2.0 * np.pi, slices + 1)[None, :]
+    vertices = radius * np.stack([
+        np.sin(phi) * np.cos(theta),
+        np.sin(phi) * np.sin(theta),
+        np.cos(phi) * np.ones_like(theta)], axis=-1).reshape(-1, 3)
+
+    i, j = np.meshgrid(np.arange(stacks), np.arange(slices), indexing='ij')
+    a = i * (slices + 1) + j
+    b, c, d = a + slices + 1, a + slices + 2, a + 1
+    indices = np.stack([a, b, c, a, c, d], axis=-1)
+    return vertices, indices.ravel()
+
+
+def tessellate_cylinder(base, top, height, slices=32):
+    """Return vertices and indices of an open cylinder or cone along +z, like gluCylinder."""
+    theta = np.linspace(0.0, 2.0 * np.pi, slices + 1)
+    ring = np.stack([np.cos(theta), np.sin(theta), np.zeros_like(theta)], axis=1)
+    vertices = np.concatenate([ring * [base, base, 0.0], ring * [top, top, 0.0] + [0.0, 0.0, height]])
+
+    b = np.arange(slices)
+    t = b + slices + 1
+    indices = np.stack([b, b + 1, t + 1, b, t + 1, t], axis=1)
+    return vertices, indices.ravel()
+
+
+def tessellate_disk(radius, slices=32, inside=False):
+    """Return vertices and indices of a disk at z = 0 facing +z, or -z if inside."""
+    theta = np.linspace(0.0, 2.0 * np.pi, slices + 1)
+    vertices = np.concatenate([
+        np.zeros((1, 3)),
+        np.stack([radius * np.cos(theta), radius * np.sin(theta), np.zeros_like(theta)], axis=1)])
+
+    i = np.arange(1, slices + 1)
+    if inside:
+        indices = np.stack([np.zeros_like(i), i + 1, i], axis=1)
+    else:
+        indices = np.stack([np.zeros_like(i), i, i + 1], axis=1)
+    return vertices, indices.ravel()
+
+
+def tessellate_box(width, length, height):
+    """Return vertices and indices of a box centered at the origin.
+    Width is along x, height along y, and length along z.
+    """
+    hw, hh, hl = width / 2, height / 2, length / 2
+    quads = np.array([
+        [[-hw, -hh, -hl], [hw, -hh, -hl], [hw, -hh, hl], [-hw, -hh, hl]],   # bottom
+        [[-hw, hh, hl], [hw, hh, hl], [hw, hh, -hl], [-hw, hh, -hl]],       # top
+        [[-hw, hh, -hl], [hw, hh, -hl], [hw, -hh, -hl], [-hw, -hh, -hl]],   # back
+        [[-hw, -hh, hl], [hw, -hh, hl], [hw, hh, hl], [-hw, hh, hl]],       # front
+        [[hw, hh, -hl], [hw, hh, hl], [hw, -hh, hl], [hw, -hh, -hl]],       # right
+        [[-hw, -hh, -hl], [-hw, -hh, hl], [-hw, hh, hl], [-hw, hh, -hl]]])  # left
+    quad = np.arange(6)[:, None] * 4
+    indices = quad + [0, 1, 2, 0, 2, 3]
+    return quads.reshape(-1, 3), indices.ravel()
+
+
+def tessellate(style, dimensions, slices=32):
+    """Return vertices and indices for a primitive style and its dimensions.
+
+    Sphere:     [radius]
+    Cylinder:   [radius, height], capped and centered at the origin
+    Cube:       [width, length, height]
+    Arrow:      [base radius, length], a cone along +z with its base capped
+    """
+    if style == 'Sphere':
+        return tessellate_sphere(dimensions[0], slices, slices)
+    if style == 'Cylinder':
+        radius, height = dimensions[0], dimensions[1]
+        side, bottom, top = (
+            tessellate_cylinder(radius, radius, height, slices),
+            tessellate_disk(radius, slices, inside=True),
+            tessellate_disk(radius, slices))
+        top = (top[0] + [0.0, 0.0, height], top[1])
+        vertices, indices = _merge(side, bottom, top)
+        return vertices - [0.0, 0.0, height / 2], indices
+    if style == 'Cube':
+        return tessellate_box(*dimensions[:3])
+    if style == 'Arrow':
+        radius, length = dimensions[0], dimensions[1]
+        return _merge(
+            tessellate_cylinder(radius, 0.0, length, slices),
+            tessellate_disk(radius, slices, inside=True))
+    raise ValueError(f'unknown mesh style "{style}"')
+
+
+_mesh_cache = collections.OrderedDict()
+
+
+def clear_mesh_cache():
+    """Free all cached meshes. Call with the context current."""
+    for mesh in _mesh_cache.values():
+        mesh.delete()
+    _mesh_cache.clear()
+
+
+def get_mesh(style, dimensions, slices=32):
+    """Return the cached Mesh3D for (style, dimensions, slices).
+    Meshes are tessellated once and the least recently used are freed, so
+    call this every frame rather than keeping the returned mesh.
+    """
+    key = (style, tuple(float(d) for d in dimensions), slices)
+    if key in _mesh_cache:
+        _mesh_cache.move_to_end(key)
+        return _mesh_cache[key]
+
+    mesh = Mesh3D(*tessellate(style, dimensions, slices))
+    _mesh_cache[key] = mesh
+    if len(_mesh_cache) > CACHE_SIZE:
+        _, evicted = _mesh_cache.popitem(last=False)
+        evicted.delete()
+    return mesh
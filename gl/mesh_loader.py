@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""Streaming STL, OBJ and PLY loaders and mesh decimation.
+
+Files are memory-mapped and parsed with NumPy directly into (n, 3) float32
+vertex and (m, 3) uint32 triangle index arrays, without building a Python
+object per vertex or face.
+"""
+
+import mmap
+import numpy as np
+from pathlib import Path
+
+_STL_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2')])
+
+_PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+
+_WHITESPACE = np.frombuffer(b' \t\r\n', dtype=np.uint8)
+
+# byte class lookup tables, indexed by byte value
+_IS_SPACE = np.zeros(256, dtype=bool)
+_IS_SPACE[_WHITESPACE] = True
+_IS_DIGIT = np.zeros(256, dtype=bool)
+_IS_DIGIT[ord('0'):ord('9') + 1] = True
+_IS_NUMBER = _IS_DIGIT.copy()
+_IS_NUMBER[np.frombuffer(b'+-.eE', dtype=np.uint8)] = True
+_POWERS_OF_TEN = 10.0 ** np.arange(23)
+
+
+def load_mesh(path):
+    """Load vertices and triangle indices from an STL, OBJ or PLY file."""
+    loaders = {'.stl': load_stl, '.obj': load_obj, '.ply': load_ply}
+    suffix = Path(path).suffix.lower()
+    if suffix not in loaders:
+        raise ValueError(f'unsupported mesh format "{suffix}"')
+    return loaders[suffix](path)
+
+
+def _map(path):
+    """Return file contents as a read-only uint8 array backed by mmap."""
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.frombuffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), dtype=np.uint8)
+
+
+def _lines(buf):
+    """Return start and end offsets of every line in a byte array."""
+    ends = np.flatnonzero(buf == ord('\n'))
+    if buf.size and buf[-1] != ord('\n'):
+        ends = np.append(ends, buf.size)
+    starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.int64)
+    return starts, ends
+
+
+def _select(buf, starts, ends):
+    """Return bytes of the selected lines and the offset of each in them."""
+    lengths = ends - starts + 1
+    index = np.repeat(starts - np.cumsum(np.concatenate([[0], lengths[:-1]])), lengths) + np.arange(lengths.sum())
+    # the byte after each line is its newline, or past the end for the last one
+    out = np.full(index.size, ord('\n'), dtype=np.uint8)
+    valid = index < buf.size
+    out[valid] = buf[index[valid]]
+    # empty, not [0], when no lines are selected
+    line_starts = np.cumsum(lengths) - lengths
+    return out, line_starts
+
+
+def _numbers(text, dtype=np.float64):
+    """Parse whitespace separated decimal numbers in a byte array, e.g.
+    -12, 0.5 or 1.5e-3, with array operations over the bytes instead of a
+    Python object per number.
+    """
+    text = np.asarray(text, dtype=np.uint8)
+    space = _IS_SPACE[text]
+    token_start = ~space
+    token_start[1:] &= space[:-1]
+    chars = text[~space]
+    token_start = token_start[~space]
+    starts = np.flatnonzero(token_start)
+    if starts.size == 0:
+        return np.zeros(0, dtype=dtype)
+    if not _IS_NUMBER[chars].all():
+        raise ValueError('invalid number')
+    token = np.cumsum(token_start, dtype=np.int32) - 1
+
+    def running(mask):
+        # count of mask up to and including each byte, restarting at every token
+        total = np.cumsum(mask, dtype=np.int32)
+        return total - (total - mask)[starts][token]
+
+    def positional(mask):
+        # the digits of mask in each token read as one integer
+        power = np.add.reduceat(mask.astype(np.int32), starts)[token] - running(mask)
+        if power.max() < len(_POWERS_OF_TEN):
+            weight = np.where(mask, _POWERS_OF_TEN[np.maximum(power, 0)], 0.0)
+        else:
+            weight = np.where(mask, 10.0 ** power, 0.0)
+        return np.add.reduceat(weight * (chars - ord('0')), starts)
+
+    digit = _IS_DIGIT[chars]
+    marker = (chars == ord('e')) | (chars == ord('E'))
+    if marker.any():
+        exponent_part = running(marker) > 0
+        mantissa = digit & ~exponent_part
+        exponent = positional(digit & exponent_part)
+        # a sign right after the exponent marker
+        negative = np.zeros(chars.size, dtype=bool)
+        negative[1:] = (chars[1:] == ord('-')) & marker[:-1]
+        exponent[np.add.reduceat(negative, starts) > 0] *= -1.0
+    else:
+        mantissa = digit
+        exponent = 0.0
+    power = exponent - np.add.reduceat((running(chars == ord('.')) > 0) & mantissa, starts)
+
+    # dividing by an exact power of ten rounds like float() for typical inputs
+    numbers = positional(mantissa)
+    numbers = np.where(power < 0, numbers / 10.0 ** -power, numbers * 10.0 ** np.maximum(power, 0))
+    numbers[chars[starts] == ord('-')] *= -1.0
+    return numbers.astype(dtype)
+
+
+def _token_counts(text, line_starts):
+    """Return number of whitespace separated tokens on each line of text."""
+    space = _IS_SPACE[text]
+    token_start = ~space & np.concatenate([[True], space[:-1]])
+    return np.add.reduceat(token_start.astype(np.int64), line_starts) if line_starts.size else line_starts
+
+
+def _fan(flat, counts):
+    """Fan triangulate polygons given flat vertex indices and vertices per polygon."""
+    counts = counts.astype(np.int64)
+    offsets = np.cumsum(counts) - counts
+    ntri = np.maximum(counts - 2, 0)
+    first = np.repeat(offsets, ntri)
+    j = np.arange(ntri.sum()) - np.repeat(np.cumsum(ntri) - ntri, ntri) + 1
+    return np.stack([flat[first], flat[first + j], flat[first + j + 1]], axis=1)
+
+
+def _group(keys):
+    """Return (first, inverse) for a 1D key array: an index of one element of
+    every distinct key, and the group of every element. Sorts keys once.
+    """
+    order = np.argsort(keys)
+    ordered = keys[order]
+    new = np.concatenate([[True], ordered[1:] != ordered[:-1]]) if keys.size else np.zeros(0, dtype=bool)
+    inverse = np.empty(keys.size, dtype=np.int64)
+    inverse[order] = np.cumsum(new) - 1
+    return order[new], inverse
+
+
+def _weld(triangles):
+    """Return shared vertices and indices from an (m, 3, 3) triangle soup.
+    Vertices are matched by a hash of their float32 bits, so only one 1D key
+    array is sorted, and the rare hash collision falls back to comparing rows.
+    """
+    # adding zero turns -0.0 into 0.0, and copies memory-mapped data
+    points = np.asarray(triangles, dtype=np.float32).reshape(-1, 3) + np.float32(0.0)
+    bits = points.view(np.uint32).astype(np.uint64)
+    keys = (bits[:, 0] * np.uint64(0x9E3779B97F4A7C15)) ^ \
+        (bits[:, 1] * np.uint64(0xC2B2AE3D27D4EB4F)) ^ (bits[:, 2] * np.uint64(0x165667B19E3779F9))
+    first, inverse = _group(keys)
+    vertices = points[first]
+    if not np.array_equal(vertices[inverse], points):
+        vertices, inverse = np.unique(points, axis=0, return_inverse=True)
+    return vertices, inverse.ravel().reshape(-1, 3).astype(np.uint32)
+
+
+def load_stl(path):
+    """Load a binary or ASCII STL file."""
+    buf = _map(path)
+    # binary headers may start with solid too, but are not followed by facets
+    head = bytes(buf[:1024])
+    ascii = head.lstrip().startswith(b'solid') and b'facet' in head
+    if buf.size >= 84 and not ascii:
+        count = int(buf[80:84].view('<u4')[0])
+        # some exporters pad the end of the file
+        if 84 + count * _STL_DTYPE.itemsize <= buf.size:
+            facets = np.memmap(path, dtype=_STL_DTYPE, mode='r', offset=84, shape=(count,))
+            return _weld(facets['vertices'])
+
+    # ASCII STL, every 'vertex x y z' line belongs to a facet in order
+    starts, ends = _lines(buf)
+    first = _first_token(buf, starts, ends)
+    mask = first == b'vertex'
+    text, _ = _select(buf, starts[mask], ends[mask])
+    text = _blank_words(text)
+    coords = _numbers(text)
+    return _weld(coords.reshape(-1, 3, 3))
+
+
+def _first_token(buf, starts, ends):
+    """Return first word of every line, up to 8 bytes, as a bytes array."""
+    width = 8
+    index = starts[:, None] + np.arange(width)
+    index = np.minimum(index, max(0, buf.size - 1))
+    chunk = buf[index] if buf.size else np.zeros((0, width), dtype=np.uint8)
+    # skip leading whitespace by shifting rows, rare enough to do per row
+    lead = _IS_SPACE[chunk[:, 0]] & (starts < ends)
+    for row in np.flatnonzero(lead):
+        s = starts[row]
+        while s < ends[row] and buf[s] in _WHITESPACE:
+            s += 1
+        chunk[row] = buf[np.minimum(s + np.arange(width), buf.size - 1)]
+    chunk = chunk.copy()
+    chunk[(index >= ends[:, None]) | _IS_SPACE[chunk]] = 0
+    # everything after the first zero byte is not part of the word
+    chunk[np.cumsum(chunk == 0, axis=1) > 0] = 0
+    return chunk.view('S%d' % width).ravel()
+
+
+def _blank_words(text):
+    """Replace alphabetic bytes, e.g. keywords, with spaces."""
+    text = text.copy()
+    alpha = ((text >= ord('a')) & (text <= ord('z'))) | ((text >= ord('A')) & (text <= ord('Z')))
+    # keep exponent markers inside numbers such as 1.5e-3
+    exponent = ((text == ord('e')) | (text == ord('E'))) & \
+        np.concatenate([[False], _IS_DIGIT[text[:-1]] | (text[:-1] == ord('.'))])
+    text[alpha & ~exponent] = ord(' ')
+    return text
+
+
+def load_obj(path):
+    """Load vertices and faces of an OBJ file, fan triangulating polygons."""
+    buf = _map(path)
+    starts, ends = _lines(buf)
+    first = _first_token(buf, starts, ends)
+
+    # vertex positions, an optional w coordinate is dropped
+    mask = first == b'v'
+    text, line_starts = _select(buf, starts[mask], ends[mask])
+    # the keyword may be indented
+    text = _blank_words(text)
+    counts = _token_counts(text, line_starts)
+    coords = _numbers(text)
+    if counts.size and (counts == 3).all():
+        vertices = coords.reshape(-1, 3)
+    else:
+        offsets = np.cumsum(counts) - counts
+        vertices = coords[offsets[:, None] + np.arange(3)]
+
+    # faces, keeping only the position index of v/vt/vn references
+    mask = first == b'f'
+    text, line_starts = _select(buf, starts[mask], ends[mask])
+    text = _strip_references(_blank_words(text))
+    counts = _token_counts(text, line_starts)
+    flat = _numbers(text, np.int64)
+    flat = np.where(flat < 0, len(vertices) + flat, flat - 1)
+    return vertices.astype(np.float32), _fan(flat, counts).astype(np.uint32)
+
+
+def _strip_references(text):
+    """Blank everything from the first '/' to the end of each token."""
+    text = text.copy()
+    space = _IS_SPACE[text]
+    slash = (text == ord('/')).astype(np.int64)
+    seen = np.cumsum(slash)
+    token_start = ~space & np.concatenate([[True], space[:-1]])
+    token = np.cumsum(token_start)
+    base = np.concatenate([[0], (seen - slash)[token_start]])
+    blank = ~space & (seen - base[token] > 0)
+    text[blank] = ord(' ')
+    return text
+
+
+def _read_ply_header(buf):
+    """Return (format, elements, body offset) of a PLY header."""
+    end = bytes(buf[:min(buf.size, 65536)]).find(b'end_header')
+    if bytes(buf[:3]) != b'ply' or end < 0:
+        raise ValueError('not a PLY file')
+    body = end + len(b'end_header')
+    while body < buf.size and buf[body] != ord('\n'):
+        body += 1
+    header = bytes(buf[:body]).decode('ascii').splitlines()
+
+    fmt, elements = None, []
+    for line in header:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            if words[1] == 'list':
+                elements[-1][2].append((words[4], 'list', _PLY_TYPES[words[2]], _PLY_TYPES[words[3]]))
+            else:
+                elements[-1][2].append((words[2], _PLY_TYPES[words[1]], None, None))
+    return fmt, elements, body + 1
+
+
+def load_ply(path):
+    """Load vertices and faces of an ASCII or binary PLY file."""
+    buf = _map(path)
+    fmt, elements, offset = _read_ply_header(buf)
+    vertices, faces = None, None
+
+    if fmt == 'ascii':
+        starts, ends = _lines(buf[offset:])
+        line = 0
+        for name, count, props in elements:
+            text, line_starts = _select(buf[offset:], starts[line:line + count], ends[line:line + count])
+            line += count
+            values = _numbers(text)
+            if name == 'vertex':
+                names = [p[0] for p in props]
+                rows = values.reshape(count, len(props))
+                vertices = rows[:, [names.index(a) for a in 'xyz']]
+            elif name == 'face':
+                counts = _token_counts(text, line_starts)
+                faces = _ply_faces(values, counts, count)
+        return _mesh(vertices, faces)
+
+    endian = '<' if fmt == 'binary_little_endian' else '>'
+    for name, count, props in elements:
+        if any(p[1] == 'list' for p in props):
+            if name != 'face':
+                raise ValueError(f'unsupported list property in element "{name}"')
+            faces, offset = _read_binary_faces(buf, offset, count, props, endian)
+        else:
+            dtype = np.dtype([(p[0], endian + p[1]) for p in props])
+            data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+            offset += count * dtype.itemsize
+            if name == 'vertex':
+                vertices = np.stack([data['x'], data['y'], data['z']], axis=1)
+    return _mesh(vertices, faces)
+
+
+def _mesh(vertices, faces):
+    """Return float32 vertices and uint32 faces, empty for a missing element,
+    e.g. the faces of a point cloud.
+    """
+    vertices = np.zeros((0, 3)) if vertices is None else vertices
+    faces = np.zeros((0, 3)) if faces is None else faces
+    return vertices.astype(np.float32), faces.astype(np.uint32)
+
+
+def _ply_faces(values, counts, count):
+    """Triangulate ASCII face rows, each a vertex count followed by indices."""
+    offsets = np.cumsum(counts) - counts
+    sizes = values[offsets].astype(np.int64)
+    keep = np.ones(values.size, dtype=bool)
+    keep[offsets] = False
+    # drop trailing non index properties of each face
+    extra = counts - 1 - sizes
+    for row in np.flatnonzero(extra):
+        keep[offsets[row] + 1 + sizes[row]:offsets[row] + counts[row]] = False
+    return _fan(values[keep].astype(np.int64), sizes)
+
+
+def _read_binary_faces(buf, offset, count, props, endian):
+    """Read binary face lists. Faces with a uniform vertex count are read as a
+    single structured array, mixed polygon sizes fall back to a slower walk.
+    """
+    (_, _, count_type, index_type), = [p for p in props if p[1] == 'list']
+    count_size = np.dtype(count_type).itemsize
+    first = offset
+    for p in props:
+        if p[1] == 'list':
+            break
+        first += np.dtype(p[1]).itemsize
+    size = int(buf[first:first + count_size].view(endian + count_type)[0]) if count else 0
+
+    fields = []
+    for p in props:
+        if p[1] == 'list':
+            fields += [('n', endian + count_type), ('indices', endian + index_type, (size,))]
+        else:
+            fields.append((p[0], endian + p[1]))
+    dtype = np.dtype(fields)
+    data = buf[offset:offset + count * dtype.itemsize]
+    if data.size == count * dtype.itemsize:
+        data = data.view(dtype)
+        if (data['n'] == size).all():
+            return _fan(data['indices'].ravel().astype(np.int64), np.full(count, size)), offset + data.nbytes
+
+    index_size = np.dtype(index_type).itemsize
+    flat, sizes = [], np.empty(count, dtype=np.int64)
+    for i in range(count):
+        for p in props:
+            if p[1] != 'list':
+                offset += np.dtype(p[1]).itemsize
+                continue
+            n = int(buf[offset:offset + count_size].view(endian + count_type)[0])
+            offset += count_size
+            flat.append(buf[offset:offset + n * index_size].view(endian + index_type))
+            offset += n * index_size
+            sizes[i] = n
+    return _fan(np.concatenate(flat).astype(np.int64), sizes), offset
+
+
+def decimate(vertices, indices, cell_size):
+    """Simplify a mesh by clustering vertices on a uniform grid of cell_size.
+    Vertices in the same cell are merged to their mean, and triangles that
+    collapse or duplicate another triangle are removed.
+    """
+    if len(vertices) == 0:
+        return vertices.astype(np.float32), indices.astype(np.uint32)
+
+    # pack cell coordinates into one key per vertex
+    cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    size = cells.max(axis=0) + 1
+    _, cluster = _group((cells[:, 0] * size[1] + cells[:, 1]) * size[2] + cells[:, 2])
+    count = int(cluster.max()) + 1
+
+    weights = np.bincount(cluster, minlength=count).astype(np.float64)
+    merged = np.stack([np.bincount(cluster, vertices[:, k], count) for k in range(3)], axis=1)
+    merged /= weights[:, None]
+
+    triangles = cluster[indices]
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    triangles = triangles[(a != b) & (b != c) & (a != c)]
+
+    # drop duplicates regardless of rotation, keeping the original winding
+    rolled = np.argmin(triangles, axis=1)
+    canonical = np.take_along_axis(triangles, (rolled[:, None] + np.arange(3)) % 3, axis=1)
+    if count ** 3 < 2 ** 63:
+        unique, _ = _group((canonical[:, 0] * count + canonical[:, 1]) * count + canonical[:, 2])
+    else:
+        _, unique = np.unique(canonical, axis=0, return_index=True)
+    triangles = canonical[np.sort(unique)]
+
+    # drop vertices no longer referenced
+    used = np.flatnonzero(np.bincount(triangles.ravel(), minlength=count))
+    remap = np.zeros(count, dtype=np.int64)
+    remap[used] = np.arange(used.size)
+    return merged[used].astype(np.float32), remap[triangles].astype(np.uint32)
+
+
+def surface_area(vertices, indices):
+    """Return the total area of the triangles of a mesh."""
+    a, b, c = (vertices[indices[:, k]].astype(np.float64) for k in range(3))
+    return 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1).sum()
+
+
+def build_lod_chain(vertices, indices, max_triangles=500000, min_triangles=2000, ratio=0.25):
+    """Return a list of (vertices, indices) levels of detail, finest first.
+    The finest level has at most max_triangles, and each following level has
+    roughly ratio times as many triangles, down to about min_triangles.
+    Every level is decimated from the one before it.
+    """
+    levels = []
+    area = surface_area(vertices, indices) if len(indices) else 0.0
+    if area == 0.0:
+        return [(vertices, indices)]
+
+    if len(indices) <= max_triangles:
+        levels.append((vertices, indices))
+        target = len(indices) * ratio
+    else:
+        target = max_triangles
+
+    source = (vertices, indices)
+    while target >= min_triangles:
+        # clustering leaves about two triangles per grid cell on the surface
+        cell_size = np.sqrt(2.0 * area / target)
+        level = decimate(*source, cell_size)
+        for _ in range(3):
+            if len(level[1]) <= target:
+                break
+            cell_size *= np.sqrt(len(level[1]) / target) * 1.05
+            level = decimate(*source, cell_size)
+        if len(level[1]) == 0 or len(level[1]) >= len(source[1]):
+            break
+        levels.append(level)
+        source = level
+        target = len(level[1]) * ratio
+    return levels or [source]
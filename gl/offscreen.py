@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""OffscreenCanvas3D class and headless preview command line.
+
+Renders the same scene as Canvas3D without a window or GPU, through a Mesa
+OSMesa or EGL context. PyOpenGL picks its platform when OpenGL is first
+imported, so PYOPENGL_PLATFORM must be osmesa or egl by then; osmesa is
+the default when this module is imported first.
+
+    python3 -m gl.offscreen --cameras rig.csv --path plan.csv --proxy object.stl -o preview.png
+    PYOPENGL_PLATFORM=egl python3 -m gl.offscreen --cameras rig.csv --benchmark 200
+"""
+
+import os
+
+# must happen before the first OpenGL import
+os.environ.setdefault('PYOPENGL_PLATFORM', 'osmesa')
+
+import argparse
+import ctypes
+import math
+import time
+import numpy as np
+
+from OpenGL.GL import *
+from OpenGL import arrays
+
+from gl.camera3d import Camera3D
+from gl.glhelper import axis_to_quat, mul_quat
+from gl.path3d import Path3D, PATH3D_FLAGS_DTYPE
+from gl.scene3d import Scene3D
+
+
+class _OSMesaContext():
+    """Mesa software context rendering into a buffer in client memory."""
+
+    def __init__(self, width, height):
+        from OpenGL import osmesa
+        self._osmesa = osmesa
+        self._context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self._context:
+            raise RuntimeError('could not create OSMesa context')
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        self._buffer = arrays.GLubyteArray.zeros((height, width, 4))
+        self._width = width
+        self._height = height
+
+    def make_current(self):
+        return bool(self._osmesa.OSMesaMakeCurrent(
+            self._context, self._buffer, GL_UNSIGNED_BYTE, self._width, self._height))
+
+    def destroy(self):
+        self._osmesa.OSMesaDestroyContext(self._context)
+        self._context = None
+
+
+class _EGLContext():
+    """Desktop OpenGL context on an EGL pbuffer surface, e.g. Mesa llvmpipe or a headless GPU."""
+
+    def __init__(self, width, height):
+        from OpenGL import EGL
+        self._egl = EGL
+        self._display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self._display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError('could not initialize EGL display')
+
+        attribs = arrays.GLintArray.asArray([
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8,
+            EGL.EGL_GREEN_SIZE, 8,
+            EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_ALPHA_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE])
+        self._config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        if not EGL.eglChooseConfig(self._display, attribs, ctypes.pointer(self._config), 1, ctypes.pointer(count)) \
+                or count.value == 0:
+            raise RuntimeError('no EGL config supports OpenGL pbuffers')
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self._context = EGL.eglCreateContext(self._display, self._config, EGL.EGL_NO_CONTEXT, None)
+        if not self._context:
+            raise RuntimeError('could not create EGL context')
+        self._surface = None
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        EGL = self._egl
+        if self._surface is not None:
+            EGL.eglMakeCurrent(self._display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(self._display, self._surface)
+        attribs = arrays.GLintArray.asArray([EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE])
+        self._surface = EGL.eglCreatePbufferSurface(self._display, self._config, attribs)
+
+    def make_current(self):
+        return bool(self._egl.eglMakeCurrent(self._display, self._surface, self._surface, self._context))
+
+    def destroy(self):
+        EGL = self._egl
+        EGL.eglMakeCurrent(self._display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroySurface(self._display, self._surface)
+        EGL.eglDestroyContext(self._display, self._context)
+        EGL.eglTerminate(self._display)
+        self._context = None
+
+
+_BACKENDS = {'osmesa': _OSMesaContext, 'egl': _EGLContext}
+
+
+class OffscreenCanvas3D(Scene3D):
+    """Scene3D rendered into an offscreen buffer, with no window or display."""
+
+    def __init__(self, width=800, height=600, build_dimensions=None, axes=True, bounding_box=True, every=100, subdivisions=10):
+        Scene3D.__init__(self, build_dimensions, axes, bounding_box, every, subdivisions)
+
+        platform = os.environ.get('PYOPENGL_PLATFORM')
+        if platform not in _BACKENDS:
+            raise RuntimeError(f'offscreen rendering needs PYOPENGL_PLATFORM set to one of '
+                               f'{", ".join(_BACKENDS)} before OpenGL is imported, not "{platform}"')
+        self._context = _BACKENDS[platform](width, height)
+        self._size = (width, height)
+
+    def render(self):
+        """Render frame and return it as a (height, width, 4) RGBA array, top row first."""
+        self._set_current()
+        width, height = self._size
+        self.render_frame(width, height)
+        glFinish()
+        self._dirty = False
+        self._picking.dirty = True
+
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+        return np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 4)[::-1]
+
+    def save_png(self, path):
+        """Render frame and write it to a PNG file."""
+        from PIL import Image
+        Image.fromarray(np.ascontiguousarray(self.render())).save(path)
+
+    def benchmark(self, frames=100, warmup=10, orbit=True):
+        """Render frames and return the time of each in milliseconds.
+        glFinish is called after every frame so GPU or software rasterization
+        time is included. With orbit, the view turns a full circle over the run.
+        """
+        self._set_current()
+        width, height = self._size
+        times = np.empty(frames)
+        for i in range(-warmup, frames):
+            if i == 0:
+                self._profiler.clear()
+            if orbit:
+                self.set_view(360.0 * max(i, 0) / frames, 30.0)
+            start = time.perf_counter()
+            self.render_frame(width, height)
+            glFinish()
+            if i >= 0:
+                times[i] = (time.perf_counter() - start) * 1000.0
+        self._picking.dirty = True
+        return times
+
+    def set_view(self, azimuth, elevation):
+        """Orbit the view by azimuth and elevation in degrees, like dragging a Canvas3D."""
+        self._angle_z = math.radians(azimuth)
+        self._angle_x = math.radians(elevation)
+        rot_x = axis_to_quat([1.0, 0.0, 0.0], self._angle_x)
+        rot_z = axis_to_quat([0.0, 1.0, 0.0], self._angle_z)
+        self.rot_quat = mul_quat(rot_z, rot_x)
+
+    def resize(self, width, height):
+        self._set_current()
+        self._context.resize(width, height)
+        self._size = (width, height)
+        self._invalidate()
+
+    def destroy(self):
+        """Free OpenGL objects and clean up the OpenGL context."""
+        if self._context is not None:
+            if self._context.make_current():
+                self.delete_gl_objects()
+            self._context.destroy()
+        self._context = None
+
+    @property
+    def size(self):
+        return self._size
+
+    def _set_current(self):
+        if self._context is None or not self._context.make_current():
+            raise RuntimeError('could not make offscreen context current')
+        if not self.init_opengl():
+            raise RuntimeError('could not initialize OpenGL')
+
+
+def load_rig(path):
+    """Return Camera3D objects from a text file with one x, y, z[, b, c] row per camera.
+    Cameras without b and c face the origin. Rows may be comma or space separated.
+    """
+    with open(path) as f:
+        rows = np.loadtxt((line.replace(',', ' ') for line in f), ndmin=2)
+
+    cameras = []
+    for camid, row in enumerate(rows):
+        if rows.shape[1] >= 5:
+            cameras.append(Camera3D(camid, *row[:5]))
+        else:
+            camera = Camera3D(camid, *row[:3], 0.0, 0.0)
+            camera.on_focus_center()
+            cameras.append(camera)
+    return cameras
+
+
+def load_path(path):
+    """Return Path3D from a text file with one x, y, z, b, c[, shoot, dwell, camid] row per pose."""
+    with open(path) as f:
+        rows = np.loadtxt((line.replace(',', ' ') for line in f), ndmin=2)
+
+    flags = None
+    if rows.shape[1] >= 8:
+        flags = np.zeros(len(rows), dtype=PATH3D_FLAGS_DTYPE)
+        flags['shoot'] = rows[:, 5] != 0
+        flags['dwell'] = rows[:, 6]
+        flags['camid'] = rows[:, 7]
+    return Path3D.from_arrays(rows[:, :5], flags)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render COPIS scene previews without a window.')
+    parser.add_argument('-o', '--output', help='write a PNG preview to this file')
+    parser.add_argument('--cameras', help='camera rig file, one x, y, z[, b, c] row per camera')
+    parser.add_argument('--path', action='append', default=[],
+                        help='path plan file, one x, y, z, b, c[, shoot, dwell, camid] row per pose; may be repeated')
+    parser.add_argument('--proxy', help='STL, OBJ or PLY file to use as the proxy object')
+    parser.add_argument('--size', default='800x600', help='image size as WIDTHxHEIGHT (default 800x600)')
+    parser.add_argument('--view', nargs=2, type=float, default=(30.0, 30.0), metavar=('AZIMUTH', 'ELEVATION'),
+                        help='view angles in degrees (default 30 30)')
+    parser.add_argument('--zoom', type=float, default=1.0)
+    parser.add_argument('--benchmark', type=int, metavar='FRAMES', help='time this many frames and print statistics')
+    parser.add_argument('--profile', metavar='CSV', help='write per stage benchmark timings and draw counts to a CSV file')
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    canvas = OffscreenCanvas3D(width, height)
+    if args.cameras:
+        canvas.camera3d_list = load_rig(args.cameras)
+    for path in args.path:
+        canvas.add_path(load_path(path))
+    if args.proxy:
+        canvas.proxy3d.load(args.proxy)
+    canvas.zoom = args.zoom
+    canvas.set_view(*args.view)
+
+    if args.output:
+        canvas.save_png(args.output)
+        print(f'wrote {args.output} ({width}x{height}, {len(canvas.camera3d_list)} cameras)')
+
+    if args.benchmark:
+        if args.profile:
+            canvas.profiler.enabled = True
+        times = canvas.benchmark(args.benchmark)
+        print(f'{args.benchmark} frames at {width}x{height}, {len(canvas.camera3d_list)} cameras: '
+              f'mean {times.mean():.2f} ms, median {np.median(times):.2f} ms, '
+              f'p95 {np.percentile(times, 95):.2f} ms, max {times.max():.2f} ms '
+              f'({1000.0 / times.mean():.1f} fps)')
+        if args.profile:
+            canvas.profiler.export_csv(args.profile)
+            for column, (p50, p95, p99) in canvas.profiler.percentiles().items():
+                print(f'{column:<14} p50 {p50:10.2f}  p95 {p95:10.2f}  p99 {p99:10.2f}')
+
+    canvas.destroy()
+
+
+if __name__ == '__main__':
+    main()
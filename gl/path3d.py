@@ -3,74 +3,237 @@
 
 import math
 import numpy as np
-import threading
 
-import wx
 from OpenGL.GL import *
 from OpenGL.GLU import *
+from OpenGL.arrays import vbo
 
-EVT_RESULT_ID = wx.NewId()
+from gl.profiler import count_draw
 
 
-def EVT_RESULT(win, func):
-     """Define Result Event."""
-     win.Connect(-1, -1, EVT_RESULT_ID, func)
+def interpolate_poses(poses, step):
+    """Return poses with extra linearly interpolated poses so that
+    consecutive positions are at most step apart. Original poses are kept.
+    """
+    poses = np.asarray(poses, dtype=np.float32)
+    if len(poses) < 2 or step <= 0:
+        return poses.copy()
 
+    lengths = np.linalg.norm(np.diff(poses[:, :3], axis=0), axis=1)
+    splits = np.maximum(1, np.ceil(lengths / step).astype(np.int64))
+    segment = np.repeat(np.arange(len(lengths)), splits)
+    t = (np.arange(splits.sum()) - np.repeat(np.cumsum(splits) - splits, splits)) / np.repeat(splits, splits)
+    out = poses[segment] + (poses[segment + 1] - poses[segment]) * t[:, None].astype(np.float32)
+    return np.concatenate([out, poses[-1:]])
 
-class ResultEvent(wx.PyEvent):
-    """Simple event to carry arbitrary result data."""
-    def __init__(self, data):
-        """Init Result Event."""
-        wx.PyEvent.__init__(self)
-        self.SetEventType(EVT_RESULT_ID)
-        self.data = data
 
+def validate_poses(poses, build_dimensions, margin=0.0):
+    """Return boolean mask of poses that are finite and inside the build volume.
+    build_dimensions are width, height, length and the origin offsets, as used by Bed3D.
+    """
+    poses = np.asarray(poses)
+    d = build_dimensions
+    low = np.array([-d[3], -d[4], -d[5]]) + margin
+    high = np.array([d[0] - d[3], d[1] - d[4], d[2] - d[5]]) - margin
+    xyz = poses[:, :3]
+    return np.isfinite(poses).all(axis=1) & (xyz >= low).all(axis=1) & (xyz <= high).all(axis=1)
 
-class Path3DWorker(threading.Thread):
-    def __init__(self, notify_window):
-        super().__init__(self)
-        self._notify_window = notify_window
-        self._want_abort = False
-        self.start()
 
-    def run(self):
-        if self._want_abort:
-            wx.PostEvent(self._notify_window, ResultEvent(None))
-            return
-        wx.PostEvent(self._notify_window, ResultEvent(1))
-
-    def abort(self):
-        self._want_abort = True
+# per pose flags, parallel to the (n, 5) x, y, z, b, c pose array
+PATH3D_FLAGS_DTYPE = np.dtype([
+    ('shoot', np.bool_),        # take a picture at this pose
+    ('dwell', np.float32),      # seconds to wait at this pose
+    ('camid', np.int32)])       # camera that visits this pose, -1 if unassigned
 
 
 class Path3D():
-    def __init__(self, *args, **kwargs):
-        self._path = None
-        self._path_outline = None
-        self._cameras = None
-
-        self._initialized = False
+    """Sequence of camera poses stored as one (n, 5) float32 array of
+    x, y, z, b, c, with a parallel array of PATH3D_FLAGS_DTYPE flags.
+
+    Appends are amortized O(1) by doubling capacity, and slicing a Path3D
+    returns a Path3D viewing the same memory.
+    """
+    color = (0.13, 0.39, 0.85)
+    color_shoot = (0.85, 0.33, 0.10)
+    point_size = 4.0
+
+    def __init__(self, capacity=64):
+        self._poses = np.zeros((max(1, capacity), 5), dtype=np.float32)
+        self._flags = np.zeros(max(1, capacity), dtype=PATH3D_FLAGS_DTYPE)
+        self._flags['camid'] = -1
+        self._count = 0
+
+        self._vertices = None
+        self._shots = None
+        self._shot_count = 0
+        self._dirty = True
+        # called whenever the path changes, e.g. to schedule a redraw
+        self.on_dirty = None
+        # called with the indices of poses added, e.g. to update a spatial index;
+        # poses past len(path) after a clear are gone
+        self.on_move = None
+
+    @classmethod
+    def from_arrays(cls, poses, flags=None, copy=True):
+        """Create path from (n, 5) poses and optional flags. Without copy,
+        the path views the given arrays until it has to grow.
+        """
+        path3d = cls(0)
+        poses = np.asarray(poses, dtype=np.float32).reshape(-1, 5)
+        if flags is None:
+            flags = np.zeros(len(poses), dtype=PATH3D_FLAGS_DTYPE)
+            flags['shoot'] = True
+            flags['camid'] = -1
+        path3d._poses = poses.copy() if copy else poses
+        path3d._flags = flags.copy() if copy else flags
+        path3d._count = len(poses)
+        return path3d
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return Path3D.from_arrays(self.poses[key], self.flags[key], copy=False)
+        return self.poses[key], self.flags[key]
+
+    def _reserve(self, count):
+        if count <= len(self._poses):
+            return
+        capacity = max(count, 2 * len(self._poses))
+        poses = np.zeros((capacity, 5), dtype=np.float32)
+        flags = np.zeros(capacity, dtype=PATH3D_FLAGS_DTYPE)
+        flags['camid'] = -1
+        poses[:self._count] = self._poses[:self._count]
+        flags[:self._count] = self._flags[:self._count]
+        self._poses = poses
+        self._flags = flags
+
+    def append(self, pose, shoot=True, dwell=0.0, camid=-1):
+        """Append an x, y, z, b, c pose."""
+        self._reserve(self._count + 1)
+        self._poses[self._count] = pose
+        self._flags[self._count] = (shoot, dwell, camid)
+        self._count += 1
+        self.dirty = True
+        if self.on_move is not None:
+            self.on_move([self._count - 1])
+
+    def extend(self, poses, flags=None):
+        """Append (n, 5) poses, with flags defaulting to shoot and unassigned."""
+        poses = np.asarray(poses, dtype=np.float32).reshape(-1, 5)
+        n = len(poses)
+        self._reserve(self._count + n)
+        self._poses[self._count:self._count + n] = poses
+        if flags is None:
+            self._flags[self._count:self._count + n] = (True, 0.0, -1)
+        else:
+            self._flags[self._count:self._count + n] = flags
+        self._count += n
+        self.dirty = True
+        if self.on_move is not None:
+            self.on_move(range(self._count - n, self._count))
+
+    def clear(self):
+        self._count = 0
+        self.dirty = True
+        if self.on_move is not None:
+            self.on_move([])
 
     def init(self):
-        return
+        """Upload poses and shot indices into VBOs if the path changed."""
+        if not self._dirty and self._vertices is not None:
+            return True
+
+        poses = np.ascontiguousarray(self.poses)
+        shots = np.flatnonzero(self.flags['shoot']).astype(np.uint32)
+        if self._vertices is None:
+            self._vertices = vbo.VBO(poses)
+            self._shots = vbo.VBO(shots, target=GL_ELEMENT_ARRAY_BUFFER)
+        else:
+            self._vertices.set_array(poses)
+            self._shots.set_array(shots)
+        self._shot_count = len(shots)
+        self._dirty = False
+        return True
 
     def render(self):
-        return
+        """Render path as one polyline, with a point at every shot."""
+        if self._count == 0 or not self.init():
+            return
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        self._vertices.bind()
+        # x, y, z are the first three of the five floats of each pose
+        glVertexPointer(3, GL_FLOAT, self._poses.itemsize * 5, self._vertices)
 
-    def attach_camera(self):
-        return
+        glColor3f(*self.color)
+        glDrawArrays(GL_LINE_STRIP, 0, self._count)
+        count_draw(self._count)
+
+        if self._shot_count:
+            glPointSize(self.point_size)
+            glColor3f(*self.color_shoot)
+            self._shots.bind()
+            glDrawElements(GL_POINTS, self._shot_count, GL_UNSIGNED_INT, self._shots)
+            count_draw(self._shot_count)
+            self._shots.unbind()
+            glPointSize(1.0)
+
+        self._vertices.unbind()
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def attach_camera(self, camid, indices=slice(None)):
+        """Assign camera to the given poses, all poses by default."""
+        self.flags['camid'][indices] = camid
+        self.dirty = True
 
     def detach_camera(self, id):
-        return
+        """Unassign camera from all of its poses."""
+        flags = self.flags
+        flags['camid'][flags['camid'] == id] = -1
+        self.dirty = True
 
     def detach_all_cameras(self):
-        return
+        self.flags['camid'] = -1
+        self.dirty = True
 
     def has_path(self):
-        return not self._path is None
-
-    def add_point(self, *args):
-        return
-
-    def __delete__(self, _):
-        return
+        return self._count > 0
+
+    def add_point(self, x, y, z, b=0.0, c=0.0, shoot=True, dwell=0.0, camid=-1):
+        self.append((x, y, z, b, c), shoot, dwell, camid)
+
+    @property
+    def poses(self):
+        """Return (n, 5) x, y, z, b, c view of the path."""
+        return self._poses[:self._count]
+
+    @property
+    def flags(self):
+        return self._flags[:self._count]
+
+    @property
+    def cameras(self):
+        """Return sorted ids of cameras assigned to any pose."""
+        camids = np.unique(self.flags['camid'])
+        return camids[camids >= 0].tolist()
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    @dirty.setter
+    def dirty(self, value):
+        self._dirty = value
+        if value and self.on_dirty is not None:
+            self.on_dirty()
+
+    def delete(self):
+        """Free GPU buffers. They are uploaded again on next render."""
+        for buffer in (self._vertices, self._shots):
+            if buffer is not None:
+                buffer.delete()
+        self._vertices = None
+        self._shots = None
+        self._dirty = True
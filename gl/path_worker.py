@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Path3DWorker class.
+
+Runs path and mesh computations on a thread pool and posts their results to a
+wx window as ResultEvents. Kept apart from gl.path3d, so that rendering paths
+does not need wx, e.g. in the headless gl.offscreen renderer.
+"""
+
+import itertools
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import wx
+
+from gl.path3d import interpolate_poses
+
+EVT_RESULT_ID = wx.NewId()
+
+
+def EVT_RESULT(win, func):
+     """Define Result Event."""
+     win.Connect(-1, -1, EVT_RESULT_ID, func)
+
+
+class ResultEvent(wx.PyEvent):
+    """Simple event to carry arbitrary result data."""
+    def __init__(self, data):
+        """Init Result Event."""
+        wx.PyEvent.__init__(self)
+        self.SetEventType(EVT_RESULT_ID)
+        self.data = data
+
+
+class PathResult():
+    """Result of one chunk of a Path3DWorker job, carried by ResultEvent.data.
+    Chunks may arrive in any order; done is set on the last one to arrive,
+    and cancelled is set instead of data when the job was cancelled.
+    """
+
+    def __init__(self, job, index, count, data=None, done=False, cancelled=False, error=None):
+        self.job = job
+        self.index = index
+        self.count = count
+        self.data = data
+        self.done = done
+        self.cancelled = cancelled
+        self.error = error
+
+
+class Path3DWorker():
+    """Thread pool computing path geometry off the UI thread.
+
+    A job maps a function over chunks of work, and each chunk result is posted
+    to notify_window as soon as it is ready, as a ResultEvent whose data is a
+    PathResult. NumPy releases the GIL in its array loops, so chunks of
+    vectorized work run in parallel on threads without pickling.
+    """
+
+    def __init__(self, notify_window, max_workers=None):
+        self._notify_window = notify_window
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self._jobs = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, func, chunks, *args):
+        """Run func(chunk, *args) for every chunk and return the job id."""
+        chunks = list(chunks)
+        job = next(self._job_ids)
+        cancel = threading.Event()
+        with self._lock:
+            self._jobs[job] = [cancel, len(chunks)]
+        for index, chunk in enumerate(chunks):
+            self._executor.submit(self._run, job, index, len(chunks), cancel, func, chunk, args)
+        if not chunks:
+            self._finish(job, PathResult(job, 0, 0))
+        return job
+
+    def map_poses(self, func, poses, *args, chunk_size=4096):
+        """Run func(poses[i:i + chunk_size], *args) over an (n, 5) pose array."""
+        return self.submit(func, (poses[i:i + chunk_size] for i in range(0, len(poses), chunk_size)), *args)
+
+    def interpolate(self, poses, step, chunk_size=4096):
+        """Densify poses with interpolate_poses in chunks. Chunk results
+        concatenated in index order equal interpolate_poses(poses, step).
+        """
+        n = len(poses)
+        chunks = [(poses[i:min(i + chunk_size, n - 1) + 1], i + chunk_size >= n - 1)
+                  for i in range(0, max(n - 1, 1), chunk_size)]
+        return self.submit(_interpolate_chunk, chunks, step)
+
+    def _run(self, job, index, count, cancel, func, chunk, args):
+        if cancel.is_set():
+            return
+        try:
+            result = PathResult(job, index, count, data=func(chunk, *args))
+        except Exception as e:
+            result = PathResult(job, index, count, error=e)
+            cancel.set()
+        if cancel.is_set() and result.error is None:
+            return
+        self._finish(job, result)
+
+    def _finish(self, job, result):
+        with self._lock:
+            state = self._jobs.get(job)
+            if state is None:
+                return
+            state[1] -= 1
+            if state[1] <= 0 or result.error is not None:
+                result.done = True
+                del self._jobs[job]
+        wx.PostEvent(self._notify_window, ResultEvent(result))
+
+    def cancel(self, job):
+        """Stop a job. Chunks already running finish but are not posted."""
+        with self._lock:
+            state = self._jobs.pop(job, None)
+        if state is None:
+            return
+        state[0].set()
+        wx.PostEvent(self._notify_window, ResultEvent(PathResult(job, -1, 0, done=True, cancelled=True)))
+
+    def abort(self):
+        """Cancel all jobs."""
+        for job in list(self._jobs):
+            self.cancel(job)
+
+    def shutdown(self):
+        self.abort()
+        self._executor.shutdown(wait=False)
+
+    @property
+    def busy(self):
+        return bool(self._jobs)
+
+
+def _interpolate_chunk(chunk, step):
+    poses, last = chunk
+    poses = interpolate_poses(poses, step)
+    # the last pose of a chunk is the first pose of the next
+    return poses if last else poses[:-1]
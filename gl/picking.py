@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""PickingBuffer class."""
+
+import numpy as np
+
+from OpenGL.GL import *
+
+
+def encode_ids(count):
+    """Return (count, 4) RGBA bytes encoding ids 1..count, 0 being background."""
+    colors = np.arange(1, count + 1, dtype='<u4').view(np.uint8).reshape(count, 4).copy()
+    colors[:, 3] = 255
+    return colors
+
+
+def decode_ids(pixels):
+    """Return integer ids from an array of RGBA pixels, -1 for background."""
+    pixels = pixels.astype(np.int32)
+    return (pixels[..., 0] | (pixels[..., 1] << 8) | (pixels[..., 2] << 16)) - 1
+
+
+class PickingBuffer():
+    """Offscreen render target holding a 24-bit object id per pixel.
+
+    The id pass is rendered lazily on the first pick after the scene changes and
+    read back once, so single picks and marquee selections are array lookups.
+    """
+
+    def __init__(self):
+        self._fbo = None
+        self._color_rb = None
+        self._depth_rb = None
+        self._width = 0
+        self._height = 0
+        self._ids = None
+        self._dirty = True
+
+    def _resize(self, width, height):
+        if self._fbo is not None and (width, height) == (self._width, self._height):
+            return True
+
+        if not glGenFramebuffers:
+            return False
+
+        self._delete()
+        self._fbo = glGenFramebuffers(1)
+        self._color_rb, self._depth_rb = glGenRenderbuffers(2)
+        glBindFramebuffer(GL_FRAMEBUFFER, self._fbo)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self._color_rb)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self._color_rb)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self._depth_rb)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self._depth_rb)
+
+        complete = glCheckFramebufferStatus(GL_FRAMEBUFFER) == GL_FRAMEBUFFER_COMPLETE
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if not complete:
+            self._delete()
+            return False
+
+        self._width, self._height = width, height
+        return True
+
+    def update(self, width, height, render_ids):
+        """Render the id pass if the scene changed since the last one.
+        render_ids is called with the id target bound and cleared to id -1.
+        Falls back to the back buffer if framebuffer objects are unavailable,
+        in which case True is returned and the caller must redraw the frame.
+        """
+        if not self._dirty and self._ids is not None and self._ids.shape == (height, width):
+            return False
+
+        offscreen = self._resize(width, height)
+        if offscreen:
+            glBindFramebuffer(GL_FRAMEBUFFER, self._fbo)
+
+        glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT)
+        glDisable(GL_BLEND)
+        glDisable(GL_DITHER)
+        glDisable(GL_LINE_SMOOTH)
+        glDisable(GL_MULTISAMPLE)
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        render_ids()
+
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+        glPopAttrib()
+        if offscreen:
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        # flip rows so that ids are indexed by window coordinates
+        pixels = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 4)[::-1]
+        self._ids = decode_ids(pixels)
+        self._dirty = False
+        return not offscreen
+
+    def pick(self, x, y):
+        """Return id at window position, or -1 if nothing was hit."""
+        if self._ids is None:
+            return -1
+        height, width = self._ids.shape
+        if not (0 <= x < width and 0 <= y < height):
+            return -1
+        return int(self._ids[y, x])
+
+    def pick_rect(self, x0, y0, x1, y1):
+        """Return sorted unique ids visible inside a window rectangle."""
+        if self._ids is None:
+            return []
+        x0, x1 = sorted((max(0, x0), max(0, x1)))
+        y0, y1 = sorted((max(0, y0), max(0, y1)))
+        ids = np.unique(self._ids[y0:y1 + 1, x0:x1 + 1])
+        return ids[ids >= 0].tolist()
+
+    def _delete(self):
+        if self._fbo is not None:
+            glDeleteFramebuffers(1, [self._fbo])
+            glDeleteRenderbuffers(2, [self._color_rb, self._depth_rb])
+        self._fbo = None
+        self._color_rb = None
+        self._depth_rb = None
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    @dirty.setter
+    def dirty(self, value):
+        self._dirty = value
+
+    def delete(self):
+        """Free the framebuffer. Call with the context current."""
+        self._delete()
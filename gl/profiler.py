@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""FrameProfiler class and draw call counters."""
+
+import csv
+import time
+import numpy as np
+
+from contextlib import contextmanager
+
+from OpenGL.GL import *
+
+# render stages timed per frame, in render order
+STAGES = ('background', 'objects', 'cameras', 'paths')
+
+
+class _DrawCounter():
+    def __init__(self):
+        self.calls = 0
+        self.vertices = 0
+
+    def reset(self):
+        self.calls = 0
+        self.vertices = 0
+
+
+_counter = _DrawCounter()
+
+
+def count_draw(vertices, instances=1):
+    """Record one draw call of vertices, repeated for instances."""
+    _counter.calls += 1
+    _counter.vertices += vertices * instances
+
+
+class FrameProfiler():
+    """Per stage frame times and draw call counts over a rolling window of frames.
+
+    With sync, glFinish is called at each stage boundary so that GPU work is
+    attributed to the stage that issued it, at the cost of stalling the pipeline.
+    """
+    columns = tuple(f'{stage}_ms' for stage in STAGES) + ('frame_ms', 'draw_calls', 'vertices')
+    # frames between overlay text updates
+    overlay_interval = 15
+
+    def __init__(self, window=600, sync=True):
+        self._window = window
+        self._sync = sync
+        self._enabled = False
+        self._overlay = False
+        self._rows = np.zeros((window, len(self.columns)))
+        self._count = 0
+        self._current = np.zeros(len(self.columns))
+        self._frame_start = 0.0
+        self._overlay_image = None
+        self._overlay_count = -1
+
+    def begin_frame(self):
+        if not self._enabled:
+            return
+
+        if self._sync:
+            glFinish()
+        _counter.reset()
+        self._current[:] = 0.0
+        self._frame_start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of a with block as one render stage."""
+        if not self._enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        yield
+        if self._sync:
+            glFinish()
+        self._current[STAGES.index(name)] += (time.perf_counter() - start) * 1000.0
+
+    def end_frame(self):
+        if not self._enabled:
+            return
+
+        n = len(STAGES)
+        self._current[n] = (time.perf_counter() - self._frame_start) * 1000.0
+        self._current[n + 1] = _counter.calls
+        self._current[n + 2] = _counter.vertices
+        self._rows[self._count % self._window] = self._current
+        self._count += 1
+
+    def history(self):
+        """Return recorded rows of the rolling window, oldest first."""
+        if self._count <= self._window:
+            return self._rows[:self._count].copy()
+        start = self._count % self._window
+        return np.concatenate([self._rows[start:], self._rows[:start]])
+
+    def percentiles(self, q=(50, 95, 99)):
+        """Return {column: values at percentiles q} over the rolling window."""
+        rows = self.history()
+        if len(rows) == 0:
+            return {}
+        values = np.percentile(rows, q, axis=0)
+        return {column: values[:, i] for i, column in enumerate(self.columns)}
+
+    def export_csv(self, path):
+        """Write the rolling window to a CSV file, one row per frame."""
+        rows = self.history()
+        first = self._count - len(rows)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('frame',) + self.columns)
+            for i, row in enumerate(rows):
+                writer.writerow([first + i] + [f'{v:.4f}' for v in row[:len(STAGES) + 1]] +
+                                [int(v) for v in row[len(STAGES) + 1:]])
+
+    def clear(self):
+        self._count = 0
+        self._overlay_count = -1
+
+    def render_overlay(self, width, height):
+        """Draw p50 and p95 stage times and draw counts in the top left corner."""
+        if not self._overlay or self._count == 0:
+            return
+
+        if self._overlay_image is None or self._count - self._overlay_count >= self.overlay_interval:
+            self._overlay_image = self._create_overlay_image()
+            self._overlay_count = self._count
+
+        image = self._overlay_image
+        glPushAttrib(GL_ENABLE_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glWindowPos2i(8, max(0, height - image.shape[0] - 8))
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glDrawPixels(image.shape[1], image.shape[0], GL_RGBA, GL_UNSIGNED_BYTE, image)
+        glPopAttrib()
+
+    def _create_overlay_image(self):
+        from PIL import Image, ImageDraw, ImageFont
+
+        stats = self.percentiles((50, 95))
+        lines = [f'{"stage":<10} {"p50":>7} {"p95":>7} ms']
+        for stage in STAGES + ('frame',):
+            p50, p95 = stats[f'{stage}_ms']
+            lines.append(f'{stage:<10} {p50:7.2f} {p95:7.2f}')
+        lines.append(f'draw calls {stats["draw_calls"][0]:.0f}, vertices {stats["vertices"][0]:.0f}')
+        text = '\n'.join(lines)
+
+        font = ImageFont.load_default()
+        draw = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+        if hasattr(draw, 'multiline_textbbox'):
+            _, _, w, h = draw.multiline_textbbox((0, 0), text, font=font)
+        else:
+            w, h = draw.multiline_textsize(text, font=font)
+
+        image = Image.new('RGBA', (w + 8, h + 8), (255, 255, 255, 200))
+        ImageDraw.Draw(image).multiline_text((4, 4), text, font=font, fill=(0, 0, 0, 255))
+        # glDrawPixels starts at the bottom row
+        return np.ascontiguousarray(np.asarray(image)[::-1])
+
+    @property
+    def frames(self):
+        return self._count
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+
+    @property
+    def overlay(self):
+        return self._overlay
+
+    @overlay.setter
+    def overlay(self, value):
+        self._overlay = value
+        if value:
+            self._enabled = True
+
+    @property
+    def sync(self):
+        return self._sync
+
+    @sync.setter
+    def sync(self, value):
+        self._sync = value
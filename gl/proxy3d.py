@@ -1,102 +1,114 @@
 #!/usr/bin/env python3
 """Proxy3D class."""
 
+import numpy as np
+from scipy.spatial import cKDTree
+
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from gl.mesh3d import Mesh3D, get_mesh
+from gl.mesh_loader import build_lod_chain, load_mesh
+
 
 class Proxy3D():
+    # number of slices and stacks for curved styles
+    slices = 32
+
     def __init__(self, style, dimensions, color):
         self._style = style
+        self._color = color
+        self._path = None
+        self._lods = []
+        self._surface = None
+        self._scale = 100
+        self._interactive = False
 
         if self._style == 'Sphere':
-            self._quadric = gluNewQuadric()
-
             self._radius = dimensions[0]
-            self._color = color
 
         elif self._style == 'Cylinder':
-            self._quadric = gluNewQuadric()
             self._radius = dimensions[0]
             self._height = dimensions[1]
-            self._color = color
 
         elif self._style == 'Cube':
             self._width = dimensions[0]
             self._length = dimensions[1]
             self._height = dimensions[2]
-            self._color = color
+
+        elif self._style == 'Mesh':
+            self._scale = dimensions[0]
+
+    def load(self, path):
+        """Load an STL, OBJ or PLY file as the proxy mesh and switch to the Mesh style.
+        Blocks while loading, use load_levels on a worker thread for large files.
+        """
+        self.set_levels(load_levels(path), path)
+
+    def set_levels(self, levels, path=None):
+        """Use (vertices, indices) levels from load_levels as the proxy mesh
+        and switch to the Mesh style. Call on the UI thread.
+        """
+        for mesh in self._lods:
+            mesh.delete()
+        self._lods = [Mesh3D(v, i) for v, i in levels]
+        self._surface = None
+        self._path = path
+        self.style = 'Mesh'
+
+    def delete(self):
+        """Free GPU buffers of the mesh levels. Call with the context current."""
+        for mesh in self._lods:
+            mesh.delete()
 
     def render(self):
-        if self._style == 'Sphere':
-            glColor3ub(*self._color)
-            gluSphere(self._quadric, self._radius, 32, 32)
+        if self._style == 'Mesh':
+            self._render_mesh()
+            return
 
-        elif self._style == 'Cylinder':
-            glColor3ub(*self._color)
-            glTranslate(0.0, 0.0, self._height / -2)
-            gluCylinder(self._quadric, self._radius, self._radius, self._height, 32, 4)
+        # looked up every frame, the cache may free meshes it evicts
+        glColor3ub(*self._color)
+        get_mesh(self._style, self.dimensions, self.slices).render()
 
-            disk_quad = gluNewQuadric()
-            gluQuadricOrientation(disk_quad, GLU_INSIDE)
-            gluDisk(disk_quad, 0.0, self._radius, 32, 1)
-            gluDeleteQuadric(disk_quad)
+    def _render_mesh(self):
+        if not self._lods:
+            return
 
-            glPushMatrix()
+        # the coarsest level keeps dragging the view responsive
+        mesh = self._lods[-1] if self._interactive else self._lods[0]
+        scale = self._scale / 100.0
 
-            glTranslate(0.0, 0.0, self._height, )
-            disk_quad2 = gluNewQuadric()
-            gluQuadricOrientation(disk_quad2, GLU_OUTSIDE)
-            gluDisk(disk_quad2, 0.0, self._radius, 32, 1)
-            gluDeleteQuadric(disk_quad2)
+        glColor3ub(*self._color)
+        glPushMatrix()
+        glScalef(scale, scale, scale)
+        mesh.render()
+        glPopMatrix()
 
-            glPopMatrix()
+    def distance(self, points):
+        """Return the distance from (..., 3) points to the proxy surface,
+        negative inside. Meshes use the finest level of detail.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if self._style == 'Sphere':
+            return np.linalg.norm(points, axis=-1) - self._radius
 
-        elif self._style == 'Cube':
-            hw = self._width / 2
-            hl = self._length / 2
-            hh = self._height / 2
-
-            glBegin(GL_QUADS)
-
-            # Bottom
-            glColor3ub(*self._color)
-            glVertex3f(-hw, -hh, -hl)
-            glVertex3f( hw, -hh, -hl)
-            glVertex3f( hw, -hh,  hl)
-            glVertex3f(-hw, -hh,  hl)
-
-            # Top
-            glVertex3f(-hw, hh, hl)
-            glVertex3f(hw, hh, hl)
-            glVertex3f(hw, hh, -hl)
-            glVertex3f(-hw, hh, -hl)
-
-            # Back
-            glVertex3f(-hw,  hh, -hl)
-            glVertex3f( hw,  hh, -hl)
-            glVertex3f( hw, -hh, -hl)
-            glVertex3f(-hw, -hh, -hl)
-
-            # Front
-            glVertex3f(-hw, -hh, hl)
-            glVertex3f( hw, -hh, hl)
-            glVertex3f( hw,  hh, hl)
-            glVertex3f(-hw,  hh, hl)
-
-            # Right
-            glVertex3f( hw,  hh, -hl)
-            glVertex3f( hw,  hh,  hl)
-            glVertex3f( hw, -hh,  hl)
-            glVertex3f( hw, -hh, -hl)
-
-            # Left
-            glVertex3f(-hw, -hh, -hl)
-            glVertex3f(-hw, -hh,  hl)
-            glVertex3f(-hw,  hh,  hl)
-            glVertex3f(-hw,  hh, -hl)
-
-            glEnd()
+        if self._style == 'Cylinder':
+            # along z and centered at the origin, like the rendered mesh
+            q = np.stack([np.hypot(points[..., 0], points[..., 1]) - self._radius,
+                          np.abs(points[..., 2]) - self._height / 2], axis=-1)
+            return _box_distance(q)
+
+        if self._style == 'Cube':
+            half = np.array([self._width, self._height, self._length]) / 2
+            return _box_distance(np.abs(points) - half)
+
+        if self._style == 'Mesh' and self._lods:
+            if self._surface is None:
+                self._surface = _Surface(self._lods[0].vertices, self._lods[0].indices.reshape(-1, 3))
+            scale = self._scale / 100.0
+            return self._surface.distance(points / scale) * scale
+
+        return np.full(points.shape[:-1], np.inf)
 
     @property
     def style(self):
@@ -114,6 +126,22 @@ class Proxy3D():
     def color(self, value):
         self._color = value
 
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def lod_count(self):
+        return len(self._lods)
+
+    @property
+    def interactive(self):
+        return self._interactive
+
+    @interactive.setter
+    def interactive(self, value):
+        self._interactive = value
+
     @property
     def dimensions(self):
         if self._style == 'Sphere':
@@ -122,6 +150,8 @@ class Proxy3D():
             return [self._radius, self._height]
         elif self._style == 'Cube':
             return [self._width, self._length, self._height]
+        elif self._style == 'Mesh':
+            return [self._scale]
 
     @dimensions.setter
     def dimensions(self, value):
@@ -134,3 +164,126 @@ class Proxy3D():
             self._width = value[0]
             self._length = value[1]
             self._height = value[2]
+        elif self._style == 'Mesh':
+            self._scale = value[0]
+
+
+def load_levels(path):
+    """Load a mesh file centered at the origin and split into levels of detail.
+    Does not touch OpenGL, so it may run on a worker thread.
+    """
+    vertices, indices = load_mesh(path)
+    if len(indices) == 0:
+        raise ValueError(f'"{path}" contains no triangles')
+
+    vertices = vertices - (vertices.min(axis=0) + vertices.max(axis=0)) / 2
+    return build_lod_chain(vertices, indices)
+
+
+class _Surface():
+    """Signed distance to a triangle mesh.
+
+    Candidate triangles of a point are the ones with the nearest centroids.
+    A triangle outside the candidates is at least the distance to the farthest
+    candidate centroid minus the largest centroid to corner distance away, so
+    points where that bound does not rule out a closer triangle search a ball
+    instead. The sign comes from the normals of the triangles sharing the
+    closest point, weighted by their angle there when it is a corner, which is
+    exact for closed meshes.
+    """
+    candidates = 16
+    block = 4096
+
+    def __init__(self, vertices, indices):
+        self._triangles = np.asarray(vertices, dtype=np.float64)[indices]
+        centroids = self._triangles.mean(axis=1)
+        self._reach = np.linalg.norm(self._triangles - centroids[:, None], axis=2).max()
+        self._tree = cKDTree(centroids)
+        self._k = min(self.candidates, len(centroids))
+
+    def distance(self, points):
+        """Return signed distances of (..., 3) points, negative inside."""
+        flat = points.reshape(-1, 3)
+        out = np.empty(len(flat))
+        for start in range(0, len(flat), self.block):
+            p = flat[start:start + self.block]
+            bound, nearest = self._tree.query(p, self._k)
+            bound, nearest = bound.reshape(len(p), -1), nearest.reshape(len(p), -1)
+            distance = self._signed(p, nearest)
+            if self._k == len(self._triangles):
+                out[start:start + len(p)] = distance
+                continue
+            for i in np.flatnonzero(np.abs(distance) > bound[:, -1] - self._reach):
+                ball = self._tree.query_ball_point(p[i], abs(distance[i]) + self._reach)
+                if ball:
+                    distance[i] = self._signed(p[i:i + 1], np.array([ball]))[0]
+            out[start:start + len(p)] = distance
+        return out.reshape(points.shape[:-1])
+
+    def _signed(self, p, candidates):
+        """Return the signed distance of (m, 3) points to their (m, k) candidate triangles."""
+        triangles = self._triangles[candidates]
+        a, b, c = triangles[..., 0, :], triangles[..., 1, :], triangles[..., 2, :]
+        closest, corner = _closest_points(p[:, None], a, b, c)
+        offset = p[:, None] - closest
+        distance = np.linalg.norm(offset, axis=-1)
+        nearest = distance.min(axis=1)
+
+        # triangles sharing the closest point, e.g. across an edge or around a corner
+        tied = distance <= nearest[:, None] * (1.0 + 1e-9) + 1e-12
+        normal = np.cross(b - a, c - a)
+        normal /= np.maximum(np.linalg.norm(normal, axis=-1, keepdims=True), 1e-300)
+        weight = np.ones(distance.shape)
+        for k in range(3):
+            at = corner == k
+            if at.any():
+                u, v = (triangles[..., (k + 1) % 3, :] - triangles[..., k, :]), \
+                    (triangles[..., (k + 2) % 3, :] - triangles[..., k, :])
+                cos = (u * v).sum(-1) / np.maximum(np.linalg.norm(u, axis=-1) * np.linalg.norm(v, axis=-1), 1e-300)
+                weight[at] = np.arccos(np.clip(cos[at], -1.0, 1.0))
+        side = (tied * weight * (offset * normal).sum(-1)).sum(axis=1)
+        return np.where(side < 0, -nearest, nearest)
+
+
+def _closest_points(p, a, b, c):
+    """Return the closest points on triangles abc to p, and the corner index
+    0, 1 or 2 where the closest point is a corner, else -1.
+    """
+    ab, ac = b - a, c - a
+    ap, bp, cp = p - a, p - b, p - c
+    d1, d2 = (ab * ap).sum(-1), (ac * ap).sum(-1)
+    d3, d4 = (ab * bp).sum(-1), (ac * bp).sum(-1)
+    d5, d6 = (ab * cp).sum(-1), (ac * cp).sum(-1)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # barycentric weights of b and c, by region from the lowest priority up
+        v, w = vb / (va + vb + vc), vc / (va + vb + vc)
+        e = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        region = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        v, w = np.where(region, 1.0 - e, v), np.where(region, e, w)
+        region = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        v, w = np.where(region, 0.0, v), np.where(region, d2 / (d2 - d6), w)
+        region = (d6 >= 0) & (d5 <= d6)
+        v, w = np.where(region, 0.0, v), np.where(region, 1.0, w)
+        region = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        v, w = np.where(region, d1 / (d1 - d3), v), np.where(region, 0.0, w)
+        region = (d3 >= 0) & (d4 <= d3)
+        v, w = np.where(region, 1.0, v), np.where(region, 0.0, w)
+        region = (d1 <= 0) & (d2 <= 0)
+        v, w = np.where(region, 0.0, v), np.where(region, 0.0, w)
+    # degenerate triangles
+    v, w = np.nan_to_num(v), np.nan_to_num(w)
+
+    corner = np.full(v.shape, -1)
+    corner[(v == 0) & (w == 0)] = 0
+    corner[(v == 1) & (w == 0)] = 1
+    corner[(v == 0) & (w == 1)] = 2
+    return a + v[..., None] * ab + w[..., None] * ac, corner
+
+
+def _box_distance(q):
+    """Return signed distance to a box from per axis distances q to its faces."""
+    outside = np.linalg.norm(np.maximum(q, 0.0), axis=-1)
+    inside = np.minimum(q.max(axis=-1), 0.0)
+    return outside + inside
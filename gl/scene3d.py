@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""Scene3D class."""
+
+import math
+import numpy as np
+from functools import partial
+
+from threading import Lock
+
+from OpenGL.GL import *
+from OpenGL.GLU import *
+
+from gl.glhelper import clear_line_strip_cache, quat_to_matrix4
+from gl.camera3d import Camera3DArray, Camera3DBatch
+from gl.bed3d import Bed3D
+from gl.mesh3d import clear_mesh_cache
+from gl.proxy3d import Proxy3D
+from gl.picking import PickingBuffer
+from gl.profiler import FrameProfiler
+from util.camera_registry import CameraRegistry
+from util.spatial_index import GridIndex
+
+
+class Scene3D():
+    """Scene contents and render pipeline shared by all render targets.
+
+    Subclasses provide the OpenGL context and decide where frames go, e.g. a
+    wx GLCanvas window or an offscreen buffer. Nothing here depends on wx.
+    """
+    color_background = (0.941, 0.941, 0.941, 1)
+    zoom_min = 0.1
+    zoom_max = 7.0
+    color_marquee = (0.2, 0.2, 0.2, 1)
+
+    def __init__(self, build_dimensions=None, axes=True, bounding_box=True, every=100, subdivisions=10):
+        self._gl_initialized = False
+        self._dirty = False # dirty flag to track when we need to re-render the canvas
+        self._width = None
+        self._height = None
+        if build_dimensions:
+            self._build_dimensions = build_dimensions
+        else:
+            self._build_dimensions = [400, 400, 400, 200, 200, 200]
+        self._dist = 0.5 * (self._build_dimensions[1] + max(self._build_dimensions[0], self._build_dimensions[2]))
+
+        self._bed3d = Bed3D(self._build_dimensions, axes, bounding_box, every, subdivisions)
+        self._proxy3d = Proxy3D('Sphere', [50], (0, 53, 107))
+        self._camera3d_list = []
+        self._camera_registry = CameraRegistry()
+        self._camera3d_array = Camera3DArray()
+        self._camera3d_array.on_dirty = self._invalidate
+        self._camera3d_array.on_move = self._on_cameras_moved
+        # camera positions keyed by Camera3D, and path poses keyed by (Path3D, pose index)
+        self._camera_index = GridIndex()
+        self._pose_index = GridIndex()
+        # number of poses of each path in the pose index
+        self._pose_counts = {}
+        self._camera3d_batch = None
+        self._picking = PickingBuffer()
+        self._profiler = FrameProfiler()
+        self._marquee = None
+        self._path3d_list = []
+        self._camera3d_scale = 100
+
+        self._quadric = None
+        self._zoom = 1
+        self._rot_quat = [0.0, 0.0, 0.0, 1.0]
+        self._rot_lock = Lock()
+        self._angle_z = 0
+        self._angle_x = 0
+
+    def init_opengl(self):
+        """Initialize OpenGL."""
+        if self._gl_initialized:
+            return True
+
+        if self._context is None:
+            return False
+
+        self._quadric = gluNewQuadric()
+
+        glClearColor(*self.color_background)
+        glClearDepth(1.0)
+
+        glDepthFunc(GL_LESS)
+
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_CULL_FACE)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        # set antialiasing
+        glEnable(GL_LINE_SMOOTH)
+
+        glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
+        glEnable(GL_COLOR_MATERIAL)
+        glEnable(GL_MULTISAMPLE)
+
+        if not self._bed3d.init():
+            return
+
+        self._camera3d_batch = Camera3DBatch()
+        self._camera3d_batch.init()
+        self._camera3d_array.dirty = True
+
+        self._gl_initialized = True
+        return True
+
+    def delete_gl_objects(self):
+        """Free everything uploaded to the GPU. Call with the context current,
+        before it is destroyed.
+        """
+        if not self._gl_initialized:
+            return
+
+        self._bed3d.delete()
+        self._proxy3d.delete()
+        if self._camera3d_batch is not None:
+            self._camera3d_batch.delete()
+            self._camera3d_batch = None
+        self._picking.delete()
+        for path3d in self._path3d_list:
+            path3d.delete()
+        clear_mesh_cache()
+        clear_line_strip_cache()
+        if self._quadric is not None:
+            gluDeleteQuadric(self._quadric)
+            self._quadric = None
+        self._gl_initialized = False
+
+    def render_frame(self, width, height):
+        """Render the scene into the current framebuffer."""
+        glViewport(0, 0, width, height)
+        self._width = max(10, width)
+        self._height = max(10, height)
+
+        self.apply_view_matrix()
+        self.apply_projection()
+
+        profiler = self._profiler
+        profiler.begin_frame()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        with profiler.stage('background'):
+            self._render_background()
+        with profiler.stage('objects'):
+            self._render_objects()
+        with profiler.stage('cameras'):
+            self._render_cameras()
+        with profiler.stage('paths'):
+            self._render_paths()
+        profiler.end_frame()
+
+        self._render_marquee()
+        profiler.render_overlay(width, height)
+
+    def _invalidate(self):
+        """Mark the scene dirty."""
+        self._dirty = True
+
+    def _on_cameras_moved(self, indices):
+        data = self._camera3d_array.data[indices]
+        cameras = self._camera3d_array.cameras
+        rows = np.arange(len(cameras))[indices]
+        self._camera_index.insert_many([cameras[i] for i in rows],
+                                       np.column_stack([data['x'], data['y'], data['z']]))
+
+    def _render_background(self):
+        glClearColor(*self.color_background)
+
+    def _render_objects(self):
+        if self._bed3d is not None:
+            self._bed3d.render()
+
+        if self._proxy3d is not None:
+            self._proxy3d.render()
+
+    def _update_cameras(self):
+        if self._camera3d_array.dirty:
+            self._camera3d_batch.update(self._camera3d_array.data)
+            self._camera3d_array.dirty = False
+
+    def _render_cameras(self):
+        if self._camera3d_batch is None:
+            return
+
+        self._update_cameras()
+        self._camera3d_batch.render()
+
+    def _render_paths(self):
+        for path3d in self._path3d_list:
+            path3d.render()
+
+    def _render_marquee(self):
+        if self._marquee is None:
+            return
+
+        x0, y0, x1, y1 = self._marquee
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, self._width, self._height, 0, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glDisable(GL_DEPTH_TEST)
+
+        glColor4f(*self.color_marquee)
+        glBegin(GL_LINE_LOOP)
+        glVertex2f(x0, y0)
+        glVertex2f(x1, y0)
+        glVertex2f(x1, y1)
+        glVertex2f(x0, y1)
+        glEnd()
+
+        glEnable(GL_DEPTH_TEST)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+
+    # ------------------
+    # Accessor functions
+    # ------------------
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    @dirty.setter
+    def dirty(self, value):
+        if value:
+            self._invalidate()
+        else:
+            self._dirty = False
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @property
+    def bed3d(self):
+        return self._bed3d
+
+    @property
+    def proxy3d(self):
+        return self._proxy3d
+
+    @property
+    def zoom(self):
+        return self._zoom
+
+    @zoom.setter
+    def zoom(self, value):
+        self._zoom = value
+        self._invalidate()
+
+    @property
+    def rot_quat(self):
+        return self._rot_quat
+
+    @rot_quat.setter
+    def rot_quat(self, value):
+        with self._rot_lock:
+            self._rot_quat = list(value)
+        self._invalidate()
+
+    @property
+    def build_dimensions(self):
+        return self._build_dimensions
+
+    @build_dimensions.setter
+    def build_dimensions(self, value):
+        self._build_dimensions = value
+        self._bed3d.build_dimensions = value
+        self._invalidate()
+
+    @property
+    def camera3d_scale(self):
+        return self._camera3d_scale
+
+    @camera3d_scale.setter
+    def camera3d_scale(self, value):
+        self._camera3d_scale = value
+        self._camera3d_array.data['scale'] = value
+        self._camera3d_array.dirty = True
+
+    @property
+    def camera3d_list(self):
+        return self._camera3d_list
+
+    @camera3d_list.setter
+    def camera3d_list(self, value):
+        self._camera3d_array.clear()
+        self._camera_index.clear()
+        self._camera_registry.clear_virtual()
+        self._camera3d_list = []
+        for camera in value:
+            self.add_camera(camera)
+        self._invalidate()
+
+    @property
+    def camera3d_poses(self):
+        """Return structured pose array of all cameras, in camera3d_list order.
+        Use set_camera3d_poses to write poses so that the canvas is redrawn.
+        """
+        return self._camera3d_array.data
+
+    def set_camera3d_poses(self, poses, indices=slice(None)):
+        """Write (n, 5) x, y, z, b, c poses into the given cameras."""
+        self._camera3d_array.set_poses(poses, indices)
+        self._invalidate()
+
+    @property
+    def path3d_list(self):
+        return self._path3d_list
+
+    def add_path(self, path3d):
+        """Add Path3D, redrawing and updating the pose index whenever it changes."""
+        path3d.on_dirty = self._invalidate
+        path3d.on_move = partial(self._on_path_moved, path3d)
+        self._path3d_list.append(path3d)
+        self._pose_counts[path3d] = 0
+        self._on_path_moved(path3d, range(len(path3d)))
+        self._invalidate()
+
+    def remove_path(self, path3d):
+        path3d.on_dirty = None
+        path3d.on_move = None
+        self._path3d_list.remove(path3d)
+        count = self._pose_counts.pop(path3d, 0)
+        self._pose_index.remove_many([(path3d, i) for i in range(count)])
+        self._invalidate()
+
+    def _on_path_moved(self, path3d, indices):
+        count, previous = len(path3d), self._pose_counts[path3d]
+        if count < previous:
+            self._pose_index.remove_many([(path3d, i) for i in range(count, previous)])
+        self._pose_counts[path3d] = count
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size:
+            self._pose_index.insert_many([(path3d, i) for i in indices.tolist()], path3d.poses[indices, :3])
+
+    def add_camera(self, camera):
+        """Add Camera3D and move its pose into the camera pose array."""
+        self._camera_registry.add_virtual(camera)
+        camera.scale = self._camera3d_scale
+        self._camera3d_array.add(camera)
+        self._camera3d_list.append(camera)
+        self._camera_index.insert(camera, camera.position)
+        self._invalidate()
+
+    def get_camera(self, camid):
+        """Return Camera3D with camid, or None."""
+        return self._camera_registry.get_virtual(camid)
+
+    def cameras_near(self, point, radius):
+        """Return Camera3D objects within radius of point."""
+        return self._camera_index.query_radius(point, radius)
+
+    def cameras_in_box(self, lo, hi):
+        """Return Camera3D objects inside the box between corners lo and hi."""
+        return self._camera_index.query_box(lo, hi)
+
+    def poses_near(self, point, radius):
+        """Return (Path3D, pose index) of path poses within radius of point."""
+        return self._pose_index.query_radius(point, radius)
+
+    def poses_in_box(self, lo, hi):
+        """Return (Path3D, pose index) of path poses inside the box between corners lo and hi."""
+        return self._pose_index.query_box(lo, hi)
+
+    @property
+    def camera_registry(self):
+        return self._camera_registry
+
+    @property
+    def camera_index(self):
+        return self._camera_index
+
+    @property
+    def pose_index(self):
+        return self._pose_index
+
+    # ----------------
+    # Camera functions
+    # ----------------
+
+    def apply_view_matrix(self):
+        """Apply modelview matrix according to rotation quat."""
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        gluLookAt(
+            0.0, 0.0, self._dist * 1.5, # eyeX, eyeY, eyeZ
+            0.0, 0.0, 0.0,              # centerX, centerY, centerZ
+            0.0, 1.0, 0.0)              # upX, upY, upZ
+        glMultMatrixd(quat_to_matrix4(self._rot_quat))
+
+    def apply_projection(self):
+        """Set camera projection. Also updates zoom."""
+        # TODO: add toggle between perspective and orthographic view modes
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        gluPerspective(
+            np.arctan(np.tan(np.deg2rad(45.0)) / self._zoom) * 180 / math.pi,
+            float(self._width) / self._height,
+            0.1,
+            2000.0)
+        glMatrixMode(GL_MODELVIEW)
+
+    def get_modelview_matrix(self):
+        """Return GL_MODELVIEW_MATRIX."""
+        mat = (GLdouble * 16)()
+        glGetDoublev(GL_MODELVIEW_MATRIX, mat)
+        return mat
+
+    def get_projection_matrix(self):
+        """Return GL_PROJECTION_MATRIX."""
+        mat = (GLdouble * 16)()
+        glGetDoublev(GL_PROJECTION_MATRIX, mat)
+        return mat
+
+    def get_viewport(self):
+        """Return GL_VIEWPORT."""
+        vec = (GLint * 4)()
+        glGetIntegerv(GL_VIEWPORT, vec)
+        return vec
@@ -5,7 +5,9 @@ import wx.svg as svg
 import wx.lib.agw.aui as aui
 from ctypes import *
 
-from utils import create_scaled_bitmap
+from utils import create_scaled_bitmap, set_dialog
+
+from gl.path_worker import EVT_RESULT, Path3DWorker
 
 from gui.panels.console import ConsolePanel
 from gui.panels.controller import ControllerPanel
@@ -37,10 +39,15 @@ class MainFrame(wx.Frame):
 
         self.cam_list = []
         self.selected_cam = None
+        self.selected_cams = []
         self.is_edsdk_on = False
         self.edsdk_object = None
         self.project_dirty = False
 
+        # clearance checks run off the UI thread
+        self.collision_worker = Path3DWorker(self, max_workers=1)
+        self.collision_job = None
+
         # initialize statusbar and menubar
         self.init_statusbar()
         self.init_menubar()
@@ -51,6 +58,7 @@ class MainFrame(wx.Frame):
         self.Centre()
         self._mgr.Bind(aui.EVT_AUI_PANE_CLOSE, self.on_pane_close)
         self.Bind(wx.EVT_CLOSE, self.on_close)
+        EVT_RESULT(self, self.on_collision_result)
 
     def init_statusbar(self):
         """Initialize statusbar."""
@@ -154,6 +162,8 @@ class MainFrame(wx.Frame):
         # Tools menu
         tools_menu = wx.Menu()
         self.Bind(wx.EVT_MENU, self.open_pathgen_frame, tools_menu.Append(wx.ID_ANY, '&Generate Path...', 'Open path generator window'))
+        self.menuitems['collisions'] = tools_menu.Append(wx.ID_ANY, '&Check Collisions', 'Check camera clearance along all paths')
+        self.Bind(wx.EVT_MENU, self.on_check_collisions, self.menuitems['collisions'])
 
         # Window menu
         window_menu = wx.Menu()
@@ -272,6 +282,35 @@ class MainFrame(wx.Frame):
         pathgen_frame = PathgenFrame(self)
         pathgen_frame.Show()
 
+    def on_check_collisions(self, _):
+        if self.collision_job is not None:
+            return
+        self.collision_job = self.visualizer_panel.check_collisions(self.collision_worker)
+        self.menuitems['collisions'].Enable(False)
+        self.SetStatusText('Checking collisions...')
+
+    def on_collision_result(self, event):
+        result = event.data
+        if result.job != self.collision_job or result.cancelled:
+            return
+        self.collision_job = None
+        self.menuitems['collisions'].Enable(True)
+        self.SetStatusText('Ready')
+
+        if result.error is not None:
+            set_dialog(f'Could not check collisions: {result.error}')
+            return
+
+        collisions = result.data
+        if not collisions:
+            set_dialog('No clearance violations found.')
+            return
+
+        lines = [repr(c) for c in collisions[:20]]
+        if len(collisions) > 20:
+            lines.append(f'... and {len(collisions) - 20} more')
+        set_dialog(f'{len(collisions)} clearance violations found:\n' + '\n'.join(lines))
+
     def open_copis_website(self, _):
         wx.LaunchDefaultBrowser('http://www.copis3d.org/')
 
@@ -483,9 +522,14 @@ class MainFrame(wx.Frame):
 
         self.console_panel.print(message)
 
-        for i in range(cam_count):
-            camid = self.visualizer_panel.add_camera(camid=i)
-            self.controller_panel.masterCombo.Append('camera ' + camid)
+        registry = self.visualizer_panel.glcanvas.camera_registry
+        for cam in self.cam_list.cam_model_list:
+            registry.add_physical(cam.camid, cam)
+            # keep the Camera3D of a camera seen before, e.g. on refresh
+            if registry.get_virtual(cam.camid) is None:
+                self.visualizer_panel.add_camera(camid=cam.camid)
+            if self.controller_panel.masterCombo.FindString(f'camera {cam.camid}') == wx.NOT_FOUND:
+                self.controller_panel.masterCombo.Append(f'camera {cam.camid}')
 
     def get_selected_camera(self):
         if self.selected_cam:
@@ -497,25 +541,53 @@ class MainFrame(wx.Frame):
         new_selected = self.visualizer_panel.get_camera_by_id(camid)
         last_selected = self.get_selected_camera()
 
-        if new_selected == last_selected:
+        if new_selected == last_selected and len(self.selected_cams) <= 1:
             return 0
 
-        # reset previously selected camera
+        # reset previously selected cameras
+        for cam in self.selected_cams:
+            cam.is_selected = False
         if last_selected:
             last_selected.is_selected = False
+        self.selected_cams = [new_selected]
 
         # update new selected camera
         self.selected_cam = new_selected
         self.selected_cam.is_selected = True
 
         # connect to physical camera
-        if self.cam_list:
-            if self.cam_list[camid]:
-                self.parent.cam_list.set_selected_cam_by_id(camid)
+        if self.visualizer_panel.glcanvas.camera_registry.get_physical(camid) is not None:
+            self.cam_list.set_selected_cam_by_id(camid)
 
         # refresh canvas and combobox
         self.visualizer_panel.dirty = True
-        self.controller_panel.masterCombo.SetSelection(camid)
+        self._select_in_combo(camid)
+
+    def set_selected_cameras(self, camids):
+        """Select several cameras at once, e.g. from a marquee selection.
+        The first camera becomes the one controlled by the controller panel.
+        """
+        for cam in self.selected_cams:
+            cam.is_selected = False
+        if self.selected_cam:
+            self.selected_cam.is_selected = False
+
+        self.selected_cams = [self.visualizer_panel.get_camera_by_id(camid) for camid in camids]
+        for cam in self.selected_cams:
+            cam.is_selected = True
+        self.selected_cam = self.selected_cams[0] if self.selected_cams else None
+
+        # refresh canvas and combobox
+        self.visualizer_panel.dirty = True
+        self._select_in_combo(self.selected_cam.camid if self.selected_cam else None)
+
+    def _select_in_combo(self, camid):
+        """Select camera camid in the controller combobox, whose items are
+        'camera <camid>' in the order cameras were added, or clear it for None.
+        """
+        combo = self.controller_panel.masterCombo
+        index = wx.NOT_FOUND if camid is None else combo.FindString(f'camera {camid}')
+        combo.SetSelection(index)
 
     def terminate_edsdk(self):
         if not self.is_edsdk_on:
@@ -526,6 +598,7 @@ class MainFrame(wx.Frame):
         if self.cam_list:
             self.cam_list.terminate()
             self.cam_list = []
+        self.visualizer_panel.glcanvas.camera_registry.clear_physical()
 
     def on_close(self, event):
         event.StopPropagation()
@@ -534,6 +607,10 @@ class MainFrame(wx.Frame):
                              wx.ICON_QUESTION | wx.YES_NO, self) == wx.NO:
                 return
 
+        self.collision_worker.shutdown()
+        self.timeline_panel.stop_sending()
+        self.visualizer_panel.stop_telemetry()
+        self.toolbar_panel.serial_controller.close()
         self._mgr.UnInit()
         self.Destroy()
 
@@ -244,7 +244,7 @@ class ControllerPanel(wx.VScrolledWindow):
 
     def OnMasterCombo(self, event):
         choice = self.masterCombo.GetStringSelection()
-        id = int(choice[-1])
+        id = int(choice.split()[-1])
 
         self.parent.set_selected_camera(id)
 
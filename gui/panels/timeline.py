@@ -2,6 +2,7 @@
 
 import wx
 from utils import set_dialog
+from util.gcode_sender import GcodeSender, clean_line
 
 
 """
@@ -10,6 +11,10 @@ TODO: Improve timeline panel
 class TimelinePanel(wx.Panel):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, style=wx.BORDER_DEFAULT)
+        self.parent = parent
+        self.sender = None
+        # concurrent Future of a send to several boards
+        self.board_send = None
         self.init_ui()
 
     def init_ui(self):
@@ -50,9 +55,23 @@ class TimelinePanel(wx.Panel):
         self.savetofile_btn = wx.Button(self, wx.ID_ANY, label='Save To File')
         vboxBtns.Add(self.savetofile_btn)
         self.sendall_btn = wx.Button(self, wx.ID_ANY, label='Send All')
+        self.sendall_btn.size = 'all'
+        self.sendall_btn.Bind(wx.EVT_BUTTON, self.on_send_commands)
         vboxBtns.Add(self.sendall_btn)
         self.sendsel_button = wx.Button(self, wx.ID_ANY, label='Send Sel')
+        self.sendsel_button.size = 'single'
+        self.sendsel_button.Bind(wx.EVT_BUTTON, self.on_send_commands)
         vboxBtns.Add(self.sendsel_button)
+        self.pause_btn = wx.Button(self, wx.ID_ANY, label='Pause')
+        self.pause_btn.Bind(wx.EVT_BUTTON, self.on_pause_sending)
+        self.pause_btn.Disable()
+        vboxBtns.Add(self.pause_btn)
+        self.abort_btn = wx.Button(self, wx.ID_ANY, label='Abort')
+        self.abort_btn.Bind(wx.EVT_BUTTON, self.on_abort_sending)
+        self.abort_btn.Disable()
+        vboxBtns.Add(self.abort_btn)
+        self.send_gauge = wx.Gauge(self, wx.ID_ANY, range=1, size=(-1, 10))
+        vboxBtns.Add(self.send_gauge, 0, wx.EXPAND)
         hboxBottom.Add(vboxBtns)
 
         self.SetSizer(hboxBottom)
@@ -103,3 +122,128 @@ class TimelinePanel(wx.Panel):
                 set_dialog('Please select the command to delete.')
         else:
             self.cmd.Clear()
+
+    def on_send_commands(self, event):
+        if event.GetEventObject().size == 'all':
+            lines = self.cmd.GetStrings()
+        else:
+            index = self.cmd.GetSelection()
+            if index == -1:
+                set_dialog('Please select the command to send.')
+                return
+            lines = [self.cmd.GetString(index)]
+
+        controller = self.parent.toolbar_panel.serial_controller
+        if controller.manager is not None:
+            self._send_boards(controller, lines)
+            return
+
+        sender = self._get_sender()
+        if sender is None:
+            return
+        # the sender reads the port until done
+        reader = self.parent.visualizer_panel.telemetry_reader
+        if reader is not None:
+            reader.pause()
+        sender.send(lines)
+        self.pause_btn.Enable()
+        self.abort_btn.Enable()
+
+    def on_pause_sending(self, event):
+        if self.sender is None:
+            return
+
+        if self.sender.paused:
+            self.sender.resume()
+            self.pause_btn.SetLabel('Pause')
+        else:
+            self.sender.pause()
+            self.pause_btn.SetLabel('Resume')
+
+    def on_abort_sending(self, event):
+        if self.sender is not None:
+            self.sender.abort()
+        if self.board_send is not None:
+            self.board_send.cancel()
+
+    def stop_sending(self):
+        """Abort streaming and wait for the sender to let go of the port,
+        e.g. before the port is closed.
+        """
+        if self.sender is not None and self.sender.busy:
+            self.sender.abort()
+            self.sender.join()
+        if self.board_send is not None:
+            self.board_send.cancel()
+
+    def _send_boards(self, controller, lines):
+        """Stream lines to the boards of a multi-board rig, each line routed
+        to the boards it concerns.
+        """
+        if self.board_send is not None and not self.board_send.done():
+            set_dialog('Please wait until the commands being sent are done.')
+            return
+        lines = [line for line in (clean_line(line) for line in lines) if line]
+        if not lines:
+            return
+        self.board_send = controller.send_boards(lines)
+        # done callbacks run on the board event loop thread
+        self.board_send.add_done_callback(lambda future: wx.CallAfter(self._on_boards_done, future))
+        self.abort_btn.Enable()
+
+    def _on_boards_done(self, future):
+        if future is not self.board_send:
+            return
+        self.board_send = None
+        self.abort_btn.Disable()
+        console = self.parent.console_panel
+        if future.cancelled():
+            console.print('Sending aborted.')
+            return
+        if future.exception() is not None:
+            console.print(f'Sending failed: {future.exception()}')
+            return
+        for name, responses in future.result().items():
+            for response in responses:
+                if response.error is not None:
+                    console.print(f'Board {name}: {response.line} failed: {response.error}')
+        console.print('All commands sent.')
+
+    def _get_sender(self):
+        """Return GcodeSender for the connected port, or None if not connected."""
+        port = self.parent.toolbar_panel.serial_controller.selected_serial
+        if port is None or not port.is_open:
+            set_dialog('Please connect to the controller first.')
+            return None
+
+        if self.sender is None or self.sender.port is not port:
+            if self.sender is not None and self.sender.busy:
+                set_dialog('Please wait until the commands being sent are done.')
+                return None
+            self.sender = GcodeSender(port)
+            # sender callbacks run on its thread
+            self.sender.on_progress = lambda acked, total: wx.CallAfter(self._on_send_progress, acked, total)
+            self.sender.on_response = self._on_send_response
+            self.sender.on_error = lambda index, text: wx.CallAfter(
+                self.parent.console_panel.print, f'Command {index + 1} failed: {text}')
+            self.sender.on_done = lambda aborted: wx.CallAfter(self._on_send_done, aborted)
+        return self.sender
+
+    def _on_send_response(self, text):
+        # runs on the sender thread, position reports go to telemetry
+        reader = self.parent.visualizer_panel.telemetry_reader
+        if reader is None or not reader.feed(text):
+            wx.CallAfter(self.parent.console_panel.print, text)
+
+    def _on_send_progress(self, acked, total):
+        self.send_gauge.SetRange(max(1, total))
+        self.send_gauge.SetValue(min(acked, total))
+
+    def _on_send_done(self, aborted):
+        self.pause_btn.SetLabel('Pause')
+        self.pause_btn.Disable()
+        self.abort_btn.Disable()
+        reader = self.parent.visualizer_panel.telemetry_reader
+        if reader is not None:
+            reader.resume()
+        self.parent.console_panel.print('Sending aborted.' if aborted else 'All commands sent.')
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
 import wx
 import wx.svg as svg
 import wx.lib.agw.aui as aui
@@ -20,10 +21,11 @@ class ToolbarPanel(aui.AuiToolBar):
 
         self.port_cb = None
         self.baud_cb = None
+        self.speed_cb = None
 
         self.init_controller()
         self.init_toolbar()
-        self.update_ports()
+        self.serial_controller.start()
 
         self.Bind(wx.EVT_TOOL, self.on_tool_selected)
 
@@ -32,6 +34,13 @@ class ToolbarPanel(aui.AuiToolBar):
             return
 
         self.serial_controller = SerialController()
+        # ports are found and probed on background threads
+        self.serial_controller.on_ports_changed = lambda ports: wx.CallAfter(self.update_ports)
+        self.serial_controller.on_baud_detected = lambda port, baud: wx.CallAfter(self.on_baud_detected, port, baud)
+        # multi-board rigs connect to every [Board <name>] section instead of the selected port
+        app = wx.GetApp()
+        if app is not None and app.appconfig.config is not None:
+            self.serial_controller.configure_boards(app.appconfig.config)
 
     def init_toolbar(self):
         """Initialize and populate toolbar.
@@ -57,6 +66,9 @@ class ToolbarPanel(aui.AuiToolBar):
         self.AddTool(ToolIds.PAUSE.value, 'Pause', _bmp, _bmp, aui.ITEM_NORMAL, short_help_string='Pause simulation')
         _bmp = create_scaled_bitmap('stop', 24)
         self.AddTool(ToolIds.STOP.value, 'Stop', _bmp, _bmp, aui.ITEM_NORMAL, short_help_string='Stop and reset simulation')
+        self.AddSpacer(10)
+        self.speed_cb = wx.ComboBox(self, wx.ID_ANY, value='1x', choices=['0.25x', '0.5x', '1x', '2x', '5x', '10x'], style=wx.CB_READONLY, size=(60, -1))
+        self.Bind(wx.EVT_COMBOBOX, self.on_select_speed, self.AddControl(self.speed_cb, label='Simulation speed combobox'))
 
         self.AddSeparator()
 
@@ -65,7 +77,6 @@ class ToolbarPanel(aui.AuiToolBar):
         self.AddTool(ToolIds.SETTINGS.value, 'Settings', _bmp, _bmp, aui.ITEM_NORMAL, short_help_string='Edit simulation settings')
 
     def on_select_port(self, event):
-        port_cb = self.FindControl(event.GetId())
         port = event.GetString()
         if self.serial_controller.set_current_serial(port):
             self.update_bauds()
@@ -73,44 +84,79 @@ class ToolbarPanel(aui.AuiToolBar):
             set_dialog(f'Could not open port "{port}".')
             self.port_cb.SetSelection(-1)
 
+    def on_baud_detected(self, port, baud):
+        selected = self.serial_controller.selected_serial
+        if selected and selected.port == port:
+            self.update_bauds()
+            if baud is None:
+                self.parent.console_panel.print(f'No controller answered on {port}.')
+
     def on_select_baud(self, event):
         self.serial_controller.selected_serial.baudrate = int(event.GetString())
 
+    def on_select_speed(self, event):
+        self.parent.visualizer_panel.set_simulation_speed(float(event.GetString().rstrip('x')))
+
     def on_connect(self, event):
         connect_btn = self.FindControl(event.GetId())
-        if self.serial_controller.selected_serial:
-            if self.serial_controller.selected_serial.is_open:
+        if self.serial_controller.boards_configured:
+            self.connect_boards(connect_btn)
+        elif self.serial_controller.selected_serial:
+            if self.serial_controller.is_probing(self.serial_controller.selected_serial.port):
+                set_dialog('Still detecting the baud rate, please try again in a moment.')
+            elif self.serial_controller.selected_serial.is_open:
+                self.parent.timeline_panel.stop_sending()
+                self.parent.visualizer_panel.stop_telemetry()
                 self.serial_controller.selected_serial.close()
                 connect_btn.SetLabel('Connect')
             else:
                 self.serial_controller.selected_serial.open()
+                self.parent.visualizer_panel.start_telemetry(self.serial_controller.selected_serial)
                 connect_btn.SetLabel('Disconnect')
         else:
             set_dialog('Please select a port to connect to.')
 
+    def connect_boards(self, connect_btn):
+        """Open or close all boards of a multi-board rig."""
+        if self.serial_controller.manager is not None:
+            self.parent.timeline_panel.stop_sending()
+            self.serial_controller.close_boards()
+            connect_btn.SetLabel('Connect')
+            return
+
+        try:
+            manager = self.serial_controller.open_boards()
+        except (OSError, ValueError, concurrent.futures.TimeoutError) as e:
+            set_dialog(f'Could not connect to the controller boards: {e}')
+            return
+        self.parent.console_panel.print(f'Connected to boards {", ".join(manager.boards)}.')
+        connect_btn.SetLabel('Disconnect')
+
     def update_ports(self):
+        selected = self.port_cb.GetStringSelection()
         self.port_cb.Set(self.serial_controller.ports)
+        if selected in self.serial_controller.ports:
+            self.port_cb.SetStringSelection(selected)
 
     def update_bauds(self):
         if self.serial_controller.bauds is not None:
             self.baud_cb.Set([str(i) for i in self.serial_controller.bauds])
+            if self.serial_controller.selected_serial:
+                self.baud_cb.SetStringSelection(str(self.serial_controller.selected_serial.baudrate))
 
     def on_tool_selected(self, event):
         if event.GetId() == ToolIds.SETTINGS.value:
             settings_frame = SettingsFrame(self)
             settings_frame.Show()
         elif event.GetId() == ToolIds.PLAY.value:
-            camid = self.parent.controller_panel.masterCombo.GetSelection()
-            if camid != -1:
-                cam = self.parent.visualizer_panel.get_camera_by_id(camid)
-                if cam:
-                    cam.translate(1, 1, 1)
-            else:
-                set_dialog('Please select the camera to control.')
-        elif event.GetID() == ToolIds.PAUSE.value:
-            pass
-        else:
-            pass
+            if not self.parent.visualizer_panel.glcanvas.path3d_list:
+                set_dialog('Please generate a path to simulate.')
+                return
+            self.parent.visualizer_panel.play_simulation()
+        elif event.GetId() == ToolIds.PAUSE.value:
+            self.parent.visualizer_panel.pause_simulation()
+        elif event.GetId() == ToolIds.STOP.value:
+            self.parent.visualizer_panel.stop_simulation()
 
     def __del__(self):
         return
@@ -2,10 +2,16 @@
 """Visualizer panel. Creates a Canvas3D OpenGL canvas."""
 
 import random
+import time
 
+import numpy as np
 import wx
 from gl.canvas3d import Canvas3D
 from gl.camera3d import Camera3D
+from util.collision import CollisionChecker
+from util.kinematics import Kinematics
+from util.simulator import Simulator
+from util.telemetry import TelemetryBuffer, TelemetryReader
 
 
 class VisualizerPanel(wx.Panel):
@@ -25,6 +31,24 @@ class VisualizerPanel(wx.Panel):
             subdivisions=10)
 
         self.zoom_slider = None
+        self.time_slider = None
+        self.time_label = None
+
+        # simulation clock ticks, independent of canvas redraws
+        self._simulator = Simulator()
+        self._simulator.on_update = self._on_simulation_update
+        self._sim_timer = wx.Timer(self)
+        self._sim_last_tick = 0.0
+        self._rest_poses = None
+        self.Bind(wx.EVT_TIMER, self.on_sim_timer, self._sim_timer)
+
+        # cameras follow controller reports, read on another thread
+        self._telemetry = TelemetryBuffer()
+        self._telemetry_reader = None
+        self._follow_poses = np.empty((self._telemetry.max_cameras, 5))
+        self._follow_count = 0
+        self._follow_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_follow_timer, self._follow_timer)
 
         self.init_panel()
 
@@ -56,6 +80,16 @@ class VisualizerPanel(wx.Panel):
         bbox_check.Bind(wx.EVT_CHECKBOX, self.on_bbox_check)
         navbar_sizer.Add(bbox_check, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT | wx.RIGHT, 5)
 
+        navbar_sizer.Add(wx.StaticLine(navbar, wx.ID_ANY, style=wx.LI_VERTICAL), 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+
+        # add simulation time slider and text
+        navbar_sizer.Add(wx.StaticText(navbar, wx.ID_ANY, 'Time', wx.DefaultPosition, wx.DefaultSize, 0), 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 5)
+        self.time_slider = wx.Slider(navbar, wx.ID_ANY, 0, 0, self.time_slider_steps, size=(150, -1), style=wx.SL_HORIZONTAL)
+        self.time_slider.Bind(wx.EVT_SCROLL, self.on_time_slider)
+        navbar_sizer.Add(self.time_slider, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        self.time_label = wx.StaticText(navbar, wx.ID_ANY, self._time_text())
+        navbar_sizer.Add(self.time_label, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+
         navbar.SetSizerAndFit(navbar_sizer)
         sizer.Add(navbar, 0, wx.EXPAND)
 
@@ -74,12 +108,158 @@ class VisualizerPanel(wx.Panel):
             return
 
         self._canvas3d.bed3d.show_axes = event.IsChecked()
+        self._canvas3d.dirty = True
 
     def on_bbox_check(self, event):
         if self._canvas3d is None:
             return
 
         self._canvas3d.bed3d.show_bounding_box = event.IsChecked()
+        self._canvas3d.dirty = True
+
+    # --------------------
+    # Simulation functions
+    # --------------------
+
+    # time slider resolution
+    time_slider_steps = 1000
+    # simulation clock tick interval in ms
+    sim_tick_interval = 15
+
+    def play_simulation(self):
+        """Play camera paths from the current time, loading them first if stopped."""
+        if self._rest_poses is None:
+            self._load_simulation()
+        self._simulator.play()
+        if self._simulator.playing:
+            self._sim_last_tick = time.perf_counter()
+            self._sim_timer.Start(self.sim_tick_interval)
+
+    def pause_simulation(self):
+        self._simulator.pause()
+        self._sim_timer.Stop()
+
+    def stop_simulation(self):
+        """Stop and put the cameras back where they were before playing."""
+        self._sim_timer.Stop()
+        self._simulator.pause()
+        if self._rest_poses is not None and len(self._rest_poses) == len(self._canvas3d.camera3d_list):
+            self._canvas3d.set_camera3d_poses(self._rest_poses)
+            self._rest_poses = None
+        self._simulator.load([], [])
+        self._update_time_controls()
+
+    def set_simulation_speed(self, value):
+        self._simulator.speed = value
+
+    def on_sim_timer(self, event):
+        now = time.perf_counter()
+        self._simulator.advance(now - self._sim_last_tick)
+        self._sim_last_tick = now
+        if not self._simulator.playing:
+            self._sim_timer.Stop()
+
+    def on_time_slider(self, event):
+        if self._rest_poses is None:
+            self._load_simulation()
+        self._simulator.seek(self._simulator.duration * event.GetInt() / self.time_slider_steps)
+
+    def check_collisions(self, worker, step=0.05):
+        """Check the paths played from the current camera poses on a
+        Path3DWorker and return the job id. The result data is a Collision list.
+        """
+        app = wx.GetApp()
+        simulator = Simulator(Kinematics.from_config(app.appconfig.config if app else None))
+        simulator.load(self._canvas3d.path3d_list, [cam.camid for cam in self._canvas3d.camera3d_list])
+        data = self._canvas3d.camera3d_poses
+        positions = np.column_stack([data[axis] for axis in 'xyz'])
+        camids = [cam.camid for cam in self._canvas3d.camera3d_list]
+        return worker.submit(CollisionChecker().check_simulation, [simulator],
+                             positions, camids, self._canvas3d.proxy3d, step)
+
+    def _load_simulation(self):
+        data = self._canvas3d.camera3d_poses
+        self._rest_poses = np.column_stack([data[axis] for axis in 'xyzbc'])
+        app = wx.GetApp()
+        self._simulator.kinematics = Kinematics.from_config(app.appconfig.config if app else None)
+        self._simulator.load(self._canvas3d.path3d_list, [cam.camid for cam in self._canvas3d.camera3d_list])
+
+    def _on_simulation_update(self, indices, poses):
+        self._canvas3d.set_camera3d_poses(poses, indices)
+        self._update_time_controls()
+
+    def _update_time_controls(self):
+        duration = self._simulator.duration
+        self.time_slider.SetValue(int(self.time_slider_steps * self._simulator.time / duration) if duration else 0)
+        self.time_label.SetLabel(self._time_text())
+
+    def _time_text(self):
+        return f'{self._simulator.time:6.1f} / {self._simulator.duration:.1f} s'
+
+    @property
+    def simulator(self):
+        return self._simulator
+
+    # -------------------
+    # Telemetry functions
+    # -------------------
+
+    # command asking the controller for a position report, and seconds between asks
+    telemetry_poll_command = 'M114'
+    telemetry_poll_interval = 0.01
+    # camera follow tick interval in ms
+    follow_interval = 30
+
+    def start_telemetry(self, port):
+        """Read reports from the controller on port and move the cameras to follow them."""
+        self.stop_telemetry()
+        self._telemetry.clear()
+        self._follow_count = 0
+        self._telemetry_reader = TelemetryReader(
+            port, self._telemetry, self.telemetry_poll_command, self.telemetry_poll_interval)
+        self._telemetry_reader.on_line = lambda text: wx.CallAfter(self.parent.console_panel.print, text)
+        self._telemetry_reader.start()
+        self._follow_timer.Start(self.follow_interval)
+
+    def stop_telemetry(self):
+        self._follow_timer.Stop()
+        if self._telemetry_reader is not None:
+            self._telemetry_reader.stop()
+            self._telemetry_reader = None
+
+    def on_follow_timer(self, event):
+        if self._rest_poses is not None:
+            # the simulation moves the cameras
+            return
+
+        self._follow_count, changed = self._telemetry.read_latest(self._follow_poses, self._follow_count)
+        if not changed.any():
+            return
+
+        registry = self._canvas3d.camera_registry
+        camids, indices = [], []
+        for camid in np.flatnonzero(changed):
+            camera = registry.get_virtual(int(camid))
+            if camera is not None:
+                camids.append(camid)
+                indices.append(camera.index)
+        if not indices:
+            return
+
+        poses = self._follow_poses[camids]
+        # keep axes the controller does not report
+        data = self._canvas3d.camera3d_poses[indices]
+        missing = np.isnan(poses)
+        poses[missing] = np.column_stack([data[axis] for axis in 'xyzbc'])[missing]
+        self._canvas3d.set_camera3d_poses(poses, indices)
+
+    @property
+    def telemetry(self):
+        return self._telemetry
+
+    @property
+    def telemetry_reader(self):
+        return self._telemetry_reader
 
     @property
     def dirty(self):
@@ -115,27 +295,16 @@ class VisualizerPanel(wx.Panel):
         c = random.randrange(0, 360, 5)
 
         if camid == -1:
-            camid = self._generate_camera_id()
+            camid = self._canvas3d.camera_registry.new_id()
 
         cam_3d = Camera3D(camid, x, y, z, b, c)
-        self._canvas3d.camera3d_list.append(cam_3d)
-        self._canvas3d.dirty = True
+        self._canvas3d.add_camera(cam_3d)
 
         return str(cam_3d.camid)
 
     def get_camera_by_id(self, camid):
         """Return Camera3D by id."""
-        if self._canvas3d.camera3d_list:
-            for cam in self._canvas3d.camera3d_list:
-                if cam.camid == camid:
-                    return cam
-        return None
-
-    def _generate_camera_id(self):
-        if self._canvas3d.camera3d_list:
-            self._canvas3d.camera3d_list.sort(key=lambda x: x.camid)
-            return self._canvas3d.camera3d_list[-1].camid + 1
-        return 0
+        return self._canvas3d.get_camera(camid)
 
     def get_selected_camera(self):
         if self._selected_cam:
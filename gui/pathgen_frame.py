@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import wx
 
+from gl.path3d import PATH3D_FLAGS_DTYPE, Path3D
+from gl.path_worker import EVT_RESULT, Path3DWorker
+from util.kinematics import Kinematics
+from util.pathgen import generate, sphere_savings
+from util.pathopt import optimize_path
+from utils import set_dialog
+
 class PathgenFrame(wx.Frame):
     def __init__(self, parent, *args, **kwargs):
         wx.Frame.__init__(self, parent, wx.ID_ANY, 'Path Generator', size=(300, 400))
         self.SetMinSize(wx.Size(300, 400))
+        self.canvas = parent.visualizer_panel.glcanvas
+        self.worker = Path3DWorker(self)
+        self.job = None
 
         self.init_panel()
         self.Centre()
 
+        EVT_RESULT(self, self.onResult)
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+
     def init_panel(self):
         self.panel = wx.Panel(self, style=wx.BORDER_DEFAULT)
 
@@ -32,9 +46,9 @@ class PathgenFrame(wx.Frame):
         hboxStartXYZ = wx.BoxSizer()
         startXYZLabel = wx.StaticText(self.panel, wx.ID_ANY, label='Start XYZ: ')
         hboxStartXYZ.Add(startXYZLabel, 1, flag=wx.RIGHT | wx.TOP, border=6)
-        self.startXSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1, max=1)
-        self.startYSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1, max=1)
-        self.startZSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1, max=1)
+        self.startXSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1000, max=1000)
+        self.startYSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1000, max=1000)
+        self.startZSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1000, max=1000)
         hboxStartXYZ.Add(self.startXSc)
         hboxStartXYZ.Add(self.startYSc)
         hboxStartXYZ.Add(self.startZSc)
@@ -44,9 +58,9 @@ class PathgenFrame(wx.Frame):
         hboxEndXYZ = wx.BoxSizer()
         endXYZLabel = wx.StaticText(self.panel, wx.ID_ANY, label='End XYZ: ')
         hboxEndXYZ.Add(endXYZLabel, 1, flag=wx.RIGHT | wx.TOP, border=6)
-        self.endXSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1, max=1)
-        self.endYSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1, max=1)
-        self.endZSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1, max=1)
+        self.endXSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1000, max=1000)
+        self.endYSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1000, max=1000)
+        self.endZSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=-1000, max=1000)
         hboxEndXYZ.Add(self.endXSc)
         hboxEndXYZ.Add(self.endYSc)
         hboxEndXYZ.Add(self.endZSc)
@@ -56,7 +70,7 @@ class PathgenFrame(wx.Frame):
         self.hboxRadius = wx.BoxSizer()
         radiusLabel = wx.StaticText(self.panel, wx.ID_ANY, label='Radius (mm): ')
         self.hboxRadius.Add(radiusLabel, 1, flag=wx.RIGHT | wx.TOP, border=6)
-        self.radiusSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=1, max=100)
+        self.radiusSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1), min=1, max=1000)
         self.hboxRadius.Add(self.radiusSc)
         self.boxsizer.Add(self.hboxRadius, 1, flag=wx.LEFT, border=15)
         self.boxsizer.Hide(self.hboxRadius)
@@ -79,12 +93,22 @@ class PathgenFrame(wx.Frame):
         self.boxsizer.Add(self.hboxPointsCircle, flag=wx.LEFT | wx.BOTTOM, border=25)
         self.boxsizer.Hide(self.hboxPointsCircle)
 
+        # add equal-area sampling checkbox and spacing spinctrl for spheres
+        self.hboxEqualArea = wx.BoxSizer()
+        self.equalAreaCb = wx.CheckBox(self.panel, label='Equal-area, spacing (deg): ')
+        self.equalAreaCb.Bind(wx.EVT_CHECKBOX, self.onStyleRadioGroup)
+        self.hboxEqualArea.Add(self.equalAreaCb, 1, flag=wx.RIGHT | wx.TOP, border=6)
+        self.spacingSc = wx.SpinCtrl(self.panel, value='10', size=(60, -1), min=1, max=90)
+        self.hboxEqualArea.Add(self.spacingSc)
+        self.boxsizer.Add(self.hboxEqualArea, 1, flag=wx.LEFT, border=15)
+        self.boxsizer.Hide(self.hboxEqualArea)
+
         # add no points spinctrl
         hboxPoints = wx.BoxSizer()
         noPointsLabel = wx.StaticText(self.panel, wx.ID_ANY, label='Points: ')
         hboxPoints.Add(noPointsLabel, 1, flag=wx.RIGHT | wx.TOP, border=6)
         self.noPointsSc = wx.SpinCtrl(self.panel, value='0', size=(60, -1))
-        self.noPointsSc.SetRange(0, 100)
+        self.noPointsSc.SetRange(0, 100000)
         hboxPoints.Add(self.noPointsSc)
         self.boxsizer.Add(hboxPoints, 1, flag=wx.LEFT, border=15)
 
@@ -100,26 +124,120 @@ class PathgenFrame(wx.Frame):
         # add buttons
         self.vertextPhotoCb = wx.CheckBox(self.panel, label='Take Photo at Each Vertex')
         self.boxsizer.Add(self.vertextPhotoCb, 1, flag=wx.LEFT, border=15)
+        self.optimizeCb = wx.CheckBox(self.panel, label='Optimize Travel Order')
+        self.optimizeCb.Value = True
+        self.boxsizer.Add(self.optimizeCb, 1, flag=wx.LEFT, border=15)
         self.generatePathBtn = wx.Button(self.panel, wx.ID_ANY, label='Generate Path')
+        self.generatePathBtn.Bind(wx.EVT_BUTTON, self.onGeneratePath)
         self.boxsizer.Add(self.generatePathBtn, 1, flag=wx.LEFT, border=15)
+        self.summaryLabel = wx.StaticText(self.panel, wx.ID_ANY, label='')
+        self.boxsizer.Add(self.summaryLabel, 1, flag=wx.LEFT, border=15)
 
         self.panel.SetSizer(self.boxsizer)
 
     def onStyleRadioGroup(self, event):
         choice = self.styleCombo.GetStringSelection()
 
-        if choice == 'Cylinder' or choice == 'Sphere':
+        if choice == 'Sphere' and self.equalAreaCb.Value:
+            self.boxsizer.Show(self.hboxRadius)
+            self.boxsizer.Hide(self.hboxNCircle)
+            self.boxsizer.Hide(self.hboxPointsCircle)
+            self.boxsizer.Show(self.hboxEqualArea)
+            self.boxsizer.Layout()
+        elif choice == 'Cylinder' or choice == 'Sphere':
             self.boxsizer.Show(self.hboxRadius)
             self.boxsizer.Show(self.hboxNCircle)
             self.boxsizer.Show(self.hboxPointsCircle)
+            self.boxsizer.Show(self.hboxEqualArea, choice == 'Sphere')
             self.boxsizer.Layout()
         elif choice == 'Helix':
+            # circles are the number of turns
             self.boxsizer.Show(self.hboxRadius)
-            self.boxsizer.Hide(self.hboxNCircle)
+            self.boxsizer.Show(self.hboxNCircle)
             self.boxsizer.Hide(self.hboxPointsCircle)
+            self.boxsizer.Hide(self.hboxEqualArea)
             self.boxsizer.Layout()
         else:
             self.boxsizer.Hide(self.hboxRadius)
             self.boxsizer.Hide(self.hboxNCircle)
             self.boxsizer.Hide(self.hboxPointsCircle)
+            self.boxsizer.Hide(self.hboxEqualArea)
             self.boxsizer.Layout()
+
+    def onGeneratePath(self, event):
+        style = self.styleCombo.GetStringSelection()
+        if not style:
+            set_dialog('Please select a path style.')
+            return
+
+        params = {
+            'start': (self.startXSc.Value, self.startYSc.Value, self.startZSc.Value),
+            'end': (self.endXSc.Value, self.endYSc.Value, self.endZSc.Value),
+            'radius': self.radiusSc.Value,
+            'circles': self.nCircleSc.Value,
+            'turns': self.nCircleSc.Value,
+            'points_per_circle': self.pointsCircleSc.Value,
+            'points': self.noPointsSc.Value,
+        }
+        if style == 'Sphere' and self.equalAreaCb.Value:
+            style = 'Fibonacci Sphere'
+            params['points'] = None
+            params['spacing'] = self.spacingSc.Value
+
+        # a new request replaces one still running
+        if self.job is not None:
+            self.worker.cancel(self.job)
+        kinematics = Kinematics.from_config(wx.GetApp().appconfig.config) if self.optimizeCb.Value else None
+        task = (style, params, self.vertextPhotoCb.Value, self.noCamsSc.Value, kinematics)
+        self.job = self.worker.submit(self._generate, [task])
+        self.generatePathBtn.Disable()
+
+    @staticmethod
+    def _generate(task):
+        style, params, shoot, cams, kinematics = task
+        poses = generate(style, **params)
+        flags = np.zeros(len(poses), dtype=PATH3D_FLAGS_DTYPE)
+        flags['shoot'] = shoot
+        flags['camid'] = -1
+
+        # split the path into consecutive runs, one per camera
+        if cams > 0:
+            for camid, indices in enumerate(np.array_split(np.arange(len(poses)), cams)):
+                flags['camid'][indices] = camid
+
+        if kinematics is None:
+            return poses, flags, None
+        poses, flags, before, after = optimize_path(poses, flags, kinematics)
+        return poses, flags, (before, after)
+
+    def onResult(self, event):
+        result = event.data
+        if result.job != self.job or result.cancelled:
+            return
+        self.job = None
+        self.generatePathBtn.Enable()
+
+        if result.error is not None:
+            set_dialog(f'Could not generate path: {result.error}')
+            return
+
+        poses, flags, times = result.data
+        path3d = Path3D.from_arrays(poses, flags, copy=False)
+        self.canvas.add_path(path3d)
+        self.summaryLabel.Label = self._summary(len(path3d), times)
+        self.boxsizer.Layout()
+
+    def _summary(self, count, times=None):
+        summary = f'{count} poses'
+        if self.styleCombo.GetStringSelection() == 'Sphere' and self.equalAreaCb.Value:
+            spacing = self.spacingSc.Value
+            _, rings = sphere_savings(spacing)
+            summary += f', {rings - count} fewer than rings at {spacing} deg ({100 * (rings - count) // rings}%)'
+        if times is not None:
+            before, after = times
+            summary += f'\ncapture time {before:.0f} s -> {after:.0f} s'
+        return summary
+
+    def onClose(self, event):
+        self.worker.shutdown()
+        event.Skip()
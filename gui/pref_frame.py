@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 
+import os
 import wx
 
+from gl.path_worker import EVT_RESULT, Path3DWorker
+from gl.proxy3d import load_levels
+from utils import set_dialog
+
 class PreferenceFrame(wx.Frame):
     def __init__(self, parent, *args, **kwargs):
         wx.Frame.__init__(self, parent, wx.ID_ANY, 'Preferences', size=(300, 360))
         self.canvas = parent.visualizer_panel.glcanvas
+        self.worker = Path3DWorker(self, max_workers=1)
+        self.mesh_job = None
+        self.mesh_path = None
 
         self.init_panel()
         self.Centre()
 
+        EVT_RESULT(self, self.on_mesh_result)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
     def init_panel(self):
         curr_dims = self.canvas.build_dimensions
         curr_scale = self.canvas.camera3d_scale
@@ -95,7 +106,7 @@ class PreferenceFrame(wx.Frame):
         self.proxy_style_box = wx.BoxSizer()
         proxy_style_label = wx.StaticText(self.panel, wx.ID_ANY, label='Style: ')
         self.proxy_style_box.Add(proxy_style_label)
-        self.proxy_style_combo = wx.ComboBox(self.panel, wx.ID_ANY, choices=['Sphere','Cylinder', 'Cube'], style=wx.CB_READONLY, value=curr_proxy_style)
+        self.proxy_style_combo = wx.ComboBox(self.panel, wx.ID_ANY, choices=['Sphere','Cylinder', 'Cube', 'Mesh'], style=wx.CB_READONLY, value=curr_proxy_style)
         self.proxy_style_box.Add(self.proxy_style_combo, 1, flag=wx.BOTTOM, border=50)
 
         # Style/Sphere style options
@@ -176,6 +187,35 @@ class PreferenceFrame(wx.Frame):
             self.cube_length_sc.Value = curr_proxy_dims[1]
             self.cube_height_sc.Value = curr_proxy_dims[2]
 
+        # Style/Mesh style options
+        self.mesh_style_box = wx.BoxSizer(wx.VERTICAL)
+
+        mesh_file_box = wx.BoxSizer()
+        self.mesh_browse_btn = wx.Button(self.panel, wx.ID_ANY, label='Browse...', size=(70, -1))
+        self.mesh_browse_btn.Bind(wx.EVT_BUTTON, self.on_browse_mesh)
+        mesh_file_box.Add(self.mesh_browse_btn)
+        self.mesh_path_label = wx.StaticText(self.panel, wx.ID_ANY, label='No file loaded')
+        mesh_file_box.Add(self.mesh_path_label, 0, flag=wx.LEFT | wx.ALIGN_CENTER_VERTICAL, border=6)
+
+        mesh_scale_box = wx.BoxSizer()
+        mesh_scale_label = wx.StaticText(self.panel, wx.ID_ANY, label='Scale (%): ')
+        mesh_scale_box.Add(mesh_scale_label)
+        self.mesh_scale_sc = wx.SpinCtrl(self.panel, value='100', size=(60, -1), min=1, max=10000, name='pmsh')
+        mesh_scale_box.Add(self.mesh_scale_sc)
+
+        self.mesh_style_box.Add(mesh_file_box)
+        self.mesh_style_box.Add(mesh_scale_box)
+
+        self.proxy_style_box.Add(self.mesh_style_box)
+
+        # Hide mesh box or populate values
+        if curr_proxy_style != 'Mesh':
+            self.proxy_style_box.Hide(self.mesh_style_box)
+        else:
+            self.mesh_scale_sc.Value = curr_proxy_dims[0]
+        if self.canvas.proxy3d.path is not None:
+            self.mesh_path_label.Label = os.path.basename(self.canvas.proxy3d.path)
+
         # Proxy Object/Color box
         color_box = wx.BoxSizer()
         color_label = wx.StaticText(self.panel, wx.ID_ANY, label='RGB Color: ')
@@ -222,20 +262,29 @@ class PreferenceFrame(wx.Frame):
         choice = event.GetString()
 
         if choice == 'Sphere':
+            self.proxy_style_box.Hide(self.mesh_style_box)
             self.proxy_style_box.Hide(self.cylinder_style_box)
             self.proxy_style_box.Hide(self.cube_style_box)
             self.proxy_style_box.Show(self.sphere_style_box)
             self.boxsizer.Layout()
         elif choice == 'Cylinder':
+            self.proxy_style_box.Hide(self.mesh_style_box)
             self.proxy_style_box.Hide(self.cube_style_box)
             self.proxy_style_box.Hide(self.sphere_style_box)
             self.proxy_style_box.Show(self.cylinder_style_box)
             self.boxsizer.Layout()
         elif choice == 'Cube':
+            self.proxy_style_box.Hide(self.mesh_style_box)
             self.proxy_style_box.Hide(self.sphere_style_box)
             self.proxy_style_box.Hide(self.cylinder_style_box)
             self.proxy_style_box.Show(self.cube_style_box)
             self.boxsizer.Layout()
+        elif choice == 'Mesh':
+            self.proxy_style_box.Hide(self.sphere_style_box)
+            self.proxy_style_box.Hide(self.cylinder_style_box)
+            self.proxy_style_box.Hide(self.cube_style_box)
+            self.proxy_style_box.Show(self.mesh_style_box)
+            self.boxsizer.Layout()
 
     def on_spin_control(self, event):
         sc = event.GetEventObject()
@@ -254,6 +303,51 @@ class PreferenceFrame(wx.Frame):
                 self.canvas.proxy3d.dimensions = [self.cylinder_radius_sc.Value, self.cylinder_height_sc.Value]
             elif self.proxy_style_combo.Value == 'Cube':
                 self.canvas.proxy3d.dimensions = [self.cube_width_sc.Value, self.cube_length_sc.Value, self.cube_height_sc.Value]
+            elif self.proxy_style_combo.Value == 'Mesh':
+                self.canvas.proxy3d.dimensions = [self.mesh_scale_sc.Value]
+            self.canvas.dirty = True
+
+    def on_browse_mesh(self, event):
+        wildcard = 'Mesh files (*.stl;*.obj;*.ply)|*.stl;*.obj;*.ply|All files (*.*)|*.*'
+        with wx.FileDialog(self, 'Open proxy mesh', wildcard=wildcard, style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dialog:
+            if dialog.ShowModal() == wx.ID_CANCEL:
+                return
+            path = dialog.GetPath()
+
+        # loading and decimating a large mesh takes seconds, keep the UI live
+        if self.mesh_job is not None:
+            self.worker.cancel(self.mesh_job)
+        self.mesh_job = self.worker.submit(load_levels, [path])
+        self.mesh_path = path
+        self.mesh_browse_btn.Disable()
+        self.mesh_path_label.Label = f'Loading {os.path.basename(path)}...'
+        self.boxsizer.Layout()
+
+    def on_mesh_result(self, event):
+        result = event.data
+        if result.job != self.mesh_job or result.cancelled:
+            return
+        self.mesh_job = None
+        self.mesh_browse_btn.Enable()
+
+        path = self.mesh_path
+        if result.error is not None:
+            current = self.canvas.proxy3d.path
+            self.mesh_path_label.Label = os.path.basename(current) if current else 'No file loaded'
+            self.boxsizer.Layout()
+            set_dialog(f'Could not load mesh "{os.path.basename(path)}": {result.error}')
+            return
+
+        self.canvas.proxy3d.set_levels(result.data, path)
+        self.canvas.proxy3d.dimensions = [self.mesh_scale_sc.Value]
+        self.mesh_path_label.Label = os.path.basename(path)
+        self.proxy_style_combo.Value = 'Mesh'
+        self.boxsizer.Layout()
+        self.canvas.dirty = True
+
+    def on_close(self, event):
+        self.worker.shutdown()
+        event.Skip()
 
     def on_slider(self, event):
         slider = event.GetEventObject()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""CameraRegistry class."""
+
+
+class CameraRegistry():
+    """Virtual and physical cameras by camera id.
+
+    Both kinds are kept in hash maps, so lookups take constant time, and iterate
+    in the order they were added. New ids are allocated past every id seen so far.
+    """
+
+    def __init__(self):
+        self._virtual = {}
+        self._physical = {}
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._virtual)
+
+    def __contains__(self, camid):
+        return camid in self._virtual
+
+    def __iter__(self):
+        return iter(self._virtual.values())
+
+    def new_id(self):
+        """Return an id no camera has used since the last clear."""
+        camid = self._next_id
+        self._next_id += 1
+        return camid
+
+    def _reserve(self, camid):
+        self._next_id = max(self._next_id, camid + 1)
+
+    def add_virtual(self, camera):
+        """Register Camera3D under its camid."""
+        if camera.camid in self._virtual:
+            raise ValueError(f'camera {camera.camid} is already registered')
+        self._virtual[camera.camid] = camera
+        self._reserve(camera.camid)
+
+    def remove_virtual(self, camid):
+        return self._virtual.pop(camid, None)
+
+    def get_virtual(self, camid):
+        """Return Camera3D with camid, or None."""
+        return self._virtual.get(camid)
+
+    def add_physical(self, camid, camera):
+        """Register a physical camera, e.g. an EDSDK camera, under camid."""
+        self._physical[camid] = camera
+        self._reserve(camid)
+
+    def remove_physical(self, camid):
+        return self._physical.pop(camid, None)
+
+    def get_physical(self, camid):
+        """Return physical camera with camid, or None."""
+        return self._physical.get(camid)
+
+    def clear_virtual(self):
+        self._virtual = {}
+        self._next_id = max(self._physical, default=-1) + 1
+
+    def clear_physical(self):
+        self._physical = {}
+        self._next_id = max(self._virtual, default=-1) + 1
+
+    def clear(self):
+        self._virtual = {}
+        self._physical = {}
+        self._next_id = 0
+
+    @property
+    def ids(self):
+        """Return ids of virtual cameras in the order they were added."""
+        return list(self._virtual)
+
+    @property
+    def physical(self):
+        return list(self._physical.values())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Clearance checks between cameras, and between cameras and the proxy.
+
+Cameras are spheres of camera_radius around their positions. Two cameras
+violate clearance when their spheres come closer than margin, and a camera
+violates it when its sphere comes closer than margin to the proxy surface.
+
+Camera pairs are found with a uniform spatial hash over (timestep, cell), with
+cells as large as the clearance distance, so only cameras in the same or a
+neighboring cell at the same timestep are ever compared. A timeline is hashed,
+sorted and searched a chunk of timesteps at a time.
+"""
+
+import itertools
+import numpy as np
+
+# cell offsets in one half of the 3x3x3 neighborhood, the rest are found from the other cell
+_HALF_NEIGHBORHOOD = np.array([d for d in itertools.product((-1, 0, 1), repeat=3) if d > (0, 0, 0)])
+
+
+class Collision():
+    """First time two cameras, or a camera and the proxy, violate clearance.
+    For the proxy, other is None.
+    """
+
+    def __init__(self, camid, other, time, distance):
+        self.camid = camid
+        self.other = other
+        self.time = time
+        self.distance = distance
+
+    def __repr__(self):
+        other = 'proxy' if self.other is None else f'camera {self.other}'
+        return f'Collision(camera {self.camid}, {other}, {self.time:.2f} s, {self.distance:.1f} mm)'
+
+
+class CollisionChecker():
+    """Finds the first clearance violation per camera pair and per camera against the proxy."""
+
+    def __init__(self, camera_radius=25.0, margin=10.0):
+        self._camera_radius = camera_radius
+        self._margin = margin
+
+    def check(self, times, positions, camids, proxy3d=None):
+        """Check (t, n, 3) camera positions at t times for n cameras with
+        the given camids. Return Collision list sorted by time.
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        camids = np.asarray(camids)
+        collisions = self._check_pairs(times, positions, camids)
+        if proxy3d is not None:
+            collisions += self._check_proxy(times, positions, camids, proxy3d)
+        collisions.sort(key=lambda c: c.time)
+        return collisions
+
+    def check_simulation(self, simulator, positions, camids, proxy3d=None, step=0.05, chunk_size=256):
+        """Check a whole Simulator timeline, sampled every step seconds, in
+        chunks of chunk_size timesteps so memory stays bounded for long paths.
+        positions are the (n, 3) rest positions, used for cameras without a path.
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        times = np.arange(0.0, simulator.duration + step, step)
+        first = {}
+        for start in range(0, len(times), chunk_size):
+            chunk = times[start:start + chunk_size]
+            timeline = np.broadcast_to(positions, (len(chunk),) + positions.shape).copy()
+            indices, poses = simulator.evaluate(chunk)
+            if len(indices):
+                timeline[:, indices] = poses[..., :3]
+            # chunks run forward in time, so the first violation found is the earliest
+            for collision in self.check(chunk, timeline, camids, proxy3d):
+                first.setdefault((collision.camid, collision.other), collision)
+        return sorted(first.values(), key=lambda c: c.time)
+
+    def _check_pairs(self, times, positions, camids):
+        steps, n = positions.shape[:2]
+        if n < 2:
+            return []
+
+        clearance = 2.0 * self._camera_radius + self._margin
+        points = positions.reshape(-1, 3)
+        step = np.repeat(np.arange(steps), n)
+        cells = np.floor(points / clearance).astype(np.int64)
+        cells -= cells.min(axis=0) - 1
+        extent = cells.max(axis=0) + 2
+
+        def pack(step, cells):
+            return ((step * extent[0] + cells[:, 0]) * extent[1] + cells[:, 1]) * extent[2] + cells[:, 2]
+
+        keys = pack(step, cells)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+
+        first, second = [], []
+        # pairs within a cell, each once
+        lo = np.arange(len(sorted_keys)) + 1
+        hi = np.searchsorted(sorted_keys, sorted_keys, side='right')
+        a, b = _expand(lo, hi)
+        first.append(order[a])
+        second.append(order[b])
+        # pairs in neighboring cells
+        for offset in _HALF_NEIGHBORHOOD:
+            neighbor = pack(step[order], cells[order] + offset)
+            lo = np.searchsorted(sorted_keys, neighbor, side='left')
+            hi = np.searchsorted(sorted_keys, neighbor, side='right')
+            a, b = _expand(lo, hi)
+            first.append(order[a])
+            second.append(order[b])
+        first, second = np.concatenate(first), np.concatenate(second)
+
+        distance = np.linalg.norm(points[first] - points[second], axis=1) - 2.0 * self._camera_radius
+        hit = distance < self._margin
+        first, second, distance = first[hit], second[hit], distance[hit]
+        if len(first) == 0:
+            return []
+
+        # first violation per pair, by camera index with the lower one first
+        t = first // n
+        i, j = np.minimum(first % n, second % n), np.maximum(first % n, second % n)
+        earliest = np.lexsort((t, j, i))
+        pair = i[earliest] * n + j[earliest]
+        _, keep = np.unique(pair, return_index=True)
+        keep = earliest[keep]
+        return [Collision(camids[i[k]], camids[j[k]], float(times[t[k]]), float(distance[k])) for k in keep]
+
+    def _check_proxy(self, times, positions, camids, proxy3d):
+        distance = proxy3d.distance(positions) - self._camera_radius
+        hit = distance < self._margin
+        collisions = []
+        for camera in np.flatnonzero(hit.any(axis=0)):
+            k = int(np.argmax(hit[:, camera]))
+            collisions.append(Collision(camids[camera], None, float(times[k]), float(distance[k, camera])))
+        return collisions
+
+    @property
+    def camera_radius(self):
+        return self._camera_radius
+
+    @camera_radius.setter
+    def camera_radius(self, value):
+        self._camera_radius = value
+
+    @property
+    def margin(self):
+        return self._margin
+
+    @margin.setter
+    def margin(self, value):
+        self._margin = value
+
+
+def _expand(lo, hi):
+    """Return (i, k) for every i and every k in range(lo[i], hi[i])."""
+    count = np.maximum(hi - lo, 0)
+    i = np.repeat(np.arange(len(lo)), count)
+    start = np.cumsum(count) - count
+    k = np.arange(count.sum()) - np.repeat(start, count) + np.repeat(lo, count)
+    return i, k
@@ -242,17 +242,20 @@ class Camera:
 class CameraList:
     def __init__(self):
         self.list = c_void_p(None)
+        self.cam_model_list = []
+        self.cam_models = {}
+        self.selected_camera = None
+        self.count = 0
 
         try:
             self.list = _edsdk.EdsGetCameraList()
-            self.cam_model_list = []
-            self.selected_camera = None
             self.count = _edsdk.EdsGetChildCount(self.list)
 
             if self.count != 0:
                 # transfer EDSDK camera object to custom camera object
                 for i in range(self.count):
                     self.cam_model_list.append(Camera(i, _edsdk.EdsGetChildAtIndex(self.list, i)))
+                    self.cam_models[i] = self.cam_model_list[-1]
 
             _edsdk.EdsRelease(self.list)
         except Exception as e:
@@ -262,24 +265,10 @@ class CameraList:
         return self.count
 
     def get_camera_by_index(self, index):
-        return cam_model_list[index]
+        return self.cam_model_list[index]
 
     def get_camera_by_id(self, id):
-        if id not in range(len(self.cam_model_list)):
-            for model in self.cam_model_list:
-                if model.id == id:
-                    return model
-        else:
-            index = id
-            while index in range(len(self.cam_model_list)):
-                model_index = self.cam_model_list[index]
-                if model_index.id == id:
-                    return model_index
-                elif model_index.id > id:
-                    index -= 1
-                else:
-                    index += 1
-        return None
+        return self.cam_models.get(id)
 
     def set_selected_cam_by_id(self, id):
         self.selected_camera = self.get_camera_by_id(id)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""GcodeSender class.
+
+Streams G-code lines to the motion controller from a background thread, so the
+caller never blocks on serial I/O. The controller answers every line with ok
+or error. With character counting flow control, lines are sent for as long as
+the unacknowledged ones fit in the controller's receive buffer, so the buffer
+stays full without overflowing. With ok flow control, only one line is in
+flight at a time.
+
+Responses are framed into lines across reads, so an ok split by a read timeout
+is still counted once. Callbacks run on the sender thread, and only for the
+latest run: callbacks of a run that was aborted and replaced are dropped. GUI
+code should hand them to its own thread, e.g. with wx.CallAfter. If the port
+fails or is closed mid run, on_error reports it and the run ends as aborted.
+"""
+
+import re
+import serial
+import threading
+import time
+
+from collections import deque
+
+from util.serial_transport import LineFramer
+
+FLOW_CONTROLS = ('count', 'ok')
+
+# raised by pyserial and the OS when the port is closed or unplugged mid read
+_PORT_ERRORS = (serial.SerialException, OSError, TypeError, ValueError)
+
+_COMMENT = re.compile(r'\([^)]*\)')
+
+
+def clean_line(line):
+    """Return line without comments and surrounding whitespace."""
+    return _COMMENT.sub('', line.split(';', 1)[0]).strip()
+
+
+class GcodeSender():
+    """Background G-code streamer with pause, resume and abort."""
+
+    # seconds to wait for a response before checking for pause and abort again
+    read_timeout = 0.01
+    # seconds between progress callbacks
+    progress_interval = 0.05
+
+    def __init__(self, port, rx_buffer_size=128, flow_control='count'):
+        if flow_control not in FLOW_CONTROLS:
+            raise ValueError(f'unknown flow control "{flow_control}", expected one of {", ".join(FLOW_CONTROLS)}')
+        self._port = port
+        self._rx_buffer_size = rx_buffer_size
+        self._flow_control = flow_control
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._run_id = 0
+        self._framer = LineFramer()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._aborted = False
+        self._sent = 0
+        self._acked = 0
+        self._total = 0
+
+        # on_progress(acked, total), on_response(text), on_error(index, text), on_done(aborted)
+        self.on_progress = None
+        self.on_response = None
+        self.on_error = None
+        self.on_done = None
+
+    def send(self, lines):
+        """Queue lines and start streaming if idle. Comments and blank lines are dropped."""
+        lines = [line for line in (clean_line(line) for line in lines) if line]
+        if not lines:
+            return
+
+        with self._lock:
+            if self._thread is not None and not self._aborted:
+                self._queue.extend(lines)
+                self._total += len(lines)
+                return
+            stale = self._thread
+        # an aborted run may still be reading the port, let it stop first
+        if stale is not None:
+            stale.join()
+
+        with self._lock:
+            self._queue.extend(lines)
+            self._run_id += 1
+            self._sent = self._acked = 0
+            self._total = len(lines)
+            self._aborted = False
+            self._thread = threading.Thread(target=self._run, args=(self._run_id,), name='GcodeSender', daemon=True)
+            self._thread.start()
+
+    def pause(self):
+        """Stop sending new lines. Lines already sent still complete."""
+        self._resume.clear()
+
+    def resume(self):
+        self._resume.set()
+
+    def abort(self):
+        """Drop all queued lines and stop streaming. Acknowledgements of lines
+        already sent are not waited for, so reset the controller before sending again.
+        """
+        with self._lock:
+            self._queue.clear()
+            self._aborted = True
+        self._resume.set()
+
+    def join(self, timeout=None):
+        """Wait until streaming stops, or timeout seconds pass."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self._thread is not None:
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            time.sleep(self.read_timeout)
+        return True
+
+    def _emit(self, run, callback, *args):
+        """Call callback unless it is None or a newer run has started."""
+        if callback is not None and run == self._run_id:
+            callback(*args)
+
+    def _run(self, run):
+        port = self._port
+        old_timeout = port.timeout
+        port.timeout = self.read_timeout
+        # a partial line left by an aborted run is not an answer to this one
+        self._framer.clear()
+        # byte counts of the lines the controller has not acknowledged yet
+        in_flight = deque()
+        buffered = 0
+        last_progress = 0.0
+        try:
+            while True:
+                batch = []
+                with self._lock:
+                    if self._aborted or (not self._queue and not in_flight):
+                        # from here on, send starts a new thread
+                        port.timeout = old_timeout
+                        self._thread = None
+                        break
+                    while self._queue and self._resume.is_set():
+                        data = (self._queue[0] + '\n').encode('ascii', errors='replace')
+                        if in_flight and (self._flow_control == 'ok'
+                                          or buffered + len(data) > self._rx_buffer_size):
+                            break
+                        self._queue.popleft()
+                        batch.append(data)
+                        in_flight.append(len(data))
+                        buffered += len(data)
+                if batch:
+                    port.write(b''.join(batch))
+                    self._sent += len(batch)
+
+                if not in_flight:
+                    # paused with nothing left to acknowledge
+                    self._resume.wait(self.read_timeout * 10)
+                    continue
+
+                # returns what arrived within the timeout, maybe part of a line
+                for text in self._framer.feed(port.read(port.in_waiting or 1)):
+                    if not in_flight:
+                        # e.g. a report after an abort, nothing to acknowledge
+                        self._emit(run, self.on_response, text)
+                    elif text == 'ok' or text.startswith('error'):
+                        buffered -= in_flight.popleft()
+                        self._acked += 1
+                        if text != 'ok':
+                            self._emit(run, self.on_error, self._acked - 1, text)
+                        now = time.perf_counter()
+                        if now - last_progress >= self.progress_interval:
+                            last_progress = now
+                            self._emit(run, self.on_progress, self._acked, self._total)
+                    else:
+                        self._emit(run, self.on_response, text)
+        except _PORT_ERRORS as e:
+            with self._lock:
+                self._queue.clear()
+                self._aborted = True
+            self._emit(run, self.on_error, self._acked, f'port error: {e}')
+        finally:
+            aborted = self._aborted
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                    try:
+                        port.timeout = old_timeout
+                    except _PORT_ERRORS:
+                        pass
+            self._emit(run, self.on_progress, self._acked, self._total)
+            self._emit(run, self.on_done, aborted)
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def busy(self):
+        return self._thread is not None
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @property
+    def acked(self):
+        return self._acked
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def rx_buffer_size(self):
+        return self._rx_buffer_size
+
+    @property
+    def flow_control(self):
+        return self._flow_control
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Per axis motion time model of the X, Y, Z, B, C gantry.
+
+Every axis starts and stops at rest and moves on its own velocity, acceleration
+and jerk limits. All axes of a move start together, so a move takes as long as
+its slowest axis. Durations come from closed form trapezoidal or jerk limited
+S-curve profiles, evaluated over whole arrays of moves at once.
+
+Limits are read from the [Kinematics] section of copis.ini, for example
+
+    [Kinematics]
+    profile = s-curve
+    x_velocity = 50
+    x_acceleration = 200
+    x_jerk = 2000
+
+with x, y, z in mm and b, c in degrees. Missing keys keep their defaults.
+"""
+
+import numpy as np
+
+from enums import CamAxis
+
+AXES = (CamAxis.X, CamAxis.Y, CamAxis.Z, CamAxis.B, CamAxis.C)
+PROFILES = ('trapezoid', 's-curve')
+
+# per axis defaults, in mm or deg per s, s^2 and s^3
+DEFAULT_VELOCITY = (50.0, 50.0, 50.0, 45.0, 45.0)
+DEFAULT_ACCELERATION = (200.0, 200.0, 200.0, 180.0, 180.0)
+DEFAULT_JERK = (2000.0, 2000.0, 2000.0, 1800.0, 1800.0)
+
+
+class Kinematics():
+    """Velocity, acceleration and jerk limits of the five axes."""
+
+    def __init__(self, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION, jerk=DEFAULT_JERK,
+                 profile='s-curve'):
+        if profile not in PROFILES:
+            raise ValueError(f'unknown motion profile "{profile}", expected one of {", ".join(PROFILES)}')
+        self._velocity = np.asarray(velocity, dtype=np.float64)
+        self._acceleration = np.asarray(acceleration, dtype=np.float64)
+        self._jerk = np.asarray(jerk, dtype=np.float64)
+        self._profile = profile
+
+    @classmethod
+    def from_config(cls, config, section='Kinematics'):
+        """Create from a ConfigParser, using defaults for anything missing."""
+        if config is None or not config.has_section(section):
+            return cls()
+
+        limits = []
+        for key, defaults in (('velocity', DEFAULT_VELOCITY),
+                              ('acceleration', DEFAULT_ACCELERATION),
+                              ('jerk', DEFAULT_JERK)):
+            limits.append([config.getfloat(section, f'{axis.value}_{key}', fallback=default)
+                           for axis, default in zip(AXES, defaults)])
+        return cls(*limits, profile=config.get(section, 'profile', fallback='s-curve'))
+
+    def axis_times(self, distances):
+        """Return the time each axis needs for (..., 5) distances, moving from rest to rest."""
+        d = np.abs(np.asarray(distances, dtype=np.float64))
+        v, a = self._velocity, self._acceleration
+        if self._profile == 'trapezoid':
+            return _trapezoid(d, v, a)
+        return _s_curve(d, v, a, self._jerk)
+
+    def move_times(self, deltas):
+        """Return durations of (..., 5) pose changes, the slowest axis of each."""
+        return self.axis_times(deltas).max(axis=-1)
+
+    def path_times(self, poses):
+        """Return durations of the moves between consecutive poses of an (n, 5) array."""
+        poses = np.asarray(poses, dtype=np.float64)
+        if len(poses) < 2:
+            return np.zeros(0)
+        return self.move_times(np.diff(poses, axis=0))
+
+    def schedule(self, poses, dwell=0.0):
+        """Return (arrive, leave) times of an (n, 5) path started at time 0,
+        waiting dwell seconds, a scalar or one per pose, at every pose.
+        """
+        n = len(poses)
+        dwell = np.broadcast_to(np.asarray(dwell, dtype=np.float64), (n,))
+        leave = np.cumsum(dwell)
+        leave[1:] += np.cumsum(self.path_times(poses))
+        return leave - dwell, leave
+
+    @property
+    def velocity(self):
+        return self._velocity
+
+    @property
+    def acceleration(self):
+        return self._acceleration
+
+    @property
+    def jerk(self):
+        return self._jerk
+
+    @property
+    def profile(self):
+        return self._profile
+
+
+def _trapezoid(d, v, a):
+    # cruise at v when the ramps up and down fit, otherwise a triangle
+    ramp = v * v / a
+    return np.where(d >= ramp, d / v + v / a, 2.0 * np.sqrt(d / a))
+
+
+def _s_curve(d, v, a, j):
+    # a is only reached when v allows it, otherwise the ramp is pure jerk
+    a = np.minimum(a, np.sqrt(v * j))
+    # time to ramp from rest to v, and the distance covered ramping up and down
+    ramp_time = v / a + a / j
+    cruise = d >= v * ramp_time
+
+    # v is not reached: peak velocity with a constant acceleration phase,
+    # from vp^2 / a + vp a / j = d, valid while vp >= a^2 / j
+    k = a / j
+    peak = 0.5 * a * (np.sqrt(k * k + 4.0 * d / a) - k)
+    with_accel = 2.0 * (peak / a + k)
+    # or too short to reach a, from d = 2 vp sqrt(vp / j)
+    jerk_only = 4.0 * np.cbrt(d / (2.0 * j))
+
+    short = np.where(peak >= a * k, with_accel, jerk_only)
+    return np.where(cruise, d / v + ramp_time, short)
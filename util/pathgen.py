@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Vectorized camera path generators.
+
+Every generator returns an (n, 5) float32 array of x, y, z, b, c poses, with
+all cameras turned toward a target point, by default the proxy center at the
+origin. Y is up, so rings and circles lie parallel to the bed.
+
+Run python3 -m util.pathgen to benchmark every generator.
+"""
+
+import math
+import time
+import numpy as np
+
+GENERATORS = {}
+
+# the largest nearest neighbour angle, in radians, between poses of an n pose
+# Fibonacci lattice is about this constant / sqrt(n)
+_FIBONACCI_SPACING = 3.56
+
+
+def register(name):
+    """Register a generator function under a path style name."""
+    def decorator(func):
+        GENERATORS[name] = func
+        return func
+    return decorator
+
+
+def generate(style, target=(0.0, 0.0, 0.0), **params):
+    """Return (n, 5) poses of the given style, facing target."""
+    if style not in GENERATORS:
+        raise ValueError(f'unknown path style "{style}"')
+    xyz = np.asarray(GENERATORS[style](**params), dtype=np.float64).reshape(-1, 3)
+    return look_at(xyz, target)
+
+
+def look_at(xyz, target=(0.0, 0.0, 0.0)):
+    """Return (n, 5) poses at xyz with b and c, in degrees, turning a camera
+    that faces -x at rest toward target. Poses at the target keep b = c = 0.
+    """
+    d = np.asarray(target, dtype=np.float64) - xyz
+    norm = np.linalg.norm(d, axis=1, keepdims=True)
+    d = np.divide(d, norm, out=np.zeros_like(d), where=norm > 0)
+    hit = norm[:, 0] == 0
+    d[hit, 0] = -1.0
+
+    poses = np.empty((len(xyz), 5), dtype=np.float32)
+    poses[:, :3] = xyz
+    poses[:, 3] = np.degrees(np.arctan2(-d[:, 1], -d[:, 0]))
+    poses[:, 4] = np.degrees(np.arcsin(np.clip(d[:, 2], -1.0, 1.0)))
+    return poses
+
+
+def _ring(center, radius, y, points):
+    """Return (len(y), points, 3) circles of radius around the vertical axis through center."""
+    theta = np.linspace(0.0, 2.0 * np.pi, points, endpoint=False)
+    radius = np.broadcast_to(radius, np.shape(y))[:, None]
+    return np.stack([
+        center[0] + radius * np.cos(theta),
+        np.broadcast_to(np.asarray(y, dtype=np.float64)[:, None], (len(y), points)),
+        center[2] + radius * np.sin(theta)], axis=-1)
+
+
+@register('Line')
+def line(start, end, points, **_):
+    """Points evenly spaced from start to end."""
+    t = np.linspace(0.0, 1.0, points)[:, None]
+    return np.asarray(start) + t * (np.subtract(end, start))
+
+
+@register('Sphere')
+def sphere(start, radius, circles, points_per_circle, **_):
+    """Rings of equal point count at evenly spaced latitudes, poles excluded, centered at start."""
+    latitude = np.linspace(-0.5 * np.pi, 0.5 * np.pi, circles + 2)[1:-1]
+    rings = _ring(start, radius * np.cos(latitude), start[1] + radius * np.sin(latitude), points_per_circle)
+    return rings.reshape(-1, 3)
+
+
+@register('Fibonacci Sphere')
+def fibonacci_sphere(start, radius, spacing=None, points=None, **_):
+    """Equal-area Fibonacci lattice on a sphere centered at start. Give either
+    points, or spacing, the largest angle in degrees between neighbouring poses,
+    to use the fewest poses that reach it.
+    """
+    n = fibonacci_count(spacing) if points is None else points
+    i = np.arange(n)
+    y = 1.0 - (2.0 * i + 1.0) / n
+    r = np.sqrt(1.0 - y * y)
+    theta = i * np.pi * (3.0 - np.sqrt(5.0))
+    return np.asarray(start) + radius * np.stack([r * np.cos(theta), y, r * np.sin(theta)], axis=1)
+
+
+def fibonacci_count(spacing):
+    """Return the fewest Fibonacci sphere poses with neighbours at most spacing degrees apart."""
+    return int(math.ceil((_FIBONACCI_SPACING / math.radians(spacing)) ** 2))
+
+
+def ring_count(spacing):
+    """Return (circles, points per circle) of the Sphere ring layout with
+    neighbours at most spacing degrees apart, along the equator and between rings.
+    """
+    return int(math.ceil(180.0 / spacing)) - 1, int(math.ceil(360.0 / spacing))
+
+
+def sphere_savings(spacing):
+    """Return (equal-area poses, ring poses) needed for the same angular spacing."""
+    circles, points_per_circle = ring_count(spacing)
+    return fibonacci_count(spacing), circles * points_per_circle
+
+
+@register('Cylinder')
+def cylinder(start, end, radius, circles, points_per_circle, **_):
+    """Rings around the vertical axis through start, from the height of start to that of end."""
+    return _ring(start, radius, np.linspace(start[1], end[1], circles), points_per_circle).reshape(-1, 3)
+
+
+@register('Helix')
+def helix(start, end, radius, points, turns=1, **_):
+    """Helix of radius around the axis from start to end."""
+    start = np.asarray(start, dtype=np.float64)
+    axis = np.subtract(end, start)
+    length = np.linalg.norm(axis)
+    n = axis / length if length > 0 else np.array([0.0, 1.0, 0.0])
+
+    # any unit vector perpendicular to the axis, and the one completing the basis
+    a = np.cross(n, [1.0, 0.0, 0.0] if abs(n[0]) < 0.9 else [0.0, 0.0, 1.0])
+    a /= np.linalg.norm(a)
+    b = np.cross(n, a)
+
+    t = np.linspace(0.0, 1.0, points)[:, None]
+    theta = 2.0 * np.pi * turns * t
+    return start + t * axis + radius * (np.cos(theta) * a + np.sin(theta) * b)
+
+
+@register('Cube')
+def cube(start, end, points, **_):
+    """Points on a points x points grid on every face of the box between start and end."""
+    low, high = np.minimum(start, end), np.maximum(start, end)
+    u = np.linspace(0.0, 1.0, max(points, 2))
+    inner = u[1:-1]
+
+    # x faces are full grids, y faces skip the x edges, and z faces skip both
+    # so that no edge or corner point is generated twice
+    faces = []
+    for axis, (first, second) in enumerate(((u, u), (inner, u), (inner, inner))):
+        s, t = (g.ravel() for g in np.meshgrid(first, second, indexing='ij'))
+        i, j = (k for k in range(3) if k != axis)
+        for side in (0.0, 1.0):
+            face = np.empty((len(s), 3))
+            face[:, axis] = side
+            face[:, i] = s
+            face[:, j] = t
+            faces.append(face)
+    unit = np.concatenate(faces)
+    return low + unit * (high - low)
+
+
+@register('Grid')
+def grid(start, end, points, **_):
+    """Lattice of points samples along every axis on which start and end differ."""
+    axes = [np.linspace(s, e, points) if s != e else np.array([s], dtype=np.float64)
+            for s, e in zip(start, end)]
+    return np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+
+
+# parameters giving about 100k poses for every style
+_BENCHMARK_PARAMS = {
+    'Line': dict(start=(-200, 0, 0), end=(200, 100, 0), points=100000),
+    'Sphere': dict(start=(0, 0, 0), radius=150, circles=250, points_per_circle=400),
+    'Fibonacci Sphere': dict(start=(0, 0, 0), radius=150, points=100000),
+    'Cylinder': dict(start=(0, -100, 0), end=(0, 100, 0), radius=150, circles=250, points_per_circle=400),
+    'Helix': dict(start=(0, -100, 0), end=(0, 100, 0), radius=150, points=100000, turns=50),
+    'Cube': dict(start=(-100, -100, -100), end=(100, 100, 100), points=130),
+    'Grid': dict(start=(-200, -200, -200), end=(200, 200, 200), points=47),
+}
+
+
+def benchmark(params=None, repeat=5):
+    """Return {style: (pose count, best seconds)} over repeat runs of each generator."""
+    params = params or _BENCHMARK_PARAMS
+    results = {}
+    for style in GENERATORS:
+        if style not in params:
+            continue
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            poses = generate(style, **params[style])
+            best = min(best, time.perf_counter() - start)
+        results[style] = (len(poses), best)
+    return results
+
+
+if __name__ == '__main__':
+    for style, (count, seconds) in benchmark().items():
+        print(f'{style:<16} {count:>8} poses {seconds * 1000.0:9.2f} ms {count / seconds / 1e6:8.2f} Mposes/s')
+
+    print()
+    for spacing in (5, 10, 15, 20, 30):
+        equal_area, rings = sphere_savings(spacing)
+        print(f'{spacing:>2} deg spacing: {equal_area:>5} equal-area poses vs {rings:>5} rings, '
+              f'{rings - equal_area} fewer ({100.0 * (rings - equal_area) / rings:.0f}%)')
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""Travel time optimal ordering of path poses.
+
+A tour starts at the first pose and visits every other pose once. It is built
+greedily from nearest neighbors and then improved with 2-opt and Or-opt moves
+until no move helps or the time budget runs out. The cost of a move is the time
+the gantry needs for it, from the per axis limits of util.kinematics.
+
+Small paths use exact vectorized costs against every pose. Large paths restrict
+candidates to the nearest poses in a KD-tree over velocity scaled poses.
+"""
+
+import time
+import numpy as np
+
+from util.kinematics import Kinematics
+
+# paths larger than this use KD-tree neighborhoods instead of all poses
+DENSE_LIMIT = 3000
+NEIGHBORS = 10
+
+
+def capture_time(poses, flags=None, kinematics=None):
+    """Return estimated time of a run: travel plus dwell at every pose."""
+    kinematics = kinematics or Kinematics()
+    dwell = 0.0 if flags is None else float(np.sum(flags['dwell']))
+    return float(kinematics.path_times(poses).sum()) + dwell
+
+
+class _Tour():
+    """Open tour over poses, with the first pose fixed."""
+
+    def __init__(self, poses, kinematics, order, neighbors=None):
+        self.x = poses
+        self.kinematics = kinematics
+        self.order = np.asarray(order, dtype=np.int64)
+        self.neighbors = neighbors
+        self.position = np.empty_like(self.order)
+        self.position[self.order] = np.arange(len(self.order))
+
+    def cost(self, a, b):
+        """Return move times between pose indices a and b, elementwise."""
+        return self.kinematics.move_times(self.x[a] - self.x[b])
+
+    def length(self):
+        return float(self.cost(self.order[:-1], self.order[1:]).sum())
+
+    def candidates(self, city, lo):
+        """Return tour positions > lo worth trying next to city."""
+        n = len(self.order)
+        if self.neighbors is None:
+            return np.arange(lo + 1, n)
+        positions = self.position[self.neighbors[city]]
+        return positions[positions > lo]
+
+    def reverse(self, i, j):
+        self.order[i:j + 1] = self.order[i:j + 1][::-1].copy()
+        self.position[self.order[i:j + 1]] = np.arange(i, j + 1)
+
+    def two_opt(self, deadline):
+        """Apply the best improving segment reversal for each position, return True if any."""
+        order, n = self.order, len(self.order)
+        improved = False
+        for i in range(1, n - 1):
+            if time.perf_counter() > deadline:
+                break
+            a, b = order[i - 1], order[i]
+            # reverse order[i:j + 1], so a is followed by order[j] and order[i] by order[j + 1]
+            j = self.candidates(a, i)
+            if len(j) == 0:
+                continue
+            c = order[j]
+            has_next = j + 1 < n
+            d = order[np.minimum(j + 1, n - 1)]
+            delta = self.cost(a, c) - self.cost(a, b) + np.where(has_next, self.cost(b, d) - self.cost(c, d), 0.0)
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                self.reverse(i, int(j[best]))
+                improved = True
+        return improved
+
+    def or_opt(self, deadline, max_segment=3):
+        """Move segments of up to max_segment poses to their best position, return True if any."""
+        improved = False
+        for length in range(1, max_segment + 1):
+            i = 1
+            while i + length <= len(self.order):
+                if time.perf_counter() > deadline:
+                    return improved
+                if self._move_segment(i, length):
+                    improved = True
+                i += 1
+        return improved
+
+    def _move_segment(self, i, length):
+        order, n = self.order, len(self.order)
+        first, last, prev = order[i], order[i + length - 1], order[i - 1]
+        # time saved by joining prev to the pose after the segment
+        gain = self.cost(prev, first)
+        if i + length < n:
+            following = order[i + length]
+            gain += self.cost(last, following) - self.cost(prev, following)
+
+        # insert between order[k] and order[k + 1], or after the last pose
+        if self.neighbors is None:
+            k = np.arange(n)
+        else:
+            near = self.position[np.concatenate([self.neighbors[first], self.neighbors[last]])]
+            k = np.unique(np.concatenate([near, near - 1]))
+            k = k[k >= 0]
+        k = k[(k < i - 1) | (k >= i + length)]
+        if len(k) == 0:
+            return False
+
+        left = order[k]
+        has_next = k + 1 < n
+        right = order[np.minimum(k + 1, n - 1)]
+        edge = np.where(has_next, self.cost(left, right), 0.0)
+        forward = self.cost(left, first) + np.where(has_next, self.cost(last, right), 0.0) - edge
+        backward = self.cost(left, last) + np.where(has_next, self.cost(first, right), 0.0) - edge
+        insert = np.minimum(forward, backward)
+        best = int(np.argmin(insert))
+        if insert[best] - gain >= -1e-9:
+            return False
+
+        segment = order[i:i + length]
+        if backward[best] < forward[best]:
+            segment = segment[::-1]
+        rest = np.concatenate([order[:i], order[i + length:]])
+        at = int(k[best]) + 1 - (length if k[best] >= i + length else 0)
+        self.order = np.concatenate([rest[:at], segment, rest[at:]])
+        self.position[self.order] = np.arange(n)
+        return True
+
+
+def _greedy_dense(poses, kinematics, start, deadline):
+    n = len(poses)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.int64)
+    current = start
+    for step in range(n):
+        order[step] = current
+        visited[current] = True
+        if step == n - 1:
+            break
+        if step % 64 == 0 and time.perf_counter() > deadline:
+            # out of time, the rest keep their given order
+            order[step + 1:] = np.flatnonzero(~visited)
+            break
+        cost = kinematics.move_times(poses - poses[current])
+        cost[visited] = np.inf
+        current = int(np.argmin(cost))
+    return order
+
+
+def _greedy_kdtree(scaled, start, tree, deadline):
+    n = len(scaled)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.int64)
+    current = start
+    for step in range(n):
+        order[step] = current
+        visited[current] = True
+        if step == n - 1:
+            break
+        if step % 64 == 0 and time.perf_counter() > deadline:
+            # out of time, the rest keep their given order
+            order[step + 1:] = np.flatnonzero(~visited)
+            break
+        k = NEIGHBORS
+        while True:
+            _, near = tree.query(scaled[current], k=min(k, n), p=np.inf)
+            near = near[~visited[near]]
+            if len(near) or k >= n:
+                break
+            k *= 4
+        if len(near):
+            current = int(near[0])
+        else:
+            rest = np.flatnonzero(~visited)
+            current = int(rest[np.argmin(np.abs(scaled[rest] - scaled[current]).max(axis=1))])
+    return order
+
+
+def _neighbors(tree, scaled):
+    _, near = tree.query(scaled, k=min(NEIGHBORS + 1, len(scaled)), p=np.inf)
+    return near[:, 1:]
+
+
+def order_poses(poses, kinematics=None, time_budget=2.0, start=0):
+    """Return (order, before, after) for poses, where order is a permutation
+    starting at start that visits all poses, and before and after are the travel
+    times of the given and the optimized order in seconds.
+    """
+    deadline = time.perf_counter() + time_budget
+    kinematics = kinematics or Kinematics()
+    poses = np.asarray(poses, dtype=np.float64)
+    n = len(poses)
+    before = float(kinematics.path_times(poses).sum())
+    if n < 3:
+        order = np.concatenate([[start], np.delete(np.arange(n), start)]) if n else np.arange(0)
+        return order, before, float(kinematics.path_times(poses[order]).sum())
+
+    if n <= DENSE_LIMIT:
+        order, neighbors = _greedy_dense(poses, kinematics, start, deadline), None
+    else:
+        from scipy.spatial import cKDTree
+        # nearest in Chebyshev distance over poses scaled by max velocity are
+        # the fastest long moves, close enough to find candidates
+        scaled = poses / kinematics.velocity
+        tree = cKDTree(scaled)
+        order, neighbors = _greedy_kdtree(scaled, start, tree, deadline), _neighbors(tree, scaled)
+
+    tour = _Tour(poses, kinematics, order, neighbors)
+    while time.perf_counter() < deadline:
+        improved = tour.two_opt(deadline)
+        improved = tour.or_opt(deadline) or improved
+        if not improved:
+            break
+
+    after = tour.length()
+    if after > before and start == 0:
+        # keep the original order if it was already better
+        return np.arange(n), before, before
+    return tour.order, before, after
+
+
+def optimize_path(poses, flags=None, kinematics=None, time_budget=2.0):
+    """Reorder poses, keeping the poses of each camera together and in the
+    order the cameras first appear. Return (poses, flags, before, after),
+    where before and after are estimated capture times in seconds.
+    """
+    poses = np.asarray(poses)
+    kinematics = kinematics or Kinematics()
+    if flags is None:
+        groups = [np.arange(len(poses))]
+    else:
+        camids, first = np.unique(flags['camid'], return_index=True)
+        groups = [np.flatnonzero(flags['camid'] == camid) for camid in camids[np.argsort(first)]]
+
+    deadline = time.perf_counter() + time_budget
+    total = max(1, len(poses))
+    order = []
+    for group in groups:
+        # share the budget by group size
+        budget = max(0.0, deadline - time.perf_counter()) * len(group) / total
+        total -= len(group)
+        group_order, _, _ = order_poses(poses[group], kinematics, budget)
+        order.append(group[group_order])
+    order = np.concatenate(order) if order else np.arange(0)
+
+    new_poses = poses[order]
+    new_flags = None if flags is None else flags[order]
+    # moves between cameras do not happen, each camera travels only its own poses
+    before = sum(capture_time(poses[g], None if flags is None else flags[g], kinematics) for g in groups)
+    after = sum(capture_time(new_poses[np.isin(order, g)], None if flags is None else new_flags[np.isin(order, g)],
+                             kinematics) for g in groups)
+    return new_poses, new_flags, before, after
+
+
+if __name__ == '__main__':
+    from util.pathgen import generate
+
+    for style, params in (
+            ('Sphere', dict(start=(0, 0, 0), radius=150, circles=12, points_per_circle=24)),
+            ('Fibonacci Sphere', dict(start=(0, 0, 0), radius=150, spacing=10)),
+            ('Grid', dict(start=(-100, 0, -100), end=(100, 100, 100), points=8))):
+        poses = generate(style, **params)
+        start = time.perf_counter()
+        _, _, before, after = optimize_path(poses)
+        print(f'{style:<16} {len(poses):>5} poses: {before:8.1f} s -> {after:8.1f} s '
+              f'({100.0 * (before - after) / before:.0f}% less) in {time.perf_counter() - start:.2f} s')
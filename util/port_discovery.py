@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Serial port discovery.
+
+PortWatcher enumerates serial ports on a background thread and reports ports
+that are plugged in or removed. probe_baud finds the baud rate a controller
+answers at by sending a handshake command at each candidate rate, with a
+timeout per rate.
+"""
+
+import threading
+import time
+
+import serial
+from serial.tools import list_ports
+
+# most likely first, so a probe usually stops early
+BAUDS = (115200, 250000, 57600, 38400, 19200, 9600)
+
+
+class PortWatcher():
+    """Polls the serial port list on a background thread."""
+
+    def __init__(self, interval=1.0):
+        self._interval = interval
+        self._ports = []
+        self._thread = None
+        self._stop = threading.Event()
+
+        # on_change(ports, added, removed), called on the watcher thread
+        self.on_change = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='PortWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self._interval):
+                break
+
+    def refresh(self):
+        """Enumerate ports now. Return whether the list changed."""
+        ports = sorted(info.device for info in list_ports.comports())
+        if ports == self._ports:
+            return False
+
+        added = [port for port in ports if port not in self._ports]
+        removed = [port for port in self._ports if port not in ports]
+        self._ports = ports
+        if self.on_change is not None:
+            self.on_change(ports, added, removed)
+        return True
+
+    @property
+    def ports(self):
+        return list(self._ports)
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @interval.setter
+    def interval(self, value):
+        self._interval = value
+
+
+def _is_answer(line):
+    """Return whether line is a protocol answer: ok, an error, or a firmware
+    report. At a wrong baud rate noise can still decode as printable text.
+    """
+    text = line.strip()
+    return text == b'ok' or text.startswith(b'ok ') or text.startswith(b'error') or b'FIRMWARE_NAME' in text
+
+
+def probe_baud(name, bauds=BAUDS, command='M115', timeout=0.3):
+    """Return the first of bauds port name answers command at, or None.
+    Waits at most timeout seconds per rate.
+    """
+    for baud in bauds:
+        port = serial.Serial()
+        port.port = name
+        port.baudrate = baud
+        port.timeout = timeout
+        port.write_timeout = timeout
+        # keep boards that reset on DTR from rebooting
+        port.dtr = False
+        try:
+            port.open()
+        except (serial.SerialException, OSError):
+            # busy or gone, other rates will not do better
+            return None
+
+        try:
+            port.reset_input_buffer()
+            port.write((command + '\n').encode('ascii'))
+            deadline = time.perf_counter() + timeout
+            while time.perf_counter() < deadline:
+                line = port.readline()
+                if _is_answer(line):
+                    return baud
+        except (serial.SerialException, OSError):
+            return None
+        finally:
+            port.close()
+    return None
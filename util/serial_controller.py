@@ -1,33 +1,192 @@
 #!/usr/bin/env python3
 
+import asyncio
 import serial
-from serial.tools import list_ports
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from util.port_discovery import BAUDS, PortWatcher, probe_baud
+from util.serial_manager import SerialManager, board_sections
+from util.serial_transport import SerialTransport
 
 
 class SerialController(object):
+    """Serial ports of the motion controller. Ports are enumerated and their baud
+    rates detected on background threads, so nothing here blocks the caller.
+    State shared with those threads is guarded by a lock, and callbacks are
+    called without holding it.
+
+    Rigs with several boards configure them in [Board <name>] sections. The
+    controller then holds a SerialManager, which runs on an event loop thread
+    of its own, instead of using the selected port.
+    """
+
     def __init__(self):
         super(SerialController, self).__init__()
         self.selected_serial = None
-        self.ports = self.get_ports()
-        self.bauds = []
+        self.ports = []
+        self.bauds = list(BAUDS)
+        # port name -> detected baud rate, None if the port did not answer
+        self.detected_bauds = {}
 
-    def get_ports(self):
-        ports = []
+        self._watcher = PortWatcher()
+        self._watcher.on_change = self._on_ports_changed
+        self._executor = ThreadPoolExecutor(max_workers=8)
+        self._probes = {}  # port name -> Future
+        self._lock = threading.RLock()
+
+        # multi-board rigs
+        self.manager = None
+        self._board_config = None
+        self._loop = None
+
+        # on_ports_changed(ports) and on_baud_detected(port, baud), called on background threads
+        self.on_ports_changed = None
+        self.on_baud_detected = None
+
+    def start(self):
+        """Start watching for ports being plugged in and removed."""
+        self._watcher.start()
+
+    def close(self):
+        self._watcher.stop()
+        self._executor.shutdown(wait=False)
+        self.close_boards()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    def configure_boards(self, config):
+        """Use the enabled [Board <name>] sections of a ConfigParser, if any.
+        Return whether boards are configured.
+        """
+        self._board_config = config if config is not None and board_sections(config) else None
+        return self._board_config is not None
+
+    @property
+    def boards_configured(self):
+        return self._board_config is not None
+
+    def _run_on_loop(self, coroutine):
+        """Run coroutine on the board event loop thread and return a concurrent Future."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name='SerialManager', daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def open_boards(self, timeout=5.0):
+        """Open all configured boards and return the manager. Raises what
+        opening a port raises, with no board left open.
+        """
+        if self._board_config is None:
+            return None
+        if self.manager is None:
+            manager = SerialManager()
 
-        for n, (portname, desc, hwind) in enumerate(sorted(list_ports.comports())):
-            ports.append(portname)
-        return ports
+            async def open_all():
+                try:
+                    manager.open_boards(self._board_config)
+                except BaseException:
+                    manager.close()
+                    raise
+
+            self._run_on_loop(open_all()).result(timeout)
+            self.manager = manager
+        return self.manager
+
+    def close_boards(self):
+        if self.manager is None:
+            return
+        manager, self.manager = self.manager, None
+
+        async def close_all():
+            manager.close()
+
+        self._run_on_loop(close_all()).result()
+
+    def send_boards(self, commands):
+        """Stream commands to the open boards. Return a concurrent Future of
+        {board name: Response list}, see SerialManager.send_all.
+        """
+        return self._run_on_loop(self.manager.send_all(commands))
+
+    def get_ports(self):
+        self._watcher.refresh()
+        return self._watcher.ports
 
     def get_bauds(self):
-        if self.selected_serial:
-            standard = [9600, 19200, 38400, 57600, 115200]
-            return standard[:standard.index(self.selected_serial.baudrate) + 1]
+        """Return baud rates to offer for the selected port, the detected one first."""
+        with self._lock:
+            if not self.selected_serial:
+                return list(BAUDS)
+            detected = self.detected_bauds.get(self.selected_serial.port)
+        return ([detected] if detected else []) + sorted(baud for baud in BAUDS if baud != detected)
 
     def set_current_serial(self, port):
-        try:
-            self.selected_serial = serial.Serial(port)
-            self.selected_serial.close()
+        """Select port without opening it. Its baud rate is detected in the background."""
+        with self._lock:
+            if port not in self.ports:
+                return False
+            selected = serial.Serial()
+            selected.port = port
+            if self.detected_bauds.get(port):
+                selected.baudrate = self.detected_bauds[port]
+            self.selected_serial = selected
             self.bauds = self.get_bauds()
-            return True
-        except serial.serialutil.SerialException:
-            return False
+            detected = port in self.detected_bauds
+        if not detected:
+            self.probe(port)
+        return True
+
+    def probe(self, port):
+        """Detect the baud rate of port in the background. Ports are probed in parallel."""
+        with self._lock:
+            if port in self._probes:
+                return
+            future = self._executor.submit(probe_baud, port)
+            self._probes[port] = future
+        # runs at once if the probe is already done, so not under the lock
+        future.add_done_callback(lambda future: self._on_probe_done(port, future))
+
+    def is_probing(self, port):
+        with self._lock:
+            return port in self._probes
+
+    def _on_ports_changed(self, ports, added, removed):
+        with self._lock:
+            self.ports = ports
+            for port in removed:
+                self.detected_bauds.pop(port, None)
+            selected = self.selected_serial
+        for port in added:
+            if not (selected and selected.port == port and selected.is_open):
+                self.probe(port)
+        if self.on_ports_changed is not None:
+            self.on_ports_changed(ports)
+
+    def _on_probe_done(self, port, future):
+        baud = None if future.cancelled() or future.exception() else future.result()
+        with self._lock:
+            self._probes.pop(port, None)
+            if port not in self.ports:
+                # unplugged while probing
+                return
+            self.detected_bauds[port] = baud
+            if baud and self.selected_serial and self.selected_serial.port == port:
+                if not self.selected_serial.is_open:
+                    self.selected_serial.baudrate = baud
+                self.bauds = self.get_bauds()
+        if self.on_baud_detected is not None:
+            self.on_baud_detected(port, baud)
+
+    def open_transport(self, rx_buffer_size=128):
+        """Open the selected port and return a SerialTransport over it.
+        Call from a coroutine.
+        """
+        if not self.selected_serial:
+            return None
+        if not self.selected_serial.is_open:
+            self.selected_serial.open()
+        self.selected_serial.timeout = 0
+        return SerialTransport(self.selected_serial, rx_buffer_size)
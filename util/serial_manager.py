@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""SerialManager class.
+
+Larger rigs split their axes and cameras across several controller boards.
+SerialManager keeps a SerialTransport open to each board and routes every
+command to the boards it concerns: by camera id when one is given, otherwise
+by the axis words in the line. A move over axes on different boards is split
+into one line per board. Lines without axis words, e.g. G28 or M114, go to
+every board.
+
+All boards are sent to concurrently. A barrier waits until every board has
+finished its moves, so the commands after it start together.
+
+Boards are configured in sections named "Board <name>":
+
+    [Board arm]
+    port = /dev/ttyUSB0
+    baud = 115200
+    axes = x y z
+    cameras = 0 1
+
+A section with enabled = no is skipped.
+"""
+
+import asyncio
+import re
+
+from util.serial_transport import SerialTransport
+
+AXIS_LETTERS = 'XYZBC'
+BARRIER = None
+
+_WORD = re.compile(r'([A-Za-z])([^A-Za-z\s]*)')
+
+
+def board_sections(config):
+    """Return names of the enabled board sections of a ConfigParser."""
+    return [section for section in config.sections()
+            if section.startswith('Board ') and config.getboolean(section, 'enabled', fallback=True)]
+
+
+class SerialManager():
+    """Pool of controller boards with command routing."""
+
+    # waits until all queued moves are done before answering
+    barrier_command = 'M400'
+
+    def __init__(self):
+        self._boards = {}   # name -> SerialTransport
+        self._axes = {}     # axis letter -> board name
+        self._cameras = {}  # camid -> board name
+
+    def __len__(self):
+        return len(self._boards)
+
+    def __contains__(self, name):
+        return name in self._boards
+
+    def add_board(self, name, transport, axes=(), camids=()):
+        """Add transport as board name, driving axes and the cameras with camids."""
+        if name in self._boards:
+            raise ValueError(f'board "{name}" already exists')
+        axes = [axis.upper() for axis in axes]
+        for axis in axes:
+            if axis not in AXIS_LETTERS:
+                raise ValueError(f'unknown axis "{axis}", expected one of {", ".join(AXIS_LETTERS)}')
+            if axis in self._axes:
+                raise ValueError(f'axis {axis} is already on board "{self._axes[axis]}"')
+        for camid in camids:
+            if camid in self._cameras:
+                raise ValueError(f'camera {camid} is already on board "{self._cameras[camid]}"')
+
+        self._boards[name] = transport
+        self._axes.update(dict.fromkeys(axes, name))
+        self._cameras.update(dict.fromkeys(camids, name))
+
+    def open_boards(self, config):
+        """Open the boards configured in a ConfigParser. Call from a coroutine."""
+        for section in board_sections(config):
+            transport = SerialTransport.open(config.get(section, 'port'),
+                                             config.getint(section, 'baud', fallback=115200),
+                                             config.getint(section, 'rx_buffer_size', fallback=128))
+            self.add_board(section[len('Board '):].strip(), transport,
+                           config.get(section, 'axes', fallback='').split(),
+                           [int(camid) for camid in config.get(section, 'cameras', fallback='').split()])
+
+    def remove_board(self, name):
+        """Close board name and drop its routes."""
+        transport = self._boards.pop(name, None)
+        if transport is None:
+            return
+        transport.close()
+        self._axes = {axis: board for axis, board in self._axes.items() if board != name}
+        self._cameras = {camid: board for camid, board in self._cameras.items() if board != name}
+
+    def close(self):
+        for name in list(self._boards):
+            self.remove_board(name)
+
+    def route(self, line, camid=None):
+        """Return {board name: line} for the boards line concerns."""
+        if camid is not None:
+            if camid not in self._cameras:
+                raise ValueError(f'no board drives camera {camid}')
+            return {self._cameras[camid]: line}
+
+        words = _WORD.findall(line.split(';', 1)[0])
+        axis_words = [word for word in words if word[0].upper() in AXIS_LETTERS]
+        if not axis_words:
+            return dict.fromkeys(self._boards, line)
+
+        other_words = [word for word in words if word[0].upper() not in AXIS_LETTERS]
+        parts = {}
+        for letter, value in axis_words:
+            if letter.upper() not in self._axes:
+                raise ValueError(f'no board drives axis {letter.upper()}')
+            parts.setdefault(self._axes[letter.upper()], []).append(letter + value)
+        # command and feed rate words go with every part
+        prefix = [letter + value for letter, value in other_words]
+        return {name: ' '.join(prefix + part) for name, part in parts.items()}
+
+    async def send(self, line, camid=None, sync=False):
+        """Send line to the boards it concerns and return {board name: Response}.
+        With sync, wait for the barrier first, so every part starts together.
+        """
+        routes = self.route(line, camid)
+        if sync:
+            await self.barrier()
+        responses = await asyncio.gather(*(self._boards[name].request(part) for name, part in routes.items()))
+        return dict(zip(routes, responses))
+
+    async def send_all(self, commands):
+        """Stream commands, lines or (line, camid) tuples, to all boards at once.
+        A BARRIER in commands makes the commands after it wait until every board
+        is done with the ones before it. Return {board name: Response list}.
+        """
+        segments = [{}]
+        for command in commands:
+            if command is BARRIER:
+                segments.append({})
+                continue
+            line, camid = (command, None) if isinstance(command, str) else command
+            for name, part in self.route(line, camid).items():
+                segments[-1].setdefault(name, []).append(part)
+
+        results = {name: [] for name in self._boards}
+        for i, segment in enumerate(segments):
+            if i > 0:
+                await self.barrier()
+            names = list(segment)
+            responses = await asyncio.gather(*(self._boards[name].stream(segment[name]) for name in names))
+            for name, board_responses in zip(names, responses):
+                results[name].extend(board_responses)
+        return results
+
+    async def barrier(self):
+        """Wait until every board has finished all its moves."""
+        await asyncio.gather(*(transport.request(self.barrier_command) for transport in self._boards.values()))
+
+    @property
+    def boards(self):
+        return list(self._boards)
+
+    def get_board(self, name):
+        return self._boards.get(name)
+
+    def board_for_axis(self, axis):
+        return self._axes.get(axis.upper())
+
+    def board_for_camera(self, camid):
+        return self._cameras.get(camid)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""SerialTransport class.
+
+Asyncio transport for the motion controller. Reads and writes never block: the
+port's file descriptor is watched by the event loop, incoming bytes are split
+into lines, and every line sent is matched with the ok or error the controller
+answers it with. The controller answers lines in the order it receives them,
+so responses are matched first in, first out. Lines that are neither ok nor
+error, e.g. position reports, belong to the oldest unanswered line.
+
+Lines are sent with character counting flow control, so unanswered lines never
+overflow the controller's receive buffer.
+
+POSIX only, the port needs a file descriptor the event loop can watch.
+"""
+
+import asyncio
+import os
+import time
+
+from collections import deque
+
+
+class LineFramer():
+    """Splits a byte stream into lines."""
+
+    def __init__(self, max_length=1024):
+        self._max_length = max_length
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add data and return the complete lines in it, decoded and stripped,
+        without blank lines. A line longer than max_length is cut there.
+        """
+        self._buffer += data
+        *lines, rest = self._buffer.split(b'\n')
+        while len(rest) > self._max_length:
+            lines.append(rest[:self._max_length])
+            rest = rest[self._max_length:]
+        self._buffer = rest
+        lines = (line.decode('ascii', errors='replace').strip() for line in lines)
+        return [line for line in lines if line]
+
+    def clear(self):
+        self._buffer = bytearray()
+
+
+class Response():
+    """Controller's answer to one line."""
+
+    def __init__(self, line):
+        self.line = line
+        self.ok = False
+        self.error = None
+        self.data = []
+        self.sent_at = time.perf_counter()
+        self.latency = None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else self.error
+        return f'Response({self.line!r}, {status}, {len(self.data)} data lines, {self.latency or 0.0:.4f} s)'
+
+
+class SerialTransport():
+    """Non-blocking line transport with request/response correlation.
+    Create it from a coroutine, it runs on the running event loop.
+    """
+
+    def __init__(self, port, rx_buffer_size=128):
+        self._port = port
+        self._fd = port if isinstance(port, int) else port.fileno()
+        self._rx_buffer_size = rx_buffer_size
+        self._loop = asyncio.get_running_loop()
+        self._framer = LineFramer()
+
+        self._outgoing = bytearray()
+        # unanswered lines, oldest first, as (future, Response, byte count)
+        self._pending = deque()
+        self._buffered = 0
+        # futures of requests waiting for buffer space
+        self._waiters = deque()
+        self._closed = False
+
+        # on_message(text) for lines no request is waiting for
+        self.on_message = None
+
+        os.set_blocking(self._fd, False)
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    @classmethod
+    def open(cls, name, baudrate=115200, rx_buffer_size=128):
+        """Open serial port name and return a transport over it."""
+        import serial
+        return cls(serial.Serial(name, baudrate, timeout=0), rx_buffer_size)
+
+    async def request(self, line):
+        """Send line and return its Response once the controller answers it."""
+        return await (await self.submit(line))
+
+    async def submit(self, line):
+        """Send line once the controller has buffer space for it, and return
+        a future of its Response without waiting for the answer.
+        """
+        data = (line.strip() + '\n').encode('ascii', errors='replace')
+        if len(data) > self._rx_buffer_size:
+            raise ValueError(f'line of {len(data)} bytes does not fit the receive buffer of {self._rx_buffer_size}')
+
+        while self._pending and self._buffered + len(data) > self._rx_buffer_size:
+            self._check_open()
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self._check_open()
+
+        future = self._loop.create_future()
+        self._pending.append((future, Response(line.strip()), len(data)))
+        self._buffered += len(data)
+        self._write(data)
+        return future
+
+    async def stream(self, lines):
+        """Send lines as fast as flow control allows and return their Responses in order."""
+        futures = [await self.submit(line) for line in lines]
+        return list(await asyncio.gather(*futures))
+
+    def close(self):
+        """Stop watching the port and fail unanswered requests with ConnectionError."""
+        if self._closed:
+            return
+        self._closed = True
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        error = ConnectionError('transport closed')
+        for future, _, _ in self._pending:
+            if not future.done():
+                future.set_exception(error)
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+        self._pending.clear()
+        self._waiters.clear()
+        if not isinstance(self._port, int):
+            self._port.close()
+
+    def _check_open(self):
+        if self._closed:
+            raise ConnectionError('transport closed')
+
+    def _write(self, data):
+        self._outgoing += data
+        if len(self._outgoing) == len(data):
+            self._on_writable()
+
+    def _on_writable(self):
+        try:
+            written = os.write(self._fd, self._outgoing)
+        except BlockingIOError:
+            written = 0
+        del self._outgoing[:written]
+        if self._outgoing:
+            self._loop.add_writer(self._fd, self._on_writable)
+        else:
+            self._loop.remove_writer(self._fd)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            # e.g. the device was unplugged
+            self.close()
+            return
+        for line in self._framer.feed(data):
+            self._on_line(line)
+
+    def _on_line(self, line):
+        if not self._pending:
+            if self.on_message is not None:
+                self.on_message(line)
+            return
+
+        future, response, size = self._pending[0]
+        if line != 'ok' and not line.startswith('error'):
+            response.data.append(line)
+            return
+
+        self._pending.popleft()
+        self._buffered -= size
+        response.ok = line == 'ok'
+        if not response.ok:
+            response.error = line
+        response.latency = time.perf_counter() - response.sent_at
+        if not future.done():
+            future.set_result(response)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @property
+    def rx_buffer_size(self):
+        return self._rx_buffer_size
+
+    @property
+    def buffered(self):
+        """Bytes sent and not answered yet."""
+        return self._buffered
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    @property
+    def closed(self):
+        return self._closed
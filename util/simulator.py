@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Simulator class.
+
+Plays the paths of all cameras on a simulated clock that advances in fixed
+timesteps, independent of how often the canvas renders. Pose timing comes from
+util.kinematics: a camera arrives at each pose of its path, dwells there, then
+moves on to the next.
+
+Every camera's timeline is a list of knots, two per pose at its arrival and
+departure time. The knots of all cameras are laid end to end in one sorted array,
+each camera offset past the end of the one before, so one searchsorted finds the
+current segment of every camera at once.
+"""
+
+import numpy as np
+
+from util.kinematics import Kinematics
+
+
+class Simulator():
+    """Fixed timestep playback of camera paths with speed, pause and seek."""
+
+    def __init__(self, kinematics=None, timestep=1.0 / 120.0):
+        self._kinematics = kinematics or Kinematics()
+        self._timestep = timestep
+        self._speed = 1.0
+        self._time = 0.0
+        self._accumulator = 0.0
+        self._playing = False
+        self._duration = 0.0
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._knot_times = np.zeros(0)
+        self._knot_poses = np.zeros((0, 5))
+        self._offsets = np.zeros(0)
+        self._durations = np.zeros(0)
+        self._first = np.zeros(0, dtype=np.int64)
+        self._last = np.zeros(0, dtype=np.int64)
+        self.on_update = None
+
+    def load(self, path3d_list, camids):
+        """Build the timeline from Path3D objects, for cameras with the given
+        camids, in camera pose array order. Poses of each camera are taken
+        from every path in list order. Cameras without poses do not move.
+        """
+        indices, times, poses, durations = [], [], [], []
+        for index, camid in enumerate(camids):
+            cam_poses = [path3d.poses[path3d.flags['camid'] == camid] for path3d in path3d_list]
+            cam_dwell = [path3d.flags['dwell'][path3d.flags['camid'] == camid] for path3d in path3d_list]
+            cam_poses = np.concatenate(cam_poses) if cam_poses else np.zeros((0, 5))
+            if len(cam_poses) == 0:
+                continue
+
+            arrive, leave = self._kinematics.schedule(cam_poses, np.concatenate(cam_dwell))
+            indices.append(index)
+            times.append(np.column_stack([arrive, leave]).ravel())
+            poses.append(np.repeat(cam_poses, 2, axis=0))
+            durations.append(leave[-1])
+
+        self._indices = np.asarray(indices, dtype=np.int64)
+        self._durations = np.asarray(durations, dtype=np.float64)
+        self._duration = float(self._durations.max()) if len(durations) else 0.0
+
+        lengths = np.array([len(t) for t in times], dtype=np.int64)
+        self._last = np.cumsum(lengths) - 1
+        self._first = self._last - lengths + 1
+        # keep every camera's knots after the last knot of the camera before
+        spans = self._durations + 1.0
+        self._offsets = np.concatenate([[0.0], np.cumsum(spans)[:-1]]) if len(spans) else np.zeros(0)
+        self._knot_times = np.concatenate([t + offset for t, offset in zip(times, self._offsets)]) \
+            if times else np.zeros(0)
+        self._knot_poses = np.concatenate(poses).astype(np.float64) if poses else np.zeros((0, 5))
+
+        self._playing = False
+        self.seek(0.0)
+
+    def evaluate(self, t):
+        """Return (indices, poses) of the cameras with paths at time t, as
+        camera pose array indices and (n, 5) poses. For an array of times,
+        poses have shape t.shape + (n, 5).
+        """
+        if len(self._indices) == 0:
+            return self._indices, self._knot_poses
+
+        t = np.asarray(t, dtype=np.float64)[..., None]
+        local = np.minimum(t, self._durations) + self._offsets
+        knot = np.searchsorted(self._knot_times, local, side='right') - 1
+        knot = np.clip(knot, self._first, np.maximum(self._last - 1, self._first))
+        after = np.minimum(knot + 1, self._last)
+
+        t0, t1 = self._knot_times[knot], self._knot_times[after]
+        span = t1 - t0
+        u = np.clip(np.divide(local - t0, span, out=np.zeros_like(span), where=span > 0), 0.0, 1.0)
+        # every move starts and ends at rest
+        u = u * u * (3.0 - 2.0 * u)
+
+        p0, p1 = self._knot_poses[knot], self._knot_poses[after]
+        return self._indices, p0 + u[..., None] * (p1 - p0)
+
+    def advance(self, elapsed):
+        """Advance the clock by elapsed real seconds, scaled by speed, in whole
+        timesteps. Return True if the simulated time changed.
+        """
+        if not self._playing:
+            return False
+
+        self._accumulator += elapsed * self._speed
+        steps = int(self._accumulator / self._timestep)
+        if steps == 0:
+            return False
+
+        self._accumulator -= steps * self._timestep
+        self._time = min(self._time + steps * self._timestep, self._duration)
+        if self._time >= self._duration:
+            self._playing = False
+        self._update()
+        return True
+
+    def play(self):
+        if self._time >= self._duration:
+            self.seek(0.0)
+        self._accumulator = 0.0
+        self._playing = self._duration > 0.0
+
+    def pause(self):
+        self._playing = False
+
+    def stop(self):
+        """Pause and rewind to the start."""
+        self._playing = False
+        self.seek(0.0)
+
+    def seek(self, t):
+        """Jump to time t in seconds, e.g. when scrubbing."""
+        self._time = min(max(0.0, t), self._duration)
+        self._accumulator = 0.0
+        self._update()
+
+    def _update(self):
+        if self.on_update is not None and len(self._indices):
+            self.on_update(*self.evaluate(self._time))
+
+    @property
+    def time(self):
+        return self._time
+
+    @property
+    def duration(self):
+        return self._duration
+
+    @property
+    def playing(self):
+        return self._playing
+
+    @property
+    def speed(self):
+        return self._speed
+
+    @speed.setter
+    def speed(self, value):
+        self._speed = value
+
+    @property
+    def timestep(self):
+        return self._timestep
+
+    @timestep.setter
+    def timestep(self, value):
+        self._timestep = value
+
+    @property
+    def kinematics(self):
+        return self._kinematics
+
+    @kinematics.setter
+    def kinematics(self, value):
+        self._kinematics = value
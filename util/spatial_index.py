@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""GridIndex class.
+
+Uniform grid over 3D points for radius, box and nearest queries. Points are
+bucketed by cell, so moving a point only touches its old and new cells, and a
+query only visits the cells it overlaps.
+"""
+
+import math
+import numpy as np
+
+
+class GridIndex():
+    """Incremental uniform grid of keyed 3D points."""
+
+    def __init__(self, cell_size=50.0):
+        self._cell_size = float(cell_size)
+        self._cells = {}   # cell -> {key: point}
+        self._keys = {}    # key -> cell
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def _cell(self, point):
+        s = self._cell_size
+        return (math.floor(point[0] / s), math.floor(point[1] / s), math.floor(point[2] / s))
+
+    def insert(self, key, point):
+        """Insert or move the point of key."""
+        point = (float(point[0]), float(point[1]), float(point[2]))
+        cell = self._cell(point)
+        old = self._keys.get(key)
+        if old is not None and old != cell:
+            self._discard(key, old)
+        self._cells.setdefault(cell, {})[key] = point
+        self._keys[key] = cell
+
+    def insert_many(self, keys, points):
+        """Insert or move the points of keys, (n, 3) points at once."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        cells = np.floor(points / self._cell_size).astype(np.int64)
+        for key, cell, point in zip(keys, map(tuple, cells.tolist()), map(tuple, points.tolist())):
+            old = self._keys.get(key)
+            if old is not None and old != cell:
+                self._discard(key, old)
+            self._cells.setdefault(cell, {})[key] = point
+            self._keys[key] = cell
+
+    def remove(self, key):
+        cell = self._keys.pop(key, None)
+        if cell is not None:
+            self._discard(key, cell)
+
+    def remove_many(self, keys):
+        for key in keys:
+            self.remove(key)
+
+    def clear(self):
+        self._cells = {}
+        self._keys = {}
+
+    def _discard(self, key, cell):
+        bucket = self._cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+
+    def position(self, key):
+        return self._cells[self._keys[key]][key]
+
+    def query_box(self, lo, hi):
+        """Return keys of points inside the box between corners lo and hi."""
+        lo, hi = np.minimum(lo, hi), np.maximum(lo, hi)
+        keys, points = self._candidates(lo, hi)
+        if not keys:
+            return []
+        inside = np.all((points >= lo) & (points <= hi), axis=1)
+        return [keys[i] for i in np.flatnonzero(inside)]
+
+    def query_radius(self, center, radius):
+        """Return keys of points within radius of center."""
+        center = np.asarray(center, dtype=np.float64)
+        keys, points = self._candidates(center - radius, center + radius)
+        if not keys:
+            return []
+        inside = np.sum((points - center) ** 2, axis=1) <= radius * radius
+        return [keys[i] for i in np.flatnonzero(inside)]
+
+    def nearest(self, point, max_radius=None):
+        """Return (key, distance) of the point closest to point, or (None, inf)
+        if none is within max_radius.
+        """
+        if not self._keys:
+            return None, math.inf
+
+        point = np.asarray(point, dtype=np.float64)
+        radius = self._cell_size
+        while True:
+            if max_radius is not None:
+                radius = min(radius, max_radius)
+            keys, points = self._candidates(point - radius, point + radius)
+            if keys:
+                distance = np.sqrt(np.sum((points - point) ** 2, axis=1))
+                best = int(np.argmin(distance))
+                # every point within radius is a candidate, so the closest of them is the closest of all
+                if distance[best] <= radius or len(keys) == len(self._keys):
+                    if max_radius is not None and distance[best] > max_radius:
+                        return None, math.inf
+                    return keys[best], float(distance[best])
+                next_radius = float(distance[best])
+            else:
+                next_radius = 2.0 * radius
+            if max_radius is not None and radius >= max_radius:
+                return None, math.inf
+            radius = next_radius
+
+    def _candidates(self, lo, hi):
+        """Return keys and (n, 3) points of all cells overlapping the box between lo and hi."""
+        c0, c1 = self._cell(lo), self._cell(hi)
+        count = (c1[0] - c0[0] + 1) * (c1[1] - c0[1] + 1) * (c1[2] - c0[2] + 1)
+        if count <= len(self._cells):
+            buckets = (self._cells.get((i, j, k))
+                       for i in range(c0[0], c1[0] + 1)
+                       for j in range(c0[1], c1[1] + 1)
+                       for k in range(c0[2], c1[2] + 1))
+        else:
+            # the box spans more cells than are occupied
+            buckets = (bucket for cell, bucket in self._cells.items()
+                       if all(c0[a] <= cell[a] <= c1[a] for a in range(3)))
+
+        keys, points = [], []
+        for bucket in buckets:
+            if bucket:
+                keys.extend(bucket.keys())
+                points.extend(bucket.values())
+        return keys, np.array(points, dtype=np.float64).reshape(-1, 3)
+
+    @property
+    def cell_size(self):
+        return self._cell_size
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""TelemetryBuffer and TelemetryReader classes.
+
+TelemetryReader reads position and status reports from the motion controller
+on its own thread and writes them into a TelemetryBuffer. The buffer is a
+fixed-size ring of timestamped x, y, z, b, c positions in preallocated NumPy
+arrays, and it also keeps the latest position of every camera. The UI thread
+only copies the latest positions out, it never parses.
+
+Two report formats are understood:
+
+    ID:1 X:10.000 Y:20.000 Z:30.000 B:0.000 C:90.000
+    <Run|MPos:10.000,20.000,30.000|FS:500,0>
+
+Reports without ID are for camera 0. Axes missing from a report keep their
+last reported value.
+"""
+
+import re
+import threading
+import time
+
+import numpy as np
+
+from enums import CamAxis
+from util.serial_transport import LineFramer
+
+AXES = tuple(CamAxis)[:5]
+STATUSES = ('unknown', 'idle', 'run', 'hold', 'jog', 'home', 'alarm')
+
+_FIELD = re.compile(r'([A-Za-z]+):\s*(-?\d+(?:\.\d*)?)')
+_STATUS = re.compile(r'<(\w+)')
+_MPOS = re.compile(r'MPos:([-\d.,]+)')
+_AXIS_INDEX = {axis.value.upper(): i for i, axis in enumerate(AXES)}
+_STATUS_INDEX = {status: i for i, status in enumerate(STATUSES)}
+_NAN = float('nan')
+
+
+class TelemetryBuffer():
+    """Fixed-size ring of timestamped camera positions."""
+
+    def __init__(self, capacity=4096, max_cameras=64):
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._times = np.zeros(capacity)
+        self._camids = np.zeros(capacity, dtype=np.int32)
+        self._positions = np.zeros((capacity, len(AXES)))
+        self._statuses = np.zeros(capacity, dtype=np.int8)
+        self._count = 0
+
+        self._latest = np.full((max_cameras, len(AXES)), np.nan)
+        # count of reports written when the camera last reported
+        self._latest_count = np.zeros(max_cameras, dtype=np.int64)
+        self._latest_status = np.zeros(max_cameras, dtype=np.int8)
+
+    def __len__(self):
+        return min(self._count, self._capacity)
+
+    def append(self, timestamp, camid, values, status=0):
+        """Write a report. values are 5 x, y, z, b, c floats, NaN for axes not reported."""
+        latest = self._latest[camid]
+        with self._lock:
+            i = self._count % self._capacity
+            row = self._positions[i]
+            for k in range(len(AXES)):
+                value = values[k]
+                # NaN != NaN
+                row[k] = value if value == value else latest[k]
+            latest[:] = row
+            self._times[i] = timestamp
+            self._camids[i] = camid
+            self._statuses[i] = status
+            self._count += 1
+            self._latest_count[camid] = self._count
+            self._latest_status[camid] = status
+
+    def read_latest(self, out, since=0):
+        """Copy latest positions into (max_cameras, 5) out, NaN for cameras
+        never reported. Return the report count so far and a mask of the cameras
+        reported after count since.
+        """
+        with self._lock:
+            np.copyto(out, self._latest)
+            return self._count, self._latest_count > since
+
+    def samples(self, count=None):
+        """Return copies of the last count reports, oldest first, as
+        times, camids, (n, 5) positions and statuses.
+        """
+        with self._lock:
+            n = len(self) if count is None else min(count, len(self))
+            indices = np.arange(self._count - n, self._count) % self._capacity
+            return (self._times[indices], self._camids[indices],
+                    self._positions[indices], self._statuses[indices])
+
+    def status(self, camid):
+        return STATUSES[self._latest_status[camid]]
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+            self._latest.fill(np.nan)
+            self._latest_count.fill(0)
+            self._latest_status.fill(0)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def max_cameras(self):
+        return len(self._latest)
+
+    @property
+    def count(self):
+        """Reports written since creation or the last clear."""
+        return self._count
+
+
+class TelemetryReader():
+    """Reads controller reports into a TelemetryBuffer on a background thread."""
+
+    # seconds to wait for a line before checking for stop and pause again
+    read_timeout = 0.01
+    # seconds to wait for the answer to a poll before polling again
+    poll_timeout = 2.0
+
+    def __init__(self, port, buffer, poll_command=None, poll_interval=0.05):
+        self._port = port
+        self._buffer = buffer
+        self._poll_command = poll_command
+        self._poll_interval = poll_interval
+
+        # scratch report, reused for every line
+        self._values = [_NAN] * len(AXES)
+        self._feed_lock = threading.Lock()
+        self._reports = 0
+
+        self._thread = None
+        self._running = False
+        self._resume = threading.Event()
+        self._resume.set()
+        # held while the thread uses the port
+        self._io_lock = threading.Lock()
+        # lines are framed across reads, a read may end mid line
+        self._framer = LineFramer()
+        # polls whose ok or error has not arrived yet
+        self._unanswered = 0
+
+        # on_line(text) for lines that are not reports
+        self.on_line = None
+
+    def start(self):
+        if self._running:
+            return
+        if self._thread is not None:
+            self._thread.join()
+        self._running = True
+        self._resume.set()
+        self._unanswered = 0
+        self._framer.clear()
+        self._thread = threading.Thread(target=self._run, name='TelemetryReader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._resume.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def pause(self):
+        """Stop using the port, e.g. while a GcodeSender streams on it.
+        Returns once the thread has let go of the port, within about
+        read_timeout, even while a poll waits for its answer.
+        """
+        self._resume.clear()
+        with self._io_lock:
+            # the rest of a partial line goes to whoever reads the port next
+            self._framer.clear()
+
+    def resume(self):
+        # the port had another user, an answer still due went to it
+        self._unanswered = 0
+        self._resume.set()
+
+    def _run(self):
+        port = self._port
+        old_timeout = port.timeout
+        port.timeout = self.read_timeout
+        next_poll = 0.0
+        while self._running:
+            if not self._resume.wait(0.1):
+                continue
+            poll = self._poll_command is not None
+            if poll:
+                # between polls, unsolicited lines wait in the port's buffer
+                time.sleep(max(0.0, next_poll - time.perf_counter()))
+            with self._io_lock:
+                if not self._resume.is_set() or not self._running:
+                    continue
+                if poll:
+                    next_poll = time.perf_counter() + self._poll_interval
+                try:
+                    lines = self._read(port, poll)
+                except (OSError, ValueError):
+                    # port closed or unplugged
+                    self._running = False
+                    break
+            for text in lines:
+                if not self.feed(text) and self.on_line is not None:
+                    self.on_line(text)
+        try:
+            port.timeout = old_timeout
+        except (OSError, ValueError):
+            pass
+
+    def _read(self, port, poll):
+        """Return complete lines read from port. When polling, read until the
+        answer to the poll command arrives, so no ok is left for whoever uses
+        the port next, unless pause interrupts the wait. A poll unanswered
+        after poll_timeout is not repeated until its answer turns up.
+        """
+        if not poll:
+            return self._framer.feed(port.read(port.in_waiting or 1))
+
+        if self._unanswered == 0:
+            port.write((self._poll_command + '\n').encode('ascii'))
+            self._unanswered = 1
+        lines = []
+        deadline = time.perf_counter() + self.poll_timeout
+        while self._unanswered and self._running and self._resume.is_set() \
+                and time.perf_counter() < deadline:
+            for text in self._framer.feed(port.read(port.in_waiting or 1)):
+                if text == 'ok' or text.startswith('error'):
+                    self._unanswered = 0
+                else:
+                    lines.append(text)
+        return lines
+
+    def feed(self, line):
+        """Parse line and write it to the buffer if it is a report. Return
+        whether it was one. Safe to call from any thread, e.g. from a
+        GcodeSender response callback.
+        """
+        with self._feed_lock:
+            return self._feed(line)
+
+    def _feed(self, line):
+        values = self._values
+        for k in range(len(values)):
+            values[k] = _NAN
+        camid = 0
+        status = 0
+
+        found = False
+        mpos = _MPOS.search(line)
+        if mpos is not None:
+            try:
+                for k, value in enumerate(mpos.group(1).split(',')[:len(values)]):
+                    values[k] = float(value)
+            except ValueError:
+                return False
+            found = True
+        # Marlin appends stepper counts after Count
+        for name, value in _FIELD.findall(line.split('Count', 1)[0]):
+            name = name.upper()
+            if name in _AXIS_INDEX:
+                values[_AXIS_INDEX[name]] = float(value)
+                found = True
+            elif name == 'ID':
+                camid = int(float(value))
+        if not found or not 0 <= camid < self._buffer.max_cameras:
+            return False
+
+        match = _STATUS.match(line)
+        if match is not None:
+            status = _STATUS_INDEX.get(match.group(1).lower(), 0)
+        self._buffer.append(time.perf_counter(), camid, values, status)
+        self._reports += 1
+        return True
+
+    @property
+    def buffer(self):
+        return self._buffer
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    @property
+    def reports(self):
+        """Reports parsed so far."""
+        return self._reports
+
+    @property
+    def poll_command(self):
+        return self._poll_command
+
+    @poll_command.setter
+    def poll_command(self, value):
+        self._poll_command = value
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""VirtualController class.
+
+Stand-in for the motion controller on a pseudo-terminal, for testing and
+benchmarking without hardware. Open port_name like any serial port. Every line
+is answered with ok, or with error for malformed G-code, after latency seconds.
+G0/G1 moves update the position, and M114 reports it before the ok.
+
+The controller holds at most rx_buffer_size bytes of unanswered lines, like the
+real one. Bytes beyond that are dropped and counted in overflows, so a sender
+that ignores flow control shows up.
+
+Linux and macOS only.
+"""
+
+import os
+import re
+import select
+import threading
+import time
+import tty
+
+_WORD = re.compile(r'([A-Z])([^A-Z\s]*)')
+
+
+class VirtualController():
+    """G-code controller emulated on a pseudo-terminal."""
+
+    def __init__(self, latency=0.001, rx_buffer_size=128):
+        self._latency = latency
+        self._rx_buffer_size = rx_buffer_size
+        self._position = dict.fromkeys('XYZBC', 0.0)
+
+        self._master = None
+        self._slave = None
+        self._port_name = None
+        self._thread = None
+        self._running = False
+        self._lines = 0
+        self._overflows = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Open the pseudo-terminal and start answering on it."""
+        if self._thread is not None:
+            return
+        import pty
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self._port_name = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='VirtualController', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _run(self):
+        rx = bytearray()
+        # time the line at the front of rx is answered
+        ready = None
+        while self._running:
+            timeout = 0.05 if ready is None else max(0.0, ready - time.perf_counter())
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self._master, 4096)
+                except OSError:
+                    # the other side closed the port
+                    data = b''
+                room = self._rx_buffer_size - len(rx)
+                if len(data) > room:
+                    self._overflows += len(data) - room
+                    data = data[:room]
+                rx += data
+
+            if ready is None and b'\n' in rx:
+                ready = time.perf_counter() + self._latency
+            # answer every line that is due
+            while ready is not None and time.perf_counter() >= ready:
+                line, _, rest = rx.partition(b'\n')
+                rx = bytearray(rest)
+                self._lines += 1
+                self._write(self._execute(line.decode('ascii', errors='replace').strip().upper()))
+                ready = ready + self._latency if b'\n' in rx else None
+
+    def _write(self, text):
+        data = (text + '\n').encode('ascii')
+        while data:
+            written = os.write(self._master, data)
+            data = data[written:]
+
+    def _execute(self, line):
+        """Run line and return the response text."""
+        words = _WORD.findall(line)
+        if not words:
+            return 'ok'
+        try:
+            values = {letter: float(value) for letter, value in words[1:]}
+        except ValueError:
+            return f'error: bad number in {line}'
+
+        command = ''.join(words[0])
+        if command in ('G0', 'G1', 'G00', 'G01'):
+            for axis in self._position:
+                if axis in values:
+                    self._position[axis] = values[axis]
+        elif command == 'M114':
+            return ' '.join(f'{axis}:{value:.3f}' for axis, value in self._position.items()) + '\nok'
+        return 'ok'
+
+    @property
+    def port_name(self):
+        return self._port_name
+
+    @property
+    def latency(self):
+        return self._latency
+
+    @latency.setter
+    def latency(self, value):
+        self._latency = value
+
+    @property
+    def rx_buffer_size(self):
+        return self._rx_buffer_size
+
+    @property
+    def position(self):
+        return dict(self._position)
+
+    @property
+    def lines(self):
+        """Lines answered so far."""
+        return self._lines
+
+    @property
+    def overflows(self):
+        """Bytes dropped because the receive buffer was full."""
+        return self._overflows
+
+
+if __name__ == '__main__':
+    import asyncio
+    from util.serial_transport import SerialTransport
+
+    async def benchmark(port_name, count):
+        transport = SerialTransport.open(port_name)
+        lines = [f'G1 X{i % 100} Y{i % 50} Z{i % 25}' for i in range(count)]
+        start = time.perf_counter()
+        responses = await transport.stream(lines)
+        elapsed = time.perf_counter() - start
+        report = await transport.request('M114')
+        transport.close()
+        return elapsed, sum(not r.ok for r in responses), report.data
+
+    for latency in (0.0, 0.0005, 0.002):
+        with VirtualController(latency=latency) as controller:
+            count = 2000
+            elapsed, errors, report = asyncio.run(benchmark(controller.port_name, count))
+            print(f'latency {latency * 1000:4.1f} ms: {count / elapsed:8.0f} lines/s, '
+                  f'{errors} errors, {controller.overflows} bytes overflowed, {report[0]}')